@@ -0,0 +1,161 @@
+import hashlib
+import random
+import time
+from collections import OrderedDict
+from enum import Enum, auto
+
+from llm_prompt.verdict_cache import normalize_text
+
+
+class BackpressurePolicy(Enum):
+    SAMPLE = auto()       # classify a random fraction of the over-limit messages with the LLM, the rest locally
+    DEFER = auto()        # park over-limit messages and classify them with the LLM once there is capacity again
+    LOCAL_ONLY = auto()   # classify over-limit messages with the local pre-filter only
+
+
+class AdmissionDecision(Enum):
+    ADMIT = auto()        # classify with the LLM now
+    DUPLICATE = auto()    # same author repeated the same message within the de-duplication window, classify locally
+    SKIP = auto()         # over the limit and not sampled, classify locally
+    DEFER = auto()        # over the limit, classify later
+    LOCAL_ONLY = auto()   # over the limit, classify locally
+
+
+class RateBucket:
+    """
+    Non-blocking token bucket: holds up to `burst` tokens and refills at `rate_per_minute`.
+    """
+    __slots__ = ("rate", "burst", "tokens", "updated_at")
+
+    def __init__(self, rate_per_minute: float, burst: float):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def available(self, now: float) -> float:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        return self.tokens
+
+
+class AdmissionController:
+    """
+    Decides which channel messages may be sent to the LLM, so a single flooding user (or a busy guild) can't
+    use up the whole classification quota.
+
+    Every message needs a token from its author's bucket and from its guild's bucket. Repeats of the same
+    message by the same author within `dedup_window` of its first sighting are not sent to the LLM again.
+    Messages over the limit are handled according to `policy`.
+    """
+
+    def __init__(self, user_rate_per_minute: float = 10, user_burst: float = 5, guild_rate_per_minute: float = 120,
+                 guild_burst: float = 30, policy: BackpressurePolicy = BackpressurePolicy.LOCAL_ONLY,
+                 sample_rate: float = 0.1, dedup_window: float = 60.0, max_tracked: int = 10000):
+        """
+        Args:
+            user_rate_per_minute (float): Sustained LLM classifications per author and guild per minute.
+            user_burst (float): Messages an author may send at once before being limited.
+            guild_rate_per_minute (float): Sustained LLM classifications per guild per minute.
+            guild_burst (float): Burst allowance of a guild.
+            policy (BackpressurePolicy): What to do with messages over the limit.
+            sample_rate (float): With `BackpressurePolicy.SAMPLE`, fraction of over-limit messages still sent to the LLM.
+            dedup_window (float): Seconds after a message is first seen during which the same author repeating it
+                                  is a duplicate. Repeats don't extend the window, so a message reposted
+                                  periodically is still sent to the LLM once per window.
+            max_tracked (int): Maximum number of buckets and de-duplication entries each; least recently used are evicted.
+        """
+        self.user_rate_per_minute = user_rate_per_minute
+        self.user_burst = user_burst
+        self.guild_rate_per_minute = guild_rate_per_minute
+        self.guild_burst = guild_burst
+        self.policy = policy
+        self.sample_rate = sample_rate
+        self.dedup_window = dedup_window
+        self.max_tracked = max_tracked
+
+        self.user_buckets = OrderedDict()   # (guild id, author id) -> RateBucket
+        self.guild_buckets = OrderedDict()  # guild id -> RateBucket
+        self.recent = OrderedDict()         # (guild id, author id, content digest) -> start of its de-duplication window
+
+        # counters
+        self.admitted = 0
+        self.duplicates = 0
+        self.user_limited = 0
+        self.guild_limited = 0
+        self.over_limit = {decision: 0 for decision in (AdmissionDecision.SKIP, AdmissionDecision.DEFER,
+                                                        AdmissionDecision.LOCAL_ONLY)}
+
+    def admit(self, guild_id: int, author_id: int, text: str) -> AdmissionDecision:
+        now = time.monotonic()
+
+        if self._is_duplicate((guild_id, author_id, self._digest(text)), now):
+            self.duplicates += 1
+            return AdmissionDecision.DUPLICATE
+
+        user_bucket = self._bucket(self.user_buckets, (guild_id, author_id), self.user_rate_per_minute, self.user_burst)
+        guild_bucket = self._bucket(self.guild_buckets, guild_id, self.guild_rate_per_minute, self.guild_burst)
+
+        # Only take tokens once both buckets agree, so a limited user doesn't drain the guild's budget
+        if user_bucket.available(now) < 1:
+            self.user_limited += 1
+            return self._over_limit()
+        if guild_bucket.available(now) < 1:
+            self.guild_limited += 1
+            return self._over_limit()
+
+        user_bucket.tokens -= 1
+        guild_bucket.tokens -= 1
+        self.admitted += 1
+        return AdmissionDecision.ADMIT
+
+    def stats(self) -> dict:
+        return {
+            "policy": self.policy.name,
+            "admitted": self.admitted,
+            "duplicates": self.duplicates,
+            "user_limited": self.user_limited,
+            "guild_limited": self.guild_limited,
+            "skipped": self.over_limit[AdmissionDecision.SKIP],
+            "deferred": self.over_limit[AdmissionDecision.DEFER],
+            "local_only": self.over_limit[AdmissionDecision.LOCAL_ONLY],
+        }
+
+    def _over_limit(self) -> AdmissionDecision:
+        if self.policy == BackpressurePolicy.SAMPLE:
+            if random.random() < self.sample_rate:
+                self.admitted += 1
+                return AdmissionDecision.ADMIT
+            decision = AdmissionDecision.SKIP
+        elif self.policy == BackpressurePolicy.DEFER:
+            decision = AdmissionDecision.DEFER
+        else:
+            decision = AdmissionDecision.LOCAL_ONLY
+        self.over_limit[decision] += 1
+        return decision
+
+    def _is_duplicate(self, key, now: float) -> bool:
+        first_seen = self.recent.get(key)
+        if first_seen is not None and now - first_seen < self.dedup_window:
+            self.recent.move_to_end(key)
+            return True
+        self.recent[key] = now
+        self.recent.move_to_end(key)
+        if len(self.recent) > self.max_tracked:
+            self.recent.popitem(last=False)
+        return False
+
+    def _bucket(self, buckets: OrderedDict, key, rate_per_minute: float, burst: float) -> RateBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = RateBucket(rate_per_minute, burst)
+            buckets[key] = bucket
+            if len(buckets) > self.max_tracked:
+                buckets.popitem(last=False)
+        else:
+            buckets.move_to_end(key)
+        return bucket
+
+    @staticmethod
+    def _digest(text: str) -> bytes:
+        return hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=16).digest()
@@ -5,21 +5,38 @@ import os
 import json
 import logging
 import re
+import asyncio
 import requests
+from collections import deque
 from report import Report
 from modReview import ModReview
+from classification_pool import ClassificationPool
+from prefilter import PreFilter, PreFilterDecision
+from entity_matcher import EntityMatcher, is_valid_organization_name
+from near_duplicates import NearDuplicateIndex
+from review_queue import ReviewQueue
+from report_coalescer import ReportCoalescer, report_keys
+from queue_store import QueueStore
+from session_store import SessionStore
+from message_resolver import MessageResolver
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from admission_control import AdmissionController, AdmissionDecision, BackpressurePolicy
+from metrics import MetricsServer, registry, observe_latency, DEFAULT_TOKEN_BUCKETS
+from log_setup import setup_logging, MESSAGE_LOGGER
 import pdb
 
-from llm_prompt.prompt_claude import start_client, prompt_claude
+from llm_prompt.prompt_claude import start_client, start_async_client, close_clients, usage_stats, DEFAULT_TEMPERATURE
+from llm_prompt.verdict_cache import VerdictCache, prompt_fingerprint
+from llm_prompt.batch_classifier import BatchClassifier
+from llm_prompt.model_cascade import default_cascade
+from llm_prompt.verdict import Verdict, parse_verdict
 import llm_prompt.constants as constants
 
 
-# Set up logging to the console
-logger = logging.getLogger('discord')
-logger.setLevel(logging.DEBUG)
-handler = logging.FileHandler(filename='discord.log', encoding='utf-8', mode='w')
-handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
-logger.addHandler(handler)
+# JSON lines written to a rotating file by a background thread, see `log_setup.py`
+log_listener = setup_logging('discord.log', max_bytes=10 * 1024 * 1024, backup_count=5, message_sample_rate=0.05)
+logger = logging.getLogger('modbot')
+message_logger = logging.getLogger(MESSAGE_LOGGER)
 
 # There should be a file called 'tokens.json' inside the same folder as this file
 token_path = 'tokens.json'
@@ -30,6 +47,31 @@ with open(token_path) as f:
     tokens = json.load(f)
     discord_token = tokens['discord']
 
+# Optional labelled dataset (same format as `DataProcessor`) used to train the local pre-filter model
+prefilter_dataset_path = 'prefilter_dataset.txt'
+
+# Write-ahead log of the review queues and open report/review sessions
+queue_store_path = 'review_queue.wal'
+
+# Messages classified locally while the LLM circuit is open, or deferred by admission control,
+# waiting to be classified by the LLM
+retry_queue_size = 5000
+retry_interval = 15.0   # seconds between attempts to drain the retry queue
+retry_batch_size = 32   # messages resubmitted per attempt, so a drained backlog doesn't burst past the rate limits
+
+# Report and review sessions abandoned half-way are dropped after `session_idle_timeout` seconds
+session_idle_timeout = 30 * 60
+session_max = 10000      # per kind; least recently used sessions are dropped beyond this
+session_tick = 30.0      # seconds between sweeps of idle sessions
+
+# How each verdict source is shown to moderators
+CLASSIFIED_BY = {"local": "local fallback", "prefilter": "local pre-filter",
+                 "near_duplicate": "near-duplicate of an earlier message"}
+
+# Prometheus-style metrics at http://<metrics_host>:<metrics_port>/metrics
+metrics_host = '127.0.0.1'
+metrics_port = 9108
+
 
 class ModBot(discord.Client):
     def __init__(self): 
@@ -38,12 +80,179 @@ class ModBot(discord.Client):
         super().__init__(command_prefix='.', intents=intents)
         self.group_num = None
         self.mod_channels = {} # Map from guild to the mod channel id for that guild
-        self.reports = {} # Map from user IDs to the state of their report
-        self.reviews = {} 
 
-        self.to_be_reviewed = []
-        self.to_be_reviewed_automated = []
+        # Pending reports and in-flight sessions are journaled so a restart doesn't lose the backlog
+        self.queue_store = QueueStore(queue_store_path, flush_interval=0.5)
+
+        # Map from user IDs to the state of their report / review
+        self.reports = SessionStore("report", idle_timeout=session_idle_timeout, max_sessions=session_max,
+                                    tick=session_tick, store=self.queue_store)
+        self.reviews = SessionStore("review", idle_timeout=session_idle_timeout, max_sessions=session_max,
+                                    tick=session_tick, store=self.queue_store,
+                                    on_evict=lambda author_id, review, reason: review.abandon())
+        self.session_task = None
+
+        # Messages linked from reports; a viral post reported many times is only fetched once
+        self.message_resolver = MessageResolver(self, max_entries=2048, ttl=300.0)
+
+        # Urgent reports and active threats are reviewed first, FIFO within the same priority
+        self.to_be_reviewed = ReviewQueue("User reports", store=self.queue_store, key_fn=report_keys)
+        self.to_be_reviewed_automated = ReviewQueue("Automated reports", store=self.queue_store, key_fn=report_keys)
+        # Duplicate reports of the same message or content become a single review item
+        self.report_coalescer = ReportCoalescer(self.to_be_reviewed, self.to_be_reviewed_automated)
+        # Shared, connection-pooled client; ModReview sessions reach Claude through it as well
         self.claudeClient = start_client()
+        # Channel classification runs behind `llm_breaker`, which counts each failure and bounds each call; SDK
+        # retries underneath it would hide failures from the breaker and stretch a call past its timeout
+        self.classifierAsyncClient = start_async_client(max_retries=0)
+
+        # Cheap local stage that keeps obviously benign chatter away from Claude
+        self.prefilter = PreFilter(benign_threshold=0.1)
+        if os.path.isfile(prefilter_dataset_path):
+            try:
+                self.prefilter.fit_file(prefilter_dataset_path)
+            except ImportError as e:
+                logger.warning("Pre-filter model not trained, falling back to the lexicon only: %s", e)
+
+        # Known organization names (from user reports) and recruitment phrases, matched in one pass per message
+        self.entity_matcher = EntityMatcher()
+
+        # Verdicts for reposted content are served from cache instead of asking Claude again
+        self.verdict_cache = VerdictCache(max_entries=10000, ttl=24 * 60 * 60, db_path='verdict_cache.db')
+
+        # Lightly edited reposts reuse the verdict of the original and are reviewed together with it
+        self.near_duplicates = NearDuplicateIndex(num_bins=64, bands=16, shingle_size=5, threshold=0.8,
+                                                  max_entries=20000, ttl=24 * 60 * 60)
+
+        # A fast model classifies first; only positive or low-confidence verdicts escalate to the large model
+        self.model_cascade = default_cascade(escalation_threshold=0.8)
+        self.classification_fingerprint = prompt_fingerprint(constants.DEFAULT_MOD_CONTEXT, constants.DEFAULT_CLASSIFICATION_PREP,
+                                                             self.model_cascade.name(), DEFAULT_TEMPERATURE)
+
+        # Channel messages are packed into micro-batches so the few-shot prompt is sent once per batch
+        self.batch_classifier = BatchClassifier(self.classifierAsyncClient, max_batch_size=16, max_wait=1.0,
+                                                tier=self.model_cascade.tiers[0])
+
+        # When Claude errors or stalls, channel messages fall back to the local pre-filter and are parked for a later retry
+        self.llm_breaker = CircuitBreaker("Claude", failure_threshold=5, slow_call_threshold=15.0, call_timeout=30.0,
+                                          reset_timeout=30.0)
+        self.llm_retry_queue = deque(maxlen=retry_queue_size)
+        self.llm_fallbacks = 0
+        self.retry_task = None
+
+        # Per-author and per-guild limits on LLM classification; messages over the limit follow the backpressure policy
+        self.admission = AdmissionController(user_rate_per_minute=10, user_burst=5, guild_rate_per_minute=120,
+                                             guild_burst=30, policy=BackpressurePolicy.LOCAL_ONLY, sample_rate=0.1,
+                                             dedup_window=60.0)
+
+        # Channel messages are classified by a bounded pool of workers so a slow LLM never stalls the gateway.
+        # Each worker waits on one message, so keep at least a couple of batches worth of workers.
+        self.classification_pool = ClassificationPool(self.classify_message, self.handle_classification,
+                                                      num_workers=32, max_pending=1000)
+
+        self.metrics_server = MetricsServer(registry, host=metrics_host, port=metrics_port)
+        self.register_metrics()
+
+        self.restore_state()
+
+    def register_metrics(self):
+        # Everything except the LLM call observer is read at scrape time, so it adds nothing to the hot path
+        llm_latency = registry.histogram("modbot_llm_latency_seconds", "Latency of Claude API calls.", ("model",))
+        llm_tokens = registry.histogram("modbot_llm_tokens", "Tokens per Claude API call.", ("model", "kind"),
+                                        buckets=DEFAULT_TOKEN_BUCKETS)
+
+        def observe_llm_call(message, call, latency):
+            model = getattr(message, "model", None) or "unknown"
+            if latency is not None:
+                llm_latency.observe(latency, model)
+            llm_tokens.observe(call["input_tokens"] + call["cache_read_tokens"] + call["cache_write_tokens"], model, "input")
+            llm_tokens.observe(call["output_tokens"], model, "output")
+        usage_stats.add_observer(observe_llm_call)
+
+        registry.callback("modbot_review_queue_depth", "Reports waiting for review.",
+                          lambda: {(queue.name,): len(queue) for queue in (self.to_be_reviewed, self.to_be_reviewed_automated)},
+                          labelnames=("queue",))
+        registry.callback("modbot_review_queue_oldest_wait_seconds", "Age of the oldest report waiting for review.",
+                          lambda: {(queue.name,): queue.oldest_wait() for queue in (self.to_be_reviewed, self.to_be_reviewed_automated)},
+                          labelnames=("queue",))
+        registry.callback("modbot_classification_pending", "Channel messages waiting for a classification worker.",
+                          self.classification_pool.pending)
+        registry.callback("modbot_llm_retry_queue_depth", "Messages waiting to be (re-)classified by the LLM.",
+                          lambda: len(self.llm_retry_queue))
+        registry.callback("modbot_classification_total", "Channel messages by classification outcome.",
+                          lambda: {("completed",): self.classification_pool.completed, ("failed",): self.classification_pool.failed,
+                                   ("dropped",): self.classification_pool.dropped, ("local_fallback",): self.llm_fallbacks},
+                          kind="counter", labelnames=("outcome",))
+        registry.callback("modbot_verdict_cache_hit_ratio", "Hit rate of the verdict cache.", self.verdict_cache.hit_rate)
+        registry.callback("modbot_prompt_cache_read_ratio", "Fraction of LLM input tokens read from the prompt cache.",
+                          usage_stats.cached_fraction)
+        registry.callback("modbot_near_duplicate_matches_total", "Channel messages that reused the verdict of a near-duplicate.",
+                          lambda: self.near_duplicates.matches, kind="counter")
+        registry.callback("modbot_near_duplicate_index_entries", "Recent messages in the near-duplicate index.",
+                          lambda: len(self.near_duplicates))
+        registry.callback("modbot_prefilter_short_circuit_total", "Messages the pre-filter kept away from the LLM.",
+                          lambda: self.prefilter.short_circuited, kind="counter")
+        registry.callback("modbot_llm_circuit_open", "1 while the Claude circuit breaker rejects calls.",
+                          lambda: int(self.llm_breaker.is_open()))
+        registry.callback("modbot_llm_errors_total", "Failed or too slow Claude calls seen by the circuit breaker.",
+                          lambda: self.llm_breaker.failures, kind="counter")
+        sessions = (self.reports, self.reviews)
+        registry.callback("modbot_open_sessions", "Report and review sessions in progress.",
+                          lambda: {(store.kind,): len(store) for store in sessions}, labelnames=("kind",))
+        registry.callback("modbot_session_memory_bytes", "Approximate memory held by open sessions.",
+                          lambda: {(store.kind,): store.memory_bytes() for store in sessions}, labelnames=("kind",))
+        registry.callback("modbot_session_evictions_total", "Sessions dropped before they were finished.",
+                          lambda: {(store.kind, reason): count for store in sessions for reason, count in store.evicted.items()},
+                          kind="counter", labelnames=("kind", "reason"))
+        registry.callback("modbot_linked_message_fetches_total", "Messages linked from reports, by how they were resolved.",
+                          lambda: {("cache",): self.message_resolver.hits, ("coalesced",): self.message_resolver.coalesced,
+                                   ("fetched",): self.message_resolver.fetches, ("failed",): self.message_resolver.failures},
+                          kind="counter", labelnames=("source",))
+        registry.callback("modbot_reports_coalesced_total", "Reports merged into a review item already in a queue.",
+                          lambda: {(key,): value for key, value in self.report_coalescer.stats().items()},
+                          kind="counter", labelnames=("kind",))
+        registry.callback("modbot_admission_total", "Channel messages by admission decision.",
+                          lambda: {(key,): value for key, value in self.admission.stats().items() if key != "policy"},
+                          kind="counter", labelnames=("decision",))
+
+    def restore_state(self):
+        saved = self.queue_store.load()
+        for queue in (self.to_be_reviewed, self.to_be_reviewed_automated):
+            for entry_id, enqueued_at, item in saved["queues"].get(queue.name, []):
+                queue.restore(entry_id, item, enqueued_at)
+        for name, kind in saved["entities"].items():
+            self.entity_matcher.add(name, kind=kind)
+
+        for (kind, author_id), data in saved["sessions"].items():
+            if kind == "report":
+                self.reports[author_id] = Report.from_dict(self, data)
+            elif kind == "review":
+                self.reviews[author_id] = ModReview.from_dict(self, data)
+
+        logger.info("Restored %d user reports, %d automated reports and %d open sessions.",
+                    len(self.to_be_reviewed), len(self.to_be_reviewed_automated), len(saved['sessions']))
+
+    async def setup_hook(self):
+        self.classification_pool.start()
+        self.queue_store.start()
+        self.verdict_cache.start()
+        self.retry_task = asyncio.create_task(self.retry_parked_messages())
+        self.session_task = asyncio.create_task(self.expire_sessions())
+        try:
+            await self.metrics_server.start()
+        except OSError as e:
+            logger.warning("Metrics endpoint disabled, could not listen on %s:%d: %s", metrics_host, metrics_port, e)
+
+    async def close(self):
+        for task in (self.retry_task, self.session_task):
+            if task is not None:
+                task.cancel()
+        await self.classification_pool.stop()
+        await self.queue_store.close()
+        self.verdict_cache.close()
+        await close_clients()
+        await self.metrics_server.close()
+        await super().close()
 
     async def on_ready(self):
         print(f'{self.user.name} has connected to Discord! It is these guilds:')
@@ -65,6 +274,14 @@ class ModBot(discord.Client):
                     self.mod_channels[guild.id] = channel
         
 
+    async def on_raw_message_edit(self, payload):
+        # Reports of the edited message should see the new content
+        self.message_resolver.invalidate(payload.guild_id, payload.channel_id, payload.message_id)
+
+    async def on_raw_message_delete(self, payload):
+        self.message_resolver.invalidate(payload.guild_id, payload.channel_id, payload.message_id)
+
+    @observe_latency("on_message")
     async def on_message(self, message):
         '''
         This function is called whenever a message is sent in a channel that the bot can see (including DMs). 
@@ -80,6 +297,7 @@ class ModBot(discord.Client):
         else:
             await self.handle_dm(message)
 
+    @observe_latency("handle_dm")
     async def handle_dm(self, message):
         # Handle a help message
         if message.content == Report.HELP_KEYWORD:
@@ -99,49 +317,48 @@ class ModBot(discord.Client):
         # If we don't currently have an active report for this user, add one
         if author_id not in self.reports:
             self.reports[author_id] = Report(self)
+        report = self.reports[author_id]
 
         # Let the report class handle this message; forward all the messages it returns to uss
-        responses, final_outputs = await self.reports[author_id].handle_message(message)
+        responses, final_outputs = await report.handle_message(message)
         if final_outputs is not None:
             for out in final_outputs:
-                self.to_be_reviewed.append(out)
+                self.report_coalescer.add_user_report(out)
         for r in responses:
             await message.channel.send(r)
 
         # If the report is complete or cancelled, remove it from our map
-        if self.reports[author_id].report_complete():
+        if report.report_complete():
             self.reports.pop(author_id)
+        elif author_id in self.reports:
+            self.reports.save(author_id)
 
+    @observe_latency("handle_channel_message")
     async def handle_channel_message(self, message):
         if message.channel.name == f'group-{self.group_num}':
-            messageText = message.content
-            classification = prompt_claude(constants.DEFAULT_MOD_CONTEXT, messageText, constants.DEFAULT_CLASSIFICATION_PREP, self.claudeClient)
-            print(classification.content[0].text)
-            threat_level = ""
-            if classification.content[0].text == "Yes":
-                threat_level = "Threatening"
-            
-            print(message.content)
-
-            report_data = {
-                'post_content': message.content,
-                'message_id': message.id,
-                'author': message.author.name,
-                'channel': message.channel.name
-            }
-
-            # Add to automated review queue if threatening
-            if threat_level == "Threatening":
-                self.to_be_reviewed_automated.append(report_data)
-                mod_channel = self.mod_channels.get(message.guild.id) 
-                if mod_channel:
-                    warning_message = f"Threat detected: {message.content}\nMessage ID: {message.id}\nAuthor: {message.author.name}\nChannel: {message.channel.name}\n"
-                    await mod_channel.send(warning_message)  # Send message using the channel object
-                else:
-                    print(f"No mod channel found for guild {message.guild.name}")
+            # Hand the message off to the classification workers; the verdict is handled in `handle_classification`.
+            # The near-duplicate signature is computed once here and used for both the lookup and the indexing
+            matched_entities = self.entity_matcher.scan(message.content)
+            signature = self.near_duplicates.signature(message.content)
+            decision = self.admission.admit(message.guild.id, message.author.id, message.content)
+            if decision == AdmissionDecision.ADMIT:
+                self.classification_pool.submit(message, matched_entities, signature)
+            elif decision == AdmissionDecision.DEFER:
+                self.llm_retry_queue.append((message, matched_entities, signature))
+            else:
+                # Duplicates and messages over the limit still get the local check, so a flood of threats is flagged
+                await self.handle_classification(message, matched_entities, signature,
+                                                 self.fallback_classify(message, matched_entities, signature, park=False))
 
-            
         if message.channel.name == f'group-{self.group_num}-mod':
+            if message.content == ModReview.CLASSIFIER_STATS_KEYWORD:
+                await message.channel.send(self.classifier_stats())
+                return
+
+            if message.content == ModReview.QUEUE_STATS_KEYWORD:
+                await message.channel.send(self.queue_stats())
+                return
+
             if message.content == ModReview.HELP_KEYWORD:
                 reply += "To initiate the reporting proccess, please type 'review' "
                 reply += "To stop the reporting process, please type 'cancel'"
@@ -155,13 +372,16 @@ class ModBot(discord.Client):
                     return  # Exit if the message isn't a start command and the author has no active review
 
             # Process the message through the corresponding ModReview instance
-            responses = await self.reviews[author_id].handle_message(message)
+            review = self.reviews[author_id]
+            responses = await review.handle_message(message)
             for response in responses:
                 await message.channel.send(response)
 
             # Clean up the review object if the review process is complete
-            if self.reviews[author_id].review_complete():
+            if review.review_complete():
                 del self.reviews[author_id]
+            elif author_id in self.reviews:
+                self.reviews.save(author_id)
 
 
         # Only handle messages sent in the "group-#" channel
@@ -174,6 +394,185 @@ class ModBot(discord.Client):
         # scores = self.eval_text(message.content)
         # await mod_channel.send(self.code_format(scores))
 
+    def learn_organization(self, organization_name):
+        """
+        Starts matching an organization named in a user report. Called by `ModReview` once a moderator has acted
+        on the report, since a match sends a message straight to the LLM (or flags it while the LLM is down).
+        """
+        # "usa", "intl" and "unknown" are answers to the group identification question, not names
+        if not organization_name or organization_name in ("usa", "intl", "unknown"):
+            return False
+        if not is_valid_organization_name(organization_name):
+            logger.info("Not learning organization name %r: too short or too common", organization_name)
+            return False
+        if self.entity_matcher.add(organization_name, kind="organization"):
+            self.queue_store.log_entity(" ".join(organization_name.lower().split()), "organization")
+            return True
+        return False
+
+    @observe_latency("classify_message")
+    async def classify_message(self, message, matched_entities, signature):
+        # Messages mentioning known groups or recruitment phrases always go to Claude
+        if not matched_entities and self.prefilter.assess(message.content) == PreFilterDecision.BENIGN:
+            return Verdict(False, "invalid", source="prefilter")
+
+        cached = self.verdict_cache.get(message.content, self.classification_fingerprint)
+        if cached is not None:
+            verdict = parse_verdict(cached)
+            if verdict is not None:
+                return verdict
+
+        match = self.near_duplicates.find(signature)
+        if match is not None and match.entry.verdict is not None:
+            original = match.entry.verdict
+            return Verdict(original.flagged, original.category, original.confidence, source="near_duplicate")
+
+        try:
+            return await self.llm_breaker.call_async(self.classify_with_llm, message.content)
+        except CircuitOpenError:
+            pass
+        except Exception:
+            logger.exception("LLM classification of message %s failed", message.id)
+        return self.fallback_classify(message, matched_entities, signature)
+
+    async def classify_with_llm(self, text):
+        verdict = await self.batch_classifier.classify(text)
+        if self.model_cascade.should_escalate(verdict, 0):
+            verdict = await self.model_cascade.classify_async(constants.DEFAULT_MOD_CONTEXT, text,
+                                                              constants.DEFAULT_CLASSIFICATION_PREP, self.classifierAsyncClient,
+                                                              start_tier=1)
+        if verdict is None:
+            raise ValueError(f"Could not parse a verdict for message: {text!r}")
+        self.verdict_cache.put(text, self.classification_fingerprint, verdict.to_text())
+        return verdict
+
+    def fallback_classify(self, message, matched_entities, signature, park=True):
+        # Known entities and lexicon hits are flagged right away so a moderator sees them; with `park`, everything
+        # else is re-classified by the LLM once it recovers, so a missed threat is still caught later
+        self.llm_fallbacks += 1
+        if matched_entities or self.prefilter.is_suspicious(message.content):
+            return Verdict(True, "other", source="local")
+        if park:
+            self.llm_retry_queue.append((message, matched_entities, signature))
+        return Verdict(False, "invalid", source="local")
+
+    async def retry_parked_messages(self):
+        while True:
+            await asyncio.sleep(retry_interval)
+            # Leave room in the pool for live traffic; stop as soon as the circuit trips again
+            for _ in range(retry_batch_size):
+                if not self.llm_retry_queue or self.llm_breaker.is_open() \
+                        or self.classification_pool.pending() >= self.classification_pool.num_workers:
+                    break
+                message, matched_entities, signature = self.llm_retry_queue.popleft()
+                if not self.classification_pool.submit(message, matched_entities, signature):
+                    self.llm_retry_queue.appendleft((message, matched_entities, signature))
+                    break
+
+    async def expire_sessions(self):
+        while True:
+            await asyncio.sleep(session_tick)
+            self.reports.expire()
+            self.reviews.expire()
+
+    async def handle_classification(self, message, matched_entities, signature, verdict):
+        # Only LLM verdicts (fresh or cached) are handed out to later variants, never a pre-filter or fallback
+        # guess; every message joins its group of variants
+        variant_group = self.near_duplicates.add(message.id, signature, verdict if verdict.source == "llm" else None)
+
+        threat_level = ""
+        if verdict.flagged:
+            threat_level = "Threatening"
+
+        # Sampled, except for flagged messages which are always logged
+        message_logger.log(logging.WARNING if verdict.flagged else logging.INFO, "Classified channel message",
+                           extra={"message_id": message.id, "author_id": message.author.id, "channel": message.channel.name,
+                                  "flagged": verdict.flagged, "category": verdict.category,
+                                  "confidence": verdict.confidence, "source": verdict.source,
+                                  "matched_entities": [match["entity"] for match in matched_entities]})
+
+        report_data = {
+            'post_content': message.content,
+            'message_id': message.id,
+            'author': message.author.name,
+            'channel': message.channel.name,
+            'matched_entities': [match["entity"] for match in matched_entities],
+            'threat_level': f"{threat_level} ({verdict.category})" if threat_level else "Not specified",
+            'classified_by': CLASSIFIED_BY.get(verdict.source, "Claude"),
+            'variant_group': variant_group,
+            'category': verdict.category,
+            'confidence': verdict.confidence
+        }
+
+        # Add to automated review queue if threatening
+        if threat_level == "Threatening":
+            entry = self.report_coalescer.add_automated_report(report_data)
+            mod_channel = self.mod_channels.get(message.guild.id) 
+            if mod_channel:
+                warning_message = f"Threat detected: {message.content}\nMessage ID: {message.id}\nAuthor: {message.author.name}\nChannel: {message.channel.name}\n"
+                if verdict.source == "local":
+                    warning_message += "Flagged by the local classifier (Claude unavailable or rate limit reached).\n"
+                elif verdict.source == "near_duplicate":
+                    warning_message += "Near-duplicate of an earlier flagged message; its verdict was reused.\n"
+                if report_data['matched_entities']:
+                    warning_message += f"Matched entities: {', '.join(report_data['matched_entities'])}\n"
+                if entry.item is not report_data:
+                    if "reporters" in entry.item:
+                        warning_message += f"Already reported by {entry.item['reporters']} user(s); attached to their pending report.\n"
+                    else:
+                        warning_message += f"Seen {entry.item['occurrences']} times; merged into the pending automated report.\n"
+                await mod_channel.send(warning_message)  # Send message using the channel object
+            else:
+                logger.warning("No mod channel found for guild %s", message.guild.name)
+
+    def classifier_stats(self):
+        prefilter_stats = self.prefilter.stats()
+        cache_stats = self.verdict_cache.stats()
+        reply = "**Classifier stats:**\n"
+        reply += f"Messages pre-filtered: {prefilter_stats['assessed']} "
+        reply += f"(short-circuited: {prefilter_stats['short_circuited']}, escalated: {prefilter_stats['escalated']}, "
+        reply += f"escalation rate: {prefilter_stats['escalation_rate']:.1%})\n"
+        reply += f"Verdict cache: {cache_stats['entries']} entries, hit rate {cache_stats['hit_rate']:.1%}\n"
+        near_duplicate_stats = self.near_duplicates.stats()
+        reply += f"Near-duplicate index: {near_duplicate_stats['entries']} messages, {near_duplicate_stats['matches']} verdicts reused "
+        reply += f"(match rate {near_duplicate_stats['match_rate']:.1%}, {near_duplicate_stats['candidates_per_lookup']:.1f} candidates per lookup)\n"
+        reply += f"LLM requests: {self.batch_classifier.requests_sent} "
+        reply += f"({self.batch_classifier.messages_per_request():.1f} messages per request)\n"
+        token_stats = usage_stats.stats()
+        reply += f"Input tokens: {token_stats['input_tokens']} uncached, {token_stats['cache_read_tokens']} read from prompt cache "
+        reply += f"({token_stats['cached_fraction']:.1%} cached), {token_stats['cache_write_tokens']} written to prompt cache\n"
+        breaker_stats = self.llm_breaker.stats()
+        reply += f"Claude circuit: {breaker_stats['state']} (opened {breaker_stats['times_opened']} times, "
+        reply += f"{breaker_stats['failures']} failures, {breaker_stats['rejected']} rejected calls)\n"
+        reply += f"Local fallbacks: {self.llm_fallbacks}, waiting for LLM retry: {len(self.llm_retry_queue)}\n"
+        admission_stats = self.admission.stats()
+        reply += f"Admission ({admission_stats['policy']}): {admission_stats['admitted']} admitted, "
+        reply += f"{admission_stats['duplicates']} duplicates, {admission_stats['user_limited']} over user limit, "
+        reply += f"{admission_stats['guild_limited']} over guild limit "
+        reply += f"(skipped: {admission_stats['skipped']}, deferred: {admission_stats['deferred']}, local only: {admission_stats['local_only']})\n"
+        reply += f"Model cascade: {self.model_cascade.name()}\n"
+        for tier in self.model_cascade.tiers:
+            tier_stats = tier.stats()
+            reply += f"  {tier_stats['model']}: {tier_stats['calls']} calls, mean latency {tier_stats['mean_latency']:.2f}s "
+            reply += f"(max {tier_stats['max_latency']:.2f}s), cost ${tier_stats['cost']:.4f}\n"
+        return reply
+
+    def queue_stats(self):
+        reply = "**Review queue stats:**\n"
+        for queue in (self.to_be_reviewed, self.to_be_reviewed_automated):
+            stats = queue.stats()
+            reply += f"\n**{stats['name']}:** {stats['depth']} pending, oldest waiting {stats['oldest_wait']:.0f}s\n"
+            reply += f"Reviewed: {stats['reviewed']} (mean wait {stats['mean_wait']:.0f}s, max wait {stats['max_wait']:.0f}s)\n"
+        coalescer_stats = self.report_coalescer.stats()
+        reply += f"Duplicates merged: {coalescer_stats['merged_user']} user reports, {coalescer_stats['merged_automated']} detections, "
+        reply += f"{coalescer_stats['joined']} detections joined with user reports\n"
+        reply += "\n**Open sessions:**\n"
+        for sessions in (self.reports, self.reviews):
+            stats = sessions.stats()
+            reply += f"{stats['kind'].capitalize()}s: {stats['open']} open (~{stats['memory_bytes'] / 1024:.1f} KiB), "
+            reply += f"expired {stats['evicted_idle']}, evicted at capacity {stats['evicted_capacity']}\n"
+        return reply
+
     
     def eval_text(self, message):
         ''''
@@ -193,4 +592,8 @@ class ModBot(discord.Client):
 
 
 client = ModBot()
-client.run(discord_token)
\ No newline at end of file
+try:
+    # Our own logging pipeline is already set up; don't let discord.py add a second handler
+    client.run(discord_token, log_handler=None)
+finally:
+    log_listener.stop()
\ No newline at end of file
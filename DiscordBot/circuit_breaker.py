@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import time
+from enum import Enum, auto
+
+logger = logging.getLogger('modbot.llm')
+
+
+class CircuitState(Enum):
+    CLOSED = auto()      # calls go through
+    OPEN = auto()        # calls are rejected until `reset_timeout` has passed
+    HALF_OPEN = auto()   # a single probe call decides whether to close or re-open
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling the backend while the circuit is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Stops calling a backend that is failing or stalling, so callers can fall back right away instead of
+    piling up behind timeouts.
+
+    Errors, calls slower than `slow_call_threshold` and calls exceeding `call_timeout` all count as failures.
+    After `failure_threshold` consecutive failures the circuit opens; once `reset_timeout` has passed, one
+    probe call is let through, and the circuit closes again if it succeeds.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, slow_call_threshold: float = 15.0,
+                 call_timeout: float = 30.0, reset_timeout: float = 30.0):
+        """
+        Args:
+            name (str): Shown in logs and stats.
+            failure_threshold (int): Consecutive failures that open the circuit.
+            slow_call_threshold (float): Seconds after which a successful call still counts as a failure.
+            call_timeout (float): Seconds after which an async call is cancelled and counted as a failure.
+            reset_timeout (float): Seconds the circuit stays open before a probe call is allowed.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_threshold = slow_call_threshold
+        self.call_timeout = call_timeout
+        self.reset_timeout = reset_timeout
+
+        self.state = CircuitState.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+
+        # counters
+        self.calls = 0
+        self.failures = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    def is_open(self) -> bool:
+        """
+        True while calls would be rejected. Unlike `allow_request()`, this never starts a probe.
+        """
+        if self.state == CircuitState.OPEN:
+            return time.monotonic() - self.opened_at < self.reset_timeout
+        return self.state == CircuitState.HALF_OPEN and self.probe_in_flight
+
+    def allow_request(self) -> bool:
+        if self.state == CircuitState.CLOSED:
+            return True
+        if self.state == CircuitState.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = CircuitState.HALF_OPEN
+            self.probe_in_flight = False
+        if self.probe_in_flight:
+            return False
+        self.probe_in_flight = True
+        return True
+
+    def record_success(self, latency: float):
+        if latency > self.slow_call_threshold:
+            logger.warning("%s call took %.1fs, counting it as a failure", self.name, latency)
+            self.record_failure()
+            return
+        if self.state != CircuitState.CLOSED:
+            logger.info("%s circuit closed", self.name)
+        self.state = CircuitState.CLOSED
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.probe_in_flight = False
+        if self.state == CircuitState.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != CircuitState.OPEN:
+                self.times_opened += 1
+                logger.warning("%s circuit opened after %d consecutive failures", self.name, self.consecutive_failures)
+            self.state = CircuitState.OPEN
+            self.opened_at = time.monotonic()
+
+    async def call_async(self, fn, *args, **kwargs):
+        """
+        Awaits `fn(*args, **kwargs)` through the breaker.
+
+        Raises:
+            CircuitOpenError: If the circuit is open; `fn` is not called.
+        """
+        if not self.allow_request():
+            self.rejected += 1
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+        self.calls += 1
+        start = time.monotonic()
+        try:
+            result = await asyncio.wait_for(fn(*args, **kwargs), timeout=self.call_timeout)
+        except asyncio.CancelledError:
+            # The caller went away; don't leave a half-open probe hanging
+            self.probe_in_flight = False
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success(time.monotonic() - start)
+        return result
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Synchronous counterpart of `call_async()`. The call can't be cut short, so `call_timeout` is not enforced;
+        rely on the client's own timeouts for that.
+        """
+        if not self.allow_request():
+            self.rejected += 1
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+        self.calls += 1
+        start = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success(time.monotonic() - start)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "state": self.state.name,
+            "calls": self.calls,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "times_opened": self.times_opened,
+        }
@@ -0,0 +1,86 @@
+import asyncio
+import logging
+
+logger = logging.getLogger('modbot.classification')
+
+
+class ClassificationPool:
+    """
+    Bounded pool of asyncio workers that classify channel messages off the gateway's hot path.
+
+    `handle_channel_message` only enqueues the message; the LLM round-trip happens inside one of the
+    workers, so DMs, mod channel reviews and heartbeats keep being served while the model is thinking.
+    """
+
+    def __init__(self, classify, on_result, num_workers: int = 4, max_pending: int = 1000):
+        """
+        Args:
+            classify (coroutine function): Called as `await classify(message, *context)`, returns the classification result.
+            on_result (coroutine function): Called as `await on_result(message, *context, result)` once a message is classified.
+            num_workers (int): Number of messages that may be classified concurrently.
+            max_pending (int): Maximum number of messages waiting for a worker. New messages are dropped once full.
+        """
+        self.classify = classify
+        self.on_result = on_result
+        self.num_workers = num_workers
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.workers = []
+
+        # counters
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def start(self):
+        """
+        Spawns the worker tasks. Must be called from inside a running event loop (e.g. `setup_hook`).
+        """
+        if self.workers:
+            return
+        for i in range(self.num_workers):
+            self.workers.append(asyncio.create_task(self._worker(), name=f"classifier-{i}"))
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    def submit(self, message, *context) -> bool:
+        """
+        Queues a message for classification without waiting on the model.
+
+        Args:
+            message (discord.Message): The channel message to classify.
+            *context: Extra values computed at ingestion time, passed through to `classify` and `on_result`.
+
+        Returns:
+            bool: False if the pool is saturated and the message was dropped.
+        """
+        try:
+            self.queue.put_nowait((message, context))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning("Classification queue full, dropping message %s", message.id)
+            return False
+        self.submitted += 1
+        return True
+
+    def pending(self) -> int:
+        return self.queue.qsize()
+
+    async def _worker(self):
+        while True:
+            message, context = await self.queue.get()
+            try:
+                result = await self.classify(message, *context)
+                await self.on_result(message, *context, result)
+                self.completed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.failed += 1
+                logger.exception("Failed to classify message %s", message.id)
+            finally:
+                self.queue.task_done()
@@ -0,0 +1,176 @@
+import re
+from collections import deque
+from typing import List, Tuple
+
+# Phrases commonly used in recruitment posts. Organization names reported by users are added at runtime.
+DEFAULT_RECRUITMENT_PHRASES = [
+    "join our cause", "join our group", "join our ranks", "join the caliphate", "join the jihad", "join the fight",
+    "pledge allegiance", "holy war", "become a martyr", "die a martyr", "fight the infidels", "kill the infidels",
+    "take out our enemies", "dm me to join", "message me to join", "brothers in arms", "answer the call",
+]
+
+# Learned names shorter than this (ignoring spaces) would match inside ordinary chatter
+MIN_ORGANIZATION_LENGTH = 4
+
+# A learned name made up only of these words would match ordinary text, e.g. "is" or "the group"
+COMMON_WORDS = frozenset("""
+    a about after all also an and any are as at be because been but by can come could day do does even first for from
+    get give go good group groups have he her here him his how i if in into is it its just know like look make me men
+    more most my new no not now of on one only or other our out over people say see she so some take than that the
+    their them then there these they thing think this those time to two up us use very want was way we well what when
+    which who will with would year you your
+    admin bot channel chat guy guys friend friends lol member members mod mods none org organization ok okay post
+    server someone something team thanks user users yes
+""".split())
+
+
+def is_valid_organization_name(name: str) -> bool:
+    """
+    Whether a name reported by a user is specific enough to be matched in every channel message.
+    """
+    normalized = " ".join(name.lower().split())
+    if len(normalized.replace(" ", "")) < MIN_ORGANIZATION_LENGTH:
+        return False
+    words = re.findall(r"\w+", normalized)
+    return any(word not in COMMON_WORDS and not word.isdigit() for word in words)
+
+
+class EntityMatcher:
+    """
+    Aho-Corasick automaton over known organization names and recruitment phrases.
+
+    Every channel message is scanned in a single pass regardless of how many patterns are known. New patterns
+    are inserted into the trie as they arrive; the failure links are rebuilt lazily, once, on the next scan.
+    """
+
+    def __init__(self, phrases: List[str] = DEFAULT_RECRUITMENT_PHRASES):
+        """
+        Args:
+            phrases (List[str]): Initial recruitment phrases to match.
+        """
+        self.goto = [{}]        # node -> {char: child node}
+        self.fail = [0]         # node -> longest proper suffix node
+        self.output = [None]    # node -> id of the pattern ending at this node
+        self.dict_link = [0]    # node -> nearest suffix node that ends a pattern (0 if none)
+        self.patterns = []      # pattern id -> (pattern, kind)
+        self.pattern_ids = {}   # pattern -> pattern id
+        self.stale = False      # whether failure links need rebuilding
+
+        for phrase in phrases:
+            self.add(phrase, kind="phrase")
+
+    def add(self, pattern: str, kind: str = "organization") -> bool:
+        """
+        Adds a pattern to the automaton.
+
+        Args:
+            pattern (str): Text to match, case-insensitively and on word boundaries.
+            kind (str): Type of entity, e.g. "organization" or "phrase". Attached to every match.
+
+        Returns:
+            bool: False if the pattern was empty or already known.
+        """
+        pattern = " ".join(pattern.lower().split())
+        if not pattern or pattern in self.pattern_ids:
+            return False
+
+        node = 0
+        for char in pattern:
+            child = self.goto[node].get(char)
+            if child is None:
+                child = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(None)
+                self.dict_link.append(0)
+                self.goto[node][char] = child
+            node = child
+
+        pattern_id = len(self.patterns)
+        self.patterns.append((pattern, kind))
+        self.pattern_ids[pattern] = pattern_id
+        self.output[node] = pattern_id
+        self.stale = True
+        return True
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def __contains__(self, pattern: str):
+        return " ".join(pattern.lower().split()) in self.pattern_ids
+
+    def scan(self, text: str) -> List[dict]:
+        """
+        Finds every known pattern in the text. Like the patterns, the text is matched lowercased and with runs
+        of whitespace (spaces, tabs, newlines) collapsed, so "join  our   cause" matches "join our cause".
+
+        Returns:
+            List[dict]: One `{"entity", "kind", "start"}` dict per distinct pattern found, in order of first occurrence.
+                        `start` is the offset of the match in the original text.
+        """
+        if self.stale:
+            self._build()
+
+        text, offsets = self._normalize(text)
+        matches = []
+        seen = set()
+        node = 0
+        for i, char in enumerate(text):
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+
+            hit = node if self.output[node] is not None else self.dict_link[node]
+            while hit:
+                pattern_id = self.output[hit]
+                pattern, kind = self.patterns[pattern_id]
+                start = i - len(pattern) + 1
+                if pattern_id not in seen and self._on_word_boundary(text, start, i + 1):
+                    seen.add(pattern_id)
+                    matches.append({"entity": pattern, "kind": kind, "start": offsets[start]})
+                hit = self.dict_link[hit]
+        return matches
+
+    @staticmethod
+    def _normalize(text: str) -> Tuple[str, List[int]]:
+        # Same normalization as `add()`, plus the offset in `text` of every normalized character
+        chars, offsets = [], []
+        for i, char in enumerate(text):
+            if char.isspace():
+                if chars and chars[-1] != " ":
+                    chars.append(" ")
+                    offsets.append(i)
+                continue
+            for lowered in char.lower():
+                chars.append(lowered)
+                offsets.append(i)
+        return "".join(chars), offsets
+
+    @staticmethod
+    def _on_word_boundary(text: str, start: int, end: int) -> bool:
+        before_ok = start == 0 or not text[start - 1].isalnum()
+        after_ok = end == len(text) or not text[end].isalnum()
+        return before_ok and after_ok
+
+    def _build(self):
+        # Breadth-first over the trie so every node's failure target is finalized before its children
+        queue = deque()
+        for child in self.goto[0].values():
+            self.fail[child] = 0
+            self.dict_link[child] = 0
+            queue.append(child)
+
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[child] = target if target != child else 0
+
+                suffix = self.fail[child]
+                self.dict_link[child] = suffix if self.output[suffix] is not None else self.dict_link[suffix]
+                queue.append(child)
+
+        self.stale = False
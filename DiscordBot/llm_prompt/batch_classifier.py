@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import re
+import time
+from typing import List, Optional
+
+import anthropic
+
+from llm_prompt.prompt_claude import prompt_claude_async, classify_verdict_async, DEFAULT_MODEL
+from llm_prompt.model_cascade import ModelTier
+from llm_prompt.verdict import Verdict, parse_verdict, VERDICT_MAX_TOKENS
+import llm_prompt.constants as constants
+
+logger = logging.getLogger('modbot.llm')
+
+# One verdict line per message, e.g. "3. yes propaganda 0.9" or "3) No invalid"
+BATCH_VERDICT_PATTERN = re.compile(r"^\s*(\d+)\s*[.):\-]\s*(yes|no)\b[\s,:\-]*([a-z]+)(?:[\s,:\-]+(\d*\.?\d+))?", re.IGNORECASE | re.MULTILINE)
+
+
+def format_batch(messages: List[str]) -> str:
+    """
+    Packs the messages into a numbered list, one message per line, so the model can answer per index.
+    """
+    lines = []
+    for i, message in enumerate(messages, start=1):
+        flattened = " ".join(message.split())  # newlines inside a message would break the numbering
+        lines.append(f"{i}. {flattened}")
+    return "\n".join(lines)
+
+
+def parse_batch_verdicts(response_text: str, num_messages: int) -> Optional[List[Verdict]]:
+    """
+    Parses a numbered `<number>. <yes/no> <category> [confidence]` response back into one verdict per message.
+
+    Returns:
+        List[Verdict]: Verdicts in input order, or None if any index is missing.
+    """
+    verdicts = {}
+    for match in BATCH_VERDICT_PATTERN.finditer(response_text):
+        index = int(match.group(1))
+        if 1 <= index <= num_messages and index not in verdicts:
+            verdicts[index] = parse_verdict(" ".join(group for group in match.group(2, 3, 4) if group))
+
+    if len(verdicts) != num_messages:
+        return None
+    return [verdicts[i] for i in range(1, num_messages + 1)]
+
+
+class BatchClassifier:
+    """
+    Collects channel messages for a short window and classifies them with a single LLM request,
+    so the few-shot classification prompt is only paid for once per batch instead of once per message.
+
+    A batch is flushed as soon as it holds `max_batch_size` messages or `max_wait` seconds after its
+    first message arrived, whichever comes first. If the batched response can't be parsed, every message
+    in the batch falls back to an individual `DEFAULT_CLASSIFICATION_PREP` request through the verdict tool.
+    """
+
+    def __init__(self, client: anthropic.AsyncAnthropic, max_batch_size: int = 16, max_wait: float = 1.0,
+                 moderator_context: str = constants.DEFAULT_MOD_CONTEXT,
+                 batch_prep: str = constants.DEFAULT_BATCH_CLASSIFICATION_PREP,
+                 single_prep: str = constants.DEFAULT_CLASSIFICATION_PREP, tier: ModelTier = None):
+        """
+        Args:
+            client (AsyncAnthropic): Async client used for both batched and single-message requests.
+            max_batch_size (int): Maximum number of messages packed into one request.
+            max_wait (float): Maximum number of seconds a message waits for its batch to fill up.
+            moderator_context (str): System prompt, see `prompt_claude()`.
+            batch_prep (str): Prompt prepended to the numbered list of messages.
+            single_prep (str): Prompt used when falling back to one request per message.
+            tier (ModelTier): Model to query and record latency/cost on, e.g. the first tier of a `ModelCascade`.
+                              Defaults to `DEFAULT_MODEL`.
+        """
+        self.client = client
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.moderator_context = moderator_context
+        self.batch_prep = batch_prep
+        self.single_prep = single_prep
+        self.tier = tier or ModelTier(DEFAULT_MODEL)
+
+        self.pending = []   # (message text, future) pairs waiting for the next flush
+        self.flush_timer = None
+        self.in_flight = set()   # keeps references to running batch tasks
+
+        # counters
+        self.requests_sent = 0
+        self.batches_sent = 0
+        self.messages_classified = 0
+        self.fallbacks = 0
+
+    async def classify(self, text: str) -> Verdict:
+        """
+        Queues a message for the next batch and waits for its verdict.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((text, future))
+
+        if len(self.pending) >= self.max_batch_size:
+            self.flush()
+        elif self.flush_timer is None:
+            self.flush_timer = loop.call_later(self.max_wait, self.flush)
+
+        return await future
+
+    def flush(self):
+        if self.flush_timer is not None:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+        if not self.pending:
+            return
+
+        batch, self.pending = self.pending, []
+        task = asyncio.create_task(self._run_batch(batch))
+        self.in_flight.add(task)
+        task.add_done_callback(self.in_flight.discard)
+
+    def messages_per_request(self) -> float:
+        return self.messages_classified / self.requests_sent if self.requests_sent else 0.0
+
+    async def _run_batch(self, batch):
+        texts = [text for text, _ in batch]
+        futures = [future for _, future in batch]
+
+        verdicts = None
+        if len(batch) > 1:
+            try:
+                # Each answer line is a handful of tokens; cap the output so a rambling response is cut short
+                start = time.monotonic()
+                result = await prompt_claude_async(self.moderator_context, format_batch(texts), self.batch_prep, self.client,
+                                                   model=self.tier.model, max_tokens=(VERDICT_MAX_TOKENS + 4) * len(batch))
+                self.tier.record(result, time.monotonic() - start)
+                self.requests_sent += 1
+                self.batches_sent += 1
+                verdicts = parse_batch_verdicts(result.content[0].text, len(batch))
+            except Exception:
+                logger.exception("Batched classification of %d messages failed", len(batch))
+
+            if verdicts is None:
+                self.fallbacks += 1
+                logger.warning("Falling back to single-message classification for a batch of %d", len(batch))
+
+        if verdicts is None:
+            verdicts = await asyncio.gather(*(self._classify_single(text) for text in texts), return_exceptions=True)
+
+        for future, verdict in zip(futures, verdicts):
+            if future.done():
+                continue
+            if isinstance(verdict, BaseException):
+                future.set_exception(verdict)
+            else:
+                self.messages_classified += 1
+                future.set_result(verdict)
+
+    async def _classify_single(self, text: str) -> Verdict:
+        verdict = await classify_verdict_async(self.moderator_context, text, self.single_prep, self.client,
+                                               model=self.tier.model, tier=self.tier)
+        self.requests_sent += 1
+        if verdict is None:
+            raise ValueError(f"Could not parse a verdict for message: {text!r}")
+        return verdict
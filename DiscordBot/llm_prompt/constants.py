@@ -1,2 +1,3 @@
 DEFAULT_MOD_CONTEXT = "You are an admin on a social platform that is moderating content, specifically with attention towards ensuring that online terrorist recruitment material stays out of sight. Therefore, your goal is to observe activity on the platform and judge whether certain reported material is related to terrorist recruitment. "
-DEFAULT_CLASSIFICATION_PREP = "Is this message related to terrorist recruitment? Answer \"Yes\" or \"No\". In addition to your \"Yes\" or \"No\" answer, provide the category of the terrorist recruitment material. If the content does not promote terrorism, the category is \"invalid\". If the content does promote terrorism, it falls into one of the following categories: disturbing/graphic content (\"graphic\"), logistical coordination (\"logistical\"), propaganda (\"propaganda\"), active threat of violence (\"threat\"), other (\"other\"). Do not provide an explanation for your answer; your answer should be of form <yes/no> <category>, e.g. \"yes propaganda\".\n\nHere are some examples of sample inputs and responses for reference:\n\nInput: I'm going to bomb the nearby school on Saturday. Stay tuned to my livestream if you want to see the violence. \nOutput: yes propaganda\n\nInput: I'm going to take a trip to Syria to organize funding for [GROUP_NAME]. If you want to join me in my efforts and take out our enemies, dm me and we will win our holy war.\nOutput: yes logistical\n\nInput: We are streaming a couple of infidels being beheaded on this platform. Dm me to be invited to our group chat. Go [GROUP_NAME]!\nOutput: yes graphic\n\nInput: We're looking for people to join us. Please message me if you're interested in joining our group, [GROUP_NAME]. \nOutput: no invalid\n\nInput: Does anyone want to go to Walmart with me next Tuesday? We can pick up some watermelons.\nOutput: no invalid\n\nInput: I'm running for office to bring the Taliban back to power. We will take out all of the infidels and reinstate ourselves into global politics. We will bring back nuclear weapons and use them against all of our enemies.\nOutput: yes other\n\nBased on these instructions, classify this text:\n"
\ No newline at end of file
+DEFAULT_CLASSIFICATION_PREP = "Is this message related to terrorist recruitment? Answer \"Yes\" or \"No\". In addition to your \"Yes\" or \"No\" answer, provide the category of the terrorist recruitment material. If the content does not promote terrorism, the category is \"invalid\". If the content does promote terrorism, it falls into one of the following categories: disturbing/graphic content (\"graphic\"), logistical coordination (\"logistical\"), propaganda (\"propaganda\"), active threat of violence (\"threat\"), other (\"other\"). Do not provide an explanation for your answer; your answer should be of form <yes/no> <category>, e.g. \"yes propaganda\".\n\nHere are some examples of sample inputs and responses for reference:\n\nInput: I'm going to bomb the nearby school on Saturday. Stay tuned to my livestream if you want to see the violence. \nOutput: yes propaganda\n\nInput: I'm going to take a trip to Syria to organize funding for [GROUP_NAME]. If you want to join me in my efforts and take out our enemies, dm me and we will win our holy war.\nOutput: yes logistical\n\nInput: We are streaming a couple of infidels being beheaded on this platform. Dm me to be invited to our group chat. Go [GROUP_NAME]!\nOutput: yes graphic\n\nInput: We're looking for people to join us. Please message me if you're interested in joining our group, [GROUP_NAME]. \nOutput: no invalid\n\nInput: Does anyone want to go to Walmart with me next Tuesday? We can pick up some watermelons.\nOutput: no invalid\n\nInput: I'm running for office to bring the Taliban back to power. We will take out all of the infidels and reinstate ourselves into global politics. We will bring back nuclear weapons and use them against all of our enemies.\nOutput: yes other\n\nBased on these instructions, classify this text:\n"
+DEFAULT_BATCH_CLASSIFICATION_PREP = DEFAULT_CLASSIFICATION_PREP.replace("Based on these instructions, classify this text:\n", "") + "You will be given a numbered list of messages. Classify every message independently using the instructions above. Answer with exactly one line per message, in the same order as the input, of form <number>. <yes/no> <category> <confidence>, e.g. \"1. yes propaganda 0.9\", where <confidence> is a number between 0 and 1 expressing how sure you are. Do not skip any message and do not provide an explanation.\n\nBased on these instructions, classify these texts:\n"
@@ -0,0 +1,181 @@
+import threading
+from typing import List, Optional
+
+import anthropic
+
+from llm_prompt.prompt_claude import classify_verdict, classify_verdict_async, DEFAULT_MODEL, DEFAULT_TEMPERATURE
+from llm_prompt.verdict import Verdict
+
+FAST_MODEL = "claude-3-haiku-20240307"
+MEDIUM_MODEL = "claude-3-sonnet-20240229"
+
+# USD per million tokens (input, output)
+MODEL_PRICES = {
+    FAST_MODEL: (0.25, 1.25),
+    MEDIUM_MODEL: (3.0, 15.0),
+    DEFAULT_MODEL: (15.0, 75.0),
+}
+CACHE_READ_PRICE_FACTOR = 0.1     # prompt cache reads are billed at 10% of the input price
+CACHE_WRITE_PRICE_FACTOR = 1.25   # ... and cache writes at 125%
+
+DEFAULT_ESCALATION_THRESHOLD = 0.8
+
+
+class ModelTier:
+    """
+    One model in a `ModelCascade`, with latency, token and cost counters for the calls made to it.
+    """
+
+    def __init__(self, model: str, input_price: float = None, output_price: float = None):
+        """
+        Args:
+            model (str): Name of the Claude model.
+            input_price (float): USD per million input tokens. Defaults to `MODEL_PRICES`.
+            output_price (float): USD per million output tokens. Defaults to `MODEL_PRICES`.
+        """
+        default_input, default_output = MODEL_PRICES.get(model, (0.0, 0.0))
+        self.model = model
+        self.input_price = default_input if input_price is None else input_price
+        self.output_price = default_output if output_price is None else output_price
+
+        self.lock = threading.Lock()   # `ModelInference` calls from worker threads
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.input_tokens = 0
+        self.cache_read_tokens = 0
+        self.cache_write_tokens = 0
+        self.output_tokens = 0
+
+    def record(self, message, latency: float):
+        usage = getattr(message, "usage", None)
+        with self.lock:
+            self.calls += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            if usage is not None:
+                self.input_tokens += getattr(usage, "input_tokens", 0) or 0
+                self.cache_read_tokens += getattr(usage, "cache_read_input_tokens", 0) or 0
+                self.cache_write_tokens += getattr(usage, "cache_creation_input_tokens", 0) or 0
+                self.output_tokens += getattr(usage, "output_tokens", 0) or 0
+
+    def cost(self) -> float:
+        input_cost = self.input_tokens + CACHE_READ_PRICE_FACTOR * self.cache_read_tokens + CACHE_WRITE_PRICE_FACTOR * self.cache_write_tokens
+        return (input_cost * self.input_price + self.output_tokens * self.output_price) / 1e6
+
+    def mean_latency(self) -> float:
+        return self.total_latency / self.calls if self.calls else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model,
+            "calls": self.calls,
+            "mean_latency": self.mean_latency(),
+            "max_latency": self.max_latency,
+            "input_tokens": self.input_tokens + self.cache_read_tokens + self.cache_write_tokens,
+            "output_tokens": self.output_tokens,
+            "cost": self.cost(),
+        }
+
+
+class ModelCascade:
+    """
+    Classifies with the cheapest model first and only escalates to the next, larger model when the verdict
+    is unparseable, positive, or below the confidence threshold. Most channel chatter is benign and confidently
+    so, which means it never reaches the slow, expensive model at the end of the cascade.
+    """
+
+    def __init__(self, tiers: List[ModelTier], escalation_threshold: float = DEFAULT_ESCALATION_THRESHOLD,
+                 escalate_flagged: bool = True, temperature: float = DEFAULT_TEMPERATURE):
+        """
+        Args:
+            tiers (List[ModelTier]): Models to try in order, cheapest first. The last tier's verdict is final.
+            escalation_threshold (float): Verdicts with a lower confidence are escalated to the next tier.
+            escalate_flagged (bool): Escalate every positive verdict, so only the last tier can flag a message.
+            temperature (float): Sampling temperature for every tier.
+        """
+        if not tiers:
+            raise ValueError("A model cascade needs at least one tier.")
+        self.tiers = tiers
+        self.escalation_threshold = escalation_threshold
+        self.escalate_flagged = escalate_flagged
+        self.temperature = temperature
+
+        self.classified = 0
+        self.escalations = 0
+
+    def name(self) -> str:
+        return " > ".join(tier.model for tier in self.tiers)
+
+    def should_escalate(self, verdict: Optional[Verdict], tier_index: int) -> bool:
+        if tier_index >= len(self.tiers) - 1:
+            return False
+        if verdict is None:
+            return True
+        if verdict.flagged and self.escalate_flagged:
+            return True
+        return verdict.confidence is not None and verdict.confidence < self.escalation_threshold
+
+    def classify(self, moderator_context: str, input_message: str, prompt_prepend: str, client: anthropic.Anthropic,
+                 start_tier: int = 0) -> Optional[Verdict]:
+        """
+        Runs the message through the cascade. Every tier answers through the verdict tool, so each verdict carries
+        the confidence the escalation decision is based on. See `classify_verdict()` for the args.
+
+        Args:
+            start_tier (int): Index of the first tier to query, e.g. 1 if the first tier already answered.
+        """
+        verdict = None
+        for index in range(start_tier, len(self.tiers)):
+            tier = self.tiers[index]
+            verdict = classify_verdict(moderator_context, input_message, prompt_prepend, client,
+                                       model=tier.model, temperature=self.temperature, tier=tier)
+            if not self.should_escalate(verdict, index):
+                break
+            self.escalations += 1
+        self.classified += 1
+        return verdict
+
+    async def classify_async(self, moderator_context: str, input_message: str, prompt_prepend: str,
+                             client: anthropic.AsyncAnthropic, start_tier: int = 0) -> Optional[Verdict]:
+        """
+        Async counterpart of `classify()`.
+        """
+        verdict = None
+        for index in range(start_tier, len(self.tiers)):
+            tier = self.tiers[index]
+            verdict = await classify_verdict_async(moderator_context, input_message, prompt_prepend, client,
+                                                   model=tier.model, temperature=self.temperature, tier=tier)
+            if not self.should_escalate(verdict, index):
+                break
+            self.escalations += 1
+        self.classified += 1
+        return verdict
+
+    def escalation_rate(self) -> float:
+        return self.escalations / self.classified if self.classified else 0.0
+
+    def cost(self) -> float:
+        return sum(tier.cost() for tier in self.tiers)
+
+    def reset(self):
+        self.classified = 0
+        self.escalations = 0
+        for tier in self.tiers:
+            tier.reset()
+
+    def stats(self) -> dict:
+        return {
+            "cascade": self.name(),
+            "classified": self.classified,
+            "escalation_rate": self.escalation_rate(),
+            "cost": self.cost(),
+            "tiers": [tier.stats() for tier in self.tiers],
+        }
+
+
+def default_cascade(escalation_threshold: float = DEFAULT_ESCALATION_THRESHOLD) -> ModelCascade:
+    return ModelCascade([ModelTier(FAST_MODEL), ModelTier(DEFAULT_MODEL)], escalation_threshold=escalation_threshold)
@@ -6,54 +6,384 @@ sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 import requests
 import json
-import src.constants as constants
+import llm_prompt.constants as constants
 
 
+import threading
+import time
+
 import anthropic
+import httpx
 
-def start_client():
+from llm_prompt.verdict_cache import prompt_fingerprint
+from llm_prompt.verdict import Verdict, verdict_from_message, VERDICT_TOOL, VERDICT_TOOL_CHOICE, VERDICT_TOOL_MAX_TOKENS
 
-    load_dotenv()
-    
-    client = anthropic.Anthropic(
+DEFAULT_MODEL = "claude-3-opus-20240229"
+DEFAULT_TEMPERATURE = 0
+DEFAULT_MAX_TOKENS = 1000
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+class PromptUsageStats:
+    """
+    Accumulates token usage reported by the API, split into cached and uncached input tokens,
+    so the effect of prompt caching on cost and latency can be observed.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()   # `ModelInference` calls from worker threads
+        self.calls = 0
+        self.input_tokens = 0           # uncached input tokens
+        self.cache_read_tokens = 0      # input tokens served from the prompt cache
+        self.cache_write_tokens = 0     # input tokens written to the prompt cache
+        self.output_tokens = 0
+        self.last_call = None
+        self.observers = []
+
+    def add_observer(self, observer):
+        """
+        Registers `observer(message, call, latency)`, called after every recorded call, e.g. to export metrics.
+        `call` holds the token counts of this call, see `record()`.
+        """
+        self.observers.append(observer)
+
+    def record(self, message, latency: float = None):
+        usage = getattr(message, "usage", None)
+        if usage is None:
+            return
+        call = {
+            "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+            "cache_read_tokens": getattr(usage, "cache_read_input_tokens", 0) or 0,
+            "cache_write_tokens": getattr(usage, "cache_creation_input_tokens", 0) or 0,
+            "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+        }
+        with self.lock:
+            self.calls += 1
+            self.input_tokens += call["input_tokens"]
+            self.cache_read_tokens += call["cache_read_tokens"]
+            self.cache_write_tokens += call["cache_write_tokens"]
+            self.output_tokens += call["output_tokens"]
+            self.last_call = call
+        for observer in self.observers:
+            observer(message, call, latency)
+
+    def cached_fraction(self) -> float:
+        total = self.input_tokens + self.cache_read_tokens + self.cache_write_tokens
+        return self.cache_read_tokens / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "input_tokens": self.input_tokens,
+            "cache_read_tokens": self.cache_read_tokens,
+            "cache_write_tokens": self.cache_write_tokens,
+            "output_tokens": self.output_tokens,
+            "cached_fraction": self.cached_fraction(),
+        }
+
+
+usage_stats = PromptUsageStats()   # shared by every call made through this module
+
+
+# HTTP connection pool shared by every request made through one client, so concurrent classification reuses
+# warm TCP/TLS connections instead of paying the handshake per request
+CLIENT_MAX_CONNECTIONS = 64
+CLIENT_MAX_KEEPALIVE_CONNECTIONS = 32
+CLIENT_KEEPALIVE_EXPIRY = 60.0      # seconds an idle connection is kept open
+CLIENT_CONNECT_TIMEOUT = 5.0
+CLIENT_READ_TIMEOUT = 60.0
+CLIENT_MAX_RETRIES = 3              # retried by the SDK on connection errors, 408/409/429 and 5xx
+
+_env_loaded = False
+_shared_clients = {}   # (async, settings) -> client
+_clients_lock = threading.Lock()
+
+
+def _load_env():
+    global _env_loaded
+    if not _env_loaded:
+        load_dotenv()
+        _env_loaded = True
+
+
+def _http2_available() -> bool:
+    # httpx only speaks HTTP/2 when the optional `h2` package is installed
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _http_client_kwargs(max_connections: int, max_keepalive_connections: int, keepalive_expiry: float,
+                        connect_timeout: float, read_timeout: float) -> dict:
+    return dict(
+        http2=_http2_available(),
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections,
+                            keepalive_expiry=keepalive_expiry),
+        timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+    )
+
+
+def _get_client(use_async: bool, max_connections: int, max_keepalive_connections: int, keepalive_expiry: float,
+                connect_timeout: float, read_timeout: float, max_retries: int):
+    settings = (max_connections, max_keepalive_connections, keepalive_expiry, connect_timeout, read_timeout, max_retries)
+    with _clients_lock:
+        client = _shared_clients.get((use_async, settings))
+        if client is None:
+            _load_env()
+            http_kwargs = _http_client_kwargs(max_connections, max_keepalive_connections, keepalive_expiry,
+                                              connect_timeout, read_timeout)
+            timeout = http_kwargs["timeout"]
+            if use_async:
+                client = anthropic.AsyncAnthropic(http_client=httpx.AsyncClient(**http_kwargs), timeout=timeout,
+                                                  max_retries=max_retries)
+            else:
+                client = anthropic.Anthropic(http_client=httpx.Client(**http_kwargs), timeout=timeout,
+                                             max_retries=max_retries)
+            _shared_clients[(use_async, settings)] = client
+        return client
+
+
+def start_client(max_connections: int = CLIENT_MAX_CONNECTIONS, max_keepalive_connections: int = CLIENT_MAX_KEEPALIVE_CONNECTIONS,
+                 keepalive_expiry: float = CLIENT_KEEPALIVE_EXPIRY, connect_timeout: float = CLIENT_CONNECT_TIMEOUT,
+                 read_timeout: float = CLIENT_READ_TIMEOUT, max_retries: int = CLIENT_MAX_RETRIES) -> anthropic.Anthropic:
+
+    """
+    Returns the process-wide Claude client for these connection settings, creating it on first use.
+    Every caller (`ModBot`, `ModReview` through the bot, `ModelInference`) shares the same keep-alive
+    connection pool, which uses HTTP/2 when `h2` is installed and HTTP/1.1 otherwise.
+
+    Args:
+        max_connections (int): Maximum number of simultaneous connections. Keep it at or above the number of
+                               concurrent requests, e.g. `max_concurrency` in `evaluate_file_concurrent()`.
+        max_keepalive_connections (int): Maximum number of idle connections kept open for reuse.
+        keepalive_expiry (float): Seconds an idle connection stays in the pool.
+        connect_timeout (float): Seconds to establish a connection.
+        read_timeout (float): Seconds to wait for a response.
+        max_retries (int): Retries done by the SDK on transient errors, with its own backoff.
+    """
+    return _get_client(False, max_connections, max_keepalive_connections, keepalive_expiry, connect_timeout,
+                       read_timeout, max_retries)
+
+
+def start_async_client(max_connections: int = CLIENT_MAX_CONNECTIONS, max_keepalive_connections: int = CLIENT_MAX_KEEPALIVE_CONNECTIONS,
+                       keepalive_expiry: float = CLIENT_KEEPALIVE_EXPIRY, connect_timeout: float = CLIENT_CONNECT_TIMEOUT,
+                       read_timeout: float = CLIENT_READ_TIMEOUT, max_retries: int = CLIENT_MAX_RETRIES) -> anthropic.AsyncAnthropic:
+
+    """
+    Async counterpart of `start_client()`. The async client must only be used from one event loop.
+    """
+    return _get_client(True, max_connections, max_keepalive_connections, keepalive_expiry, connect_timeout,
+                       read_timeout, max_retries)
+
+
+async def close_clients():
+    """
+    Closes every shared client and its connection pool, e.g. when the bot shuts down.
+    """
+    with _clients_lock:
+        clients = list(_shared_clients.values())
+        _shared_clients.clear()
+    for client in clients:
+        if isinstance(client, anthropic.AsyncAnthropic):
+            await client.close()
+        else:
+            client.close()
+
+
+def build_request_params(moderator_context: str, input_message: str, prompt_prepend: str,
+                         model: str = DEFAULT_MODEL, temperature: float = DEFAULT_TEMPERATURE, cache_prompt: bool = True,
+                         max_tokens: int = DEFAULT_MAX_TOKENS, stop_sequences: list = None, tools: list = None,
+                         tool_choice: dict = None) -> dict:
+
+    """
+    Builds the keyword arguments of a `messages.create` request. Shared by the interactive calls below and
+    the Message Batches requests in `batch_mode.py`, so both send exactly the same prompt.
+
+    With `cache_prompt`, the static system prompt and `prompt_prepend` are sent as separate blocks marked with
+    cache control, so repeated calls read them from the prompt cache instead of paying for them again. The
+    model sees the same text either way. Prefixes shorter than the model's minimum cacheable length are
+    simply not cached by the API.
+
+    Args:
+        tools (list): Tool definitions the model may call, e.g. `VERDICT_TOOL`.
+        tool_choice (dict): Forces a specific tool call, e.g. `VERDICT_TOOL_CHOICE`.
+
+        see `prompt_claude()` for the remaining args.
+    """
+    if not cache_prompt:
+        system = moderator_context
+        content = [
+            {
+                "type": "text",
+                "text": f"{prompt_prepend}{input_message}"
+            }
+        ]
+    else:
+        system = [
+            {
+                "type": "text",
+                "text": moderator_context,
+                "cache_control": CACHE_CONTROL
+            }
+        ]
+        content = []
+        if prompt_prepend:
+            content.append({
+                "type": "text",
+                "text": prompt_prepend,
+                "cache_control": CACHE_CONTROL
+            })
+        content.append({
+            "type": "text",
+            "text": input_message
+        })
+
+    params = dict(
+        model=model,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        system=system,
+        messages=[
+            {
+                "role": "user",
+                "content": content
+            }
+        ]
     )
-    return client
+    if stop_sequences:
+        params["stop_sequences"] = stop_sequences
+    if tools:
+        params["tools"] = tools
+    if tool_choice:
+        params["tool_choice"] = tool_choice
+    return params
 
 
-def prompt_claude(moderator_context: str, input_message: str, prompt_prepend: str, client: anthropic.Anthropic):
+def prompt_claude(moderator_context: str, input_message: str, prompt_prepend: str, client: anthropic.Anthropic,
+                  model: str = DEFAULT_MODEL, temperature: float = DEFAULT_TEMPERATURE, cache_prompt: bool = True,
+                  max_tokens: int = DEFAULT_MAX_TOKENS, stop_sequences: list = None):
     
     """
     Prompts Claude in order to receive out a text result from the model.
 
     Args:
-        moderator_context (str): A description of the role that Claude should take on. See `src/constants.py` for an example. 
+        moderator_context (str): A description of the role that Claude should take on. See `llm_prompt/constants.py` for an example. 
                                  This provides context for Claude that allows us to manipulate it to act as a certain role, e.g. moderator
         input_message (str): An input to Claude, AKA the prompt. In the case of classification, this is the user message from the Discord channel.
         prompt_prepend (str): Context that is provided to Claude about the problem at hand. This includes instructions on how to handle the input, what to do,
                               how to formulate a response, etc.
         client (Anthropic): The client object to access Claude through.
+        model (str): Name of the Claude model to query.
+        temperature (float): Sampling temperature. Defaults to 0 so classifications are reproducible.
+        cache_prompt (bool): Mark `moderator_context` and `prompt_prepend` as cacheable prompt prefixes, see `build_request_params()`.
+        max_tokens (int): Maximum number of output tokens. Keep it tight for short, fixed-format answers.
+        stop_sequences (list): Strings that end generation early, e.g. `VERDICT_STOP_SEQUENCES`.
     """
 
-    message = client.messages.create(
-    model="claude-3-opus-20240229",
-    max_tokens=1000,
-    temperature=0,
-    system=moderator_context,
-    messages=[
-        {
-            "role": "user",
-            "content": [
-                {
-                    "type": "text",
-                    "text": f"{prompt_prepend}{input_message}"
-                }
-            ]
-        }
-    ]
-    )
+    start = time.monotonic()
+    message = client.messages.create(**build_request_params(moderator_context, input_message, prompt_prepend, model, temperature,
+                                                            cache_prompt, max_tokens, stop_sequences))
+    usage_stats.record(message, time.monotonic() - start)
+    return message
+
+
+def cached_prompt_claude(moderator_context: str, input_message: str, prompt_prepend: str, client: anthropic.Anthropic,
+                         cache=None, model: str = DEFAULT_MODEL, temperature: float = DEFAULT_TEMPERATURE,
+                         max_tokens: int = DEFAULT_MAX_TOKENS, stop_sequences: list = None) -> str:
+
+    """
+    Same as `prompt_claude()`, but returns only the response text and consults a `VerdictCache` first,
+    so reposted content is answered without another model call.
+
+    Args:
+        cache (VerdictCache): Shared verdict cache, see `verdict_cache.py`. If None, the model is always queried.
+
+        see `prompt_claude()` for the remaining args.
+    """
+    if cache is None:
+        return prompt_claude(moderator_context, input_message, prompt_prepend, client, model=model, temperature=temperature,
+                             max_tokens=max_tokens, stop_sequences=stop_sequences).content[0].text
+
+    fingerprint = prompt_fingerprint(moderator_context, prompt_prepend, model=model, temperature=temperature)
+    cached = cache.get(input_message, fingerprint)
+    if cached is not None:
+        return cached
+
+    result = prompt_claude(moderator_context, input_message, prompt_prepend, client, model=model, temperature=temperature,
+                           max_tokens=max_tokens, stop_sequences=stop_sequences)
+    response_text = result.content[0].text
+    cache.put(input_message, fingerprint, response_text)
+    return response_text
+
+
+async def prompt_claude_async(moderator_context: str, input_message: str, prompt_prepend: str, client: anthropic.AsyncAnthropic,
+                              model: str = DEFAULT_MODEL, temperature: float = DEFAULT_TEMPERATURE, cache_prompt: bool = True,
+                              max_tokens: int = DEFAULT_MAX_TOKENS, stop_sequences: list = None):
+
+    """
+    Async counterpart of `prompt_claude()`. Awaits the model response without blocking the event loop,
+    so it is safe to call from inside discord.py handlers.
+
+    Args:
+        moderator_context (str): A description of the role that Claude should take on. See `prompt_claude()`.
+        input_message (str): An input to Claude, AKA the prompt.
+        prompt_prepend (str): Context that is provided to Claude about the problem at hand.
+        client (AsyncAnthropic): The async client object to access Claude through, see `start_async_client()`.
+        model (str): Name of the Claude model to query.
+        temperature (float): Sampling temperature.
+        cache_prompt (bool): Mark the static prompt parts as cacheable, see `build_request_params()`.
+        max_tokens (int): Maximum number of output tokens.
+        stop_sequences (list): Strings that end generation early.
+    """
+
+    start = time.monotonic()
+    message = await client.messages.create(**build_request_params(moderator_context, input_message, prompt_prepend, model, temperature,
+                                                                  cache_prompt, max_tokens, stop_sequences))
+    usage_stats.record(message, time.monotonic() - start)
     return message
 
 
+def classify_verdict(moderator_context: str, input_message: str, prompt_prepend: str, client: anthropic.Anthropic,
+                     model: str = DEFAULT_MODEL, temperature: float = DEFAULT_TEMPERATURE, tier=None) -> Verdict:
+
+    """
+    Classifies a message and returns a typed `Verdict`. The model is forced to answer through the `record_verdict`
+    tool, so the answer is schema-checked JSON (including a confidence) instead of free text.
+
+    Args:
+        tier (ModelTier): If given, the call's latency and token usage are recorded on it, see `model_cascade.py`.
+
+        see `prompt_claude()` for the remaining args.
+    """
+    start = time.monotonic()
+    message = client.messages.create(**build_request_params(moderator_context, input_message, prompt_prepend, model, temperature,
+                                                            max_tokens=VERDICT_TOOL_MAX_TOKENS, tools=[VERDICT_TOOL],
+                                                            tool_choice=VERDICT_TOOL_CHOICE))
+    if tier is not None:
+        tier.record(message, time.monotonic() - start)
+    usage_stats.record(message, time.monotonic() - start)
+    return verdict_from_message(message)
+
+
+async def classify_verdict_async(moderator_context: str, input_message: str, prompt_prepend: str, client: anthropic.AsyncAnthropic,
+                                 model: str = DEFAULT_MODEL, temperature: float = DEFAULT_TEMPERATURE, tier=None) -> Verdict:
+
+    """
+    Async counterpart of `classify_verdict()`.
+    """
+    start = time.monotonic()
+    message = await client.messages.create(**build_request_params(moderator_context, input_message, prompt_prepend, model, temperature,
+                                                                  max_tokens=VERDICT_TOOL_MAX_TOKENS, tools=[VERDICT_TOOL],
+                                                                  tool_choice=VERDICT_TOOL_CHOICE))
+    if tier is not None:
+        tier.record(message, time.monotonic() - start)
+    usage_stats.record(message, time.monotonic() - start)
+    return verdict_from_message(message)
+
+
 def main():
 
     """
@@ -0,0 +1,118 @@
+import re
+from typing import Optional
+
+VERDICT_CATEGORIES = ["graphic", "logistical", "propaganda", "threat", "other", "invalid"]
+
+# Enough for "<yes/no> <category>"; the answer is cut off instead of rambling on
+VERDICT_MAX_TOKENS = 10
+VERDICT_STOP_SEQUENCES = ["\n"]
+
+# Tolerates case, punctuation and an optional trailing confidence, e.g. "Yes, propaganda." or "no invalid 0.93"
+VERDICT_PATTERN = re.compile(r"^\W*(yes|no)\b\W*([a-z]+)?(?:\W+(\d*\.?\d+))?", re.IGNORECASE)
+
+VERDICT_TOOL_NAME = "record_verdict"
+VERDICT_TOOL = {
+    "name": VERDICT_TOOL_NAME,
+    "description": "Record whether the message is terrorist recruitment content, its category, and how confident you are.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "flagged": {
+                "type": "boolean",
+                "description": "True if the message is related to terrorist recruitment.",
+            },
+            "category": {
+                "type": "string",
+                "enum": VERDICT_CATEGORIES,
+                "description": "Category of the content; \"invalid\" if it does not promote terrorism.",
+            },
+            "confidence": {
+                "type": "number",
+                "minimum": 0,
+                "maximum": 1,
+                "description": "Confidence in this verdict, between 0 and 1.",
+            },
+        },
+        "required": ["flagged", "category", "confidence"],
+    },
+}
+VERDICT_TOOL_CHOICE = {"type": "tool", "name": VERDICT_TOOL_NAME}
+VERDICT_TOOL_MAX_TOKENS = 100
+
+
+class Verdict:
+    """
+    Typed result of classifying a message.
+    """
+    __slots__ = ("flagged", "category", "confidence", "source")
+
+    def __init__(self, flagged: bool, category: str, confidence: Optional[float] = None, source: str = "llm"):
+        """
+        Args:
+            flagged (bool): Whether the message is related to terrorist recruitment.
+            category (str): One of `VERDICT_CATEGORIES`.
+            confidence (float): Model confidence in [0, 1], if known.
+            source (str): "llm", "prefilter" if the local pre-filter short-circuited it as benign, "local" if it
+                          came from the fallback classifier while the LLM was unavailable, or "near_duplicate" if
+                          it was reused from a near-identical earlier message.
+        """
+        self.flagged = flagged
+        self.category = category
+        self.confidence = confidence
+        self.source = source
+
+    def to_text(self) -> str:
+        # Canonical `<yes/no> <category> [confidence]` form, used as the cached representation
+        text = f"{'yes' if self.flagged else 'no'} {self.category}"
+        if self.confidence is not None:
+            text += f" {self.confidence:.2f}"
+        return text
+
+    def __eq__(self, other):
+        return isinstance(other, Verdict) and (self.flagged, self.category, self.confidence) == (other.flagged, other.category, other.confidence)
+
+    def __repr__(self):
+        return f"Verdict(flagged={self.flagged}, category={self.category!r}, confidence={self.confidence})"
+
+
+def parse_verdict(text: str) -> Optional[Verdict]:
+    """
+    Parses a `<yes/no> <category>` answer. A missing or unknown category falls back to "invalid"
+    for "no" and "other" for "yes".
+
+    Returns:
+        Verdict: The parsed verdict, or None if the text doesn't start with yes/no.
+    """
+    match = VERDICT_PATTERN.match(text or "")
+    if not match:
+        return None
+
+    flagged = match.group(1).lower() == "yes"
+    category = (match.group(2) or "").lower()
+    if category not in VERDICT_CATEGORIES:
+        category = "other" if flagged else "invalid"
+
+    confidence = None
+    if match.group(3) is not None:
+        confidence = min(1.0, max(0.0, float(match.group(3))))
+    return Verdict(flagged, category, confidence)
+
+
+def verdict_from_message(message) -> Optional[Verdict]:
+    """
+    Extracts the verdict from a model response, either from a `record_verdict` tool call or from its text.
+    """
+    for block in message.content:
+        if getattr(block, "type", None) == "tool_use" and block.name == VERDICT_TOOL_NAME:
+            verdict_input = block.input
+            category = verdict_input.get("category")
+            flagged = bool(verdict_input.get("flagged"))
+            if category not in VERDICT_CATEGORIES:
+                category = "other" if flagged else "invalid"
+            confidence = verdict_input.get("confidence")
+            return Verdict(flagged, category, float(confidence) if confidence is not None else None)
+
+    for block in message.content:
+        if getattr(block, "type", None) == "text":
+            return parse_verdict(block.text)
+    return None
@@ -0,0 +1,193 @@
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger('modbot.verdict_cache')
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes a message so trivially different reposts (case, unicode forms, whitespace) share a cache entry.
+    """
+    text = unicodedata.normalize("NFKC", text)
+    return " ".join(text.lower().split())
+
+
+def prompt_fingerprint(moderator_context: str, prompt_prepend: str, model: str, temperature: float) -> str:
+    """
+    Identifies the prompt/model configuration a verdict was produced with. Changing any of these
+    produces a different fingerprint, so stale verdicts are never served for a new prompt.
+    """
+    digest = hashlib.sha256()
+    for part in (moderator_context, prompt_prepend, model, repr(float(temperature))):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()[:16]
+
+
+class VerdictCache:
+    """
+    LRU + TTL cache of model verdicts, keyed by normalized message text and prompt fingerprint.
+
+    Optionally backed by a SQLite file so verdicts survive restarts. The in-memory LRU is the source of
+    truth for lookups; the database is only read once on startup and written on `put()`. Once `start()` has
+    been called from an event loop, writes are buffered instead and committed in batches every `flush_interval`
+    seconds from a worker thread, so `put()` never touches the disk on the event loop.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 24 * 60 * 60, db_path: Optional[str] = None,
+                 flush_interval: float = 1.0):
+        """
+        Args:
+            max_entries (int): Maximum number of verdicts kept in memory. Least recently used entries are evicted first.
+            ttl (float): Number of seconds a verdict stays valid.
+            db_path (str): Path of a SQLite file to persist verdicts to. If None, the cache is memory-only.
+            flush_interval (float): After `start()`, seconds between batched writes. Bounds what a hard crash loses.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.entries = OrderedDict()   # key -> (verdict, created_at)
+        self.lock = threading.Lock()   # `ModelInference` may share the cache across threads
+        self.db_lock = threading.Lock()   # serializes writes of the flush thread with `close()`
+        self.pending = {}              # key -> (verdict, created_at) not yet written to the database
+        self.flush_task = None
+
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.db = None
+        if db_path is not None:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS verdicts (key TEXT PRIMARY KEY, verdict TEXT NOT NULL, created_at REAL NOT NULL)")
+            self._load()
+
+    @staticmethod
+    def make_key(text: str, fingerprint: str) -> str:
+        return hashlib.sha256(f"{fingerprint}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def get(self, text: str, fingerprint: str) -> Optional[str]:
+        key = self.make_key(text, fingerprint)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            verdict, created_at = entry
+            if time.time() - created_at > self.ttl:
+                del self.entries[key]
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return verdict
+
+    def put(self, text: str, fingerprint: str, verdict: str):
+        key = self.make_key(text, fingerprint)
+        created_at = time.time()
+        with self.lock:
+            self._insert(key, verdict, created_at)
+            if self.db is not None:
+                self.pending[key] = (verdict, created_at)
+        if self.flush_task is None:
+            self.flush()   # no background writer; write through
+
+    def start(self):
+        """
+        Starts batching database writes in the background. Must be called from inside a running event loop
+        (e.g. `setup_hook`).
+        """
+        if self.db is not None and self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._flush_loop(), name="verdict-cache-flush")
+
+    def flush(self):
+        """
+        Writes the buffered verdicts to the database. Blocking; called from a worker thread once `start()`ed.
+        """
+        with self.lock:
+            rows, self.pending = self.pending, {}
+        if not rows:
+            return
+        with self.db_lock:
+            if self.db is None:
+                return
+            try:
+                self.db.executemany("INSERT OR REPLACE INTO verdicts (key, verdict, created_at) VALUES (?, ?, ?)",
+                                    [(key, verdict, created_at) for key, (verdict, created_at) in rows.items()])
+                self.db.commit()
+            except sqlite3.Error:
+                self.db.rollback()
+                with self.lock:
+                    # Keep them for the next flush, unless a newer verdict was put in the meantime
+                    for key, row in rows.items():
+                        self.pending.setdefault(key, row)
+                raise
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate(),
+        }
+
+    def close(self):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        if self.db is not None:
+            try:
+                self.flush()
+            except sqlite3.Error:
+                logger.exception("Failed to write %d buffered verdicts on close", len(self.pending))
+            with self.db_lock:
+                self.db.close()
+                self.db = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _insert(self, key: str, verdict: str, created_at: float):
+        self.entries[key] = (verdict, created_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    async def _flush_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if not self.pending:
+                continue
+            try:
+                await loop.run_in_executor(None, self.flush)
+            except sqlite3.Error:
+                logger.exception("Failed to persist verdicts, will retry")
+
+    def _load(self):
+        # Drop expired rows, then warm the LRU with the most recent verdicts (oldest first so recency order is kept)
+        cutoff = time.time() - self.ttl
+        self.db.execute("DELETE FROM verdicts WHERE created_at < ?", (cutoff,))
+        self.db.commit()
+        rows = self.db.execute("SELECT key, verdict, created_at FROM verdicts ORDER BY created_at DESC LIMIT ?",
+                               (self.max_entries,)).fetchall()
+        for key, verdict, created_at in reversed(rows):
+            self._insert(key, verdict, created_at)
@@ -0,0 +1,110 @@
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import time
+from typing import Mapping
+
+# Loggers of the bot's own subsystems live under "modbot"; the discord.py library logs under "discord"
+DEFAULT_LEVELS = {
+    "discord": logging.INFO,
+    "discord.gateway": logging.WARNING,   # heartbeats and resumes are very chatty
+    "modbot": logging.INFO,
+    "modbot.messages": logging.INFO,      # one record per channel message, sampled
+}
+
+MESSAGE_LOGGER = "modbot.messages"
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, with any `extra={...}` fields of the call included as top-level keys.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _StructuredQueueHandler(logging.handlers.QueueHandler):
+    # The stock handler bakes the traceback into the message text; keep it separate for the JSON record
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a random `rate` fraction of records below `always_level`, for high-volume events such as
+    one record per channel message. Warnings and errors always pass.
+    """
+
+    def __init__(self, rate: float, always_level: int = logging.WARNING):
+        super().__init__()
+        self.rate = rate
+        self.always_level = always_level
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= self.always_level or random.random() < self.rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+def setup_logging(path: str = "discord.log", max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5,
+                  levels: Mapping[str, int] = DEFAULT_LEVELS, message_sample_rate: float = 0.05) -> logging.handlers.QueueListener:
+    """
+    Routes all logging through an in-memory queue to a background thread that writes JSON lines to a
+    size-rotated file, so a log call on the event loop never waits for disk I/O.
+
+    Args:
+        path (str): Log file. Rotated to `path.1`, `path.2`, ... once it exceeds `max_bytes`.
+        max_bytes (int): Maximum size of the current log file.
+        backup_count (int): Number of rotated files to keep.
+        levels (Mapping[str, int]): Level per logger name, e.g. {"modbot.review": logging.DEBUG}.
+        message_sample_rate (float): Fraction of `modbot.messages` records below WARNING that are kept.
+
+    Returns:
+        QueueListener: Already started; call `stop()` on shutdown to flush the remaining records.
+    """
+    file_handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                                        encoding="utf-8", delay=True)
+    file_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _StructuredQueueHandler(log_queue)
+    listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    root.setLevel(logging.WARNING)
+    root.addHandler(queue_handler)
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+    logging.getLogger(MESSAGE_LOGGER).addFilter(SamplingFilter(message_sample_rate))
+
+    listener.start()
+    return listener
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Tuple
+
+import discord
+
+logger = logging.getLogger('modbot.resolver')
+
+
+class UnresolvedMessage(Exception):
+    """
+    Raised when a linked message can't be fetched. `reason` says which part of the link failed:
+    "guild" (the bot is not in it), "channel" or "message" (deleted, never existed or not readable).
+    """
+
+    def __init__(self, reason: str, key: Tuple[int, int, int]):
+        super().__init__(f"Could not resolve {reason} of message link {key}")
+        self.reason = reason
+        self.key = key
+
+
+class MessageResolver:
+    """
+    Fetches the messages reports link to. Repeated reports of the same post are served from a bounded LRU cache,
+    and concurrent requests for a message that is already being fetched wait for that fetch instead of sending
+    another REST request.
+    """
+
+    def __init__(self, client: discord.Client, max_entries: int = 2048, ttl: float = 300.0):
+        """
+        Args:
+            client (discord.Client): Used to look up guilds and channels.
+            max_entries (int): Maximum number of cached messages; least recently used are evicted.
+            ttl (float): Seconds a fetched message is served from cache, so later edits are eventually picked up.
+        """
+        self.client = client
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self.cache = OrderedDict()   # (guild id, channel id, message id) -> (fetched at, message)
+        self.in_flight = {}          # (guild id, channel id, message id) -> fetch task
+
+        # counters
+        self.hits = 0
+        self.coalesced = 0
+        self.fetches = 0
+        self.failures = 0
+
+    async def resolve(self, guild_id: int, channel_id: int, message_id: int) -> discord.Message:
+        """
+        Raises:
+            UnresolvedMessage: If the guild, channel or message can't be found.
+        """
+        key = (guild_id, channel_id, message_id)
+        cached = self.cache.get(key)
+        if cached is not None:
+            fetched_at, message = cached
+            if time.monotonic() - fetched_at < self.ttl:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return message
+            del self.cache[key]
+
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(key))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda done: self._fetched(key, done))
+        else:
+            self.coalesced += 1
+        # A caller giving up must not cancel the fetch others are waiting on
+        return await asyncio.shield(task)
+
+    async def resolve_many(self, keys: Iterable[Tuple[int, int, int]]) -> List:
+        """
+        Resolves several links concurrently.
+
+        Returns:
+            list: The message, or the `UnresolvedMessage` raised, for each key in order.
+        """
+        return await asyncio.gather(*(self.resolve(*key) for key in keys), return_exceptions=True)
+
+    def invalidate(self, guild_id: int, channel_id: int, message_id: int):
+        self.cache.pop((guild_id, channel_id, message_id), None)
+
+    def hit_rate(self) -> float:
+        requests = self.hits + self.coalesced + self.fetches
+        return (self.hits + self.coalesced) / requests if requests else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.cache),
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "fetches": self.fetches,
+            "failures": self.failures,
+            "hit_rate": self.hit_rate(),
+        }
+
+    async def _fetch(self, key: Tuple[int, int, int]) -> discord.Message:
+        guild_id, channel_id, message_id = key
+        self.fetches += 1
+        guild = self.client.get_guild(guild_id)
+        if not guild:
+            raise UnresolvedMessage("guild", key)
+        channel = guild.get_channel(channel_id)
+        if not channel:
+            raise UnresolvedMessage("channel", key)
+        try:
+            return await channel.fetch_message(message_id)
+        except discord.errors.HTTPException as e:
+            logger.info("Could not fetch linked message %s: %s", key, e)
+            raise UnresolvedMessage("message", key) from e
+
+    def _fetched(self, key: Tuple[int, int, int], task: asyncio.Task):
+        self.in_flight.pop(key, None)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self.failures += 1
+            return
+        self.cache[key] = (time.monotonic(), task.result())
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
@@ -1,10 +1,86 @@
 from enum import Enum, auto
+import asyncio
 import discord
+import logging
 import re
 
-from llm_prompt.prompt_claude import prompt_claude
+from circuit_breaker import CircuitOpenError
+from metrics import observe_latency
+from state_machine import FlowEngine, Step, choice
+from llm_prompt.prompt_claude import cached_prompt_claude
+from llm_prompt.verdict import VERDICT_STOP_SEQUENCES
 import llm_prompt.constants as constants
 
+DECISION_MAX_TOKENS = 10   # "Indefinite suspension" and friends are only a few tokens
+SUSPENSION_PATTERN = re.compile(r'\d+|indefinite', re.IGNORECASE)
+
+logger = logging.getLogger('modbot.review')
+
+CLAUDE_DECISION_PREP = "Review the report below and determine the necessary action based on the content's severity and implications. Choose the most appropriate response from the options provided. Answer 'Immediate threat', '1 day suspension', '7 days suspension', '30 days suspension', 'Indefinite suspension'. No explanation needed.\n\n"
+
+URGENCY_QUESTION = "Does this report represent an immediate threat? (yes/no)"
+
+SUSPENSION_OPTIONS = {
+    "1": "User suspended for 1 day.",
+    "2": "User suspended for 7 days.",
+    "3": "User suspended for 30 days.",
+    "4": "User suspended indefinitely.",
+    "5": "No suspension required.",
+}
+
+FINAL_DECISION_REPLY = "Final review decisions have been made. The review process is now complete."
+
+# (is_automated_review, is_claude_review) -> offer to continue with the next report of the same kind
+NEXT_REPORT_PROMPTS = {
+    (True, False): "Do you want to review another automated report? (yes/no)",
+    (False, False): "Do you want to review the next user report? (yes/no)",
+    (True, True): "Do you want to automatically review another automated report? (yes/no)",
+    (False, True): "Do you want to automatically review another user report? (yes/no)",
+}
+
+
+def is_yes(content):
+    return content.lower() == "yes"
+
+
+def format_user_report(report_data):
+    urgent = "Yes" if report_data["urgent"] else "No"
+    # Duplicate reports of the same post are merged into one item, see `ReportCoalescer`
+    reporters = report_data.get("reporters", 1)
+    contexts = report_data.get("contexts") or []
+    if reporters > 1 and contexts:
+        context = "".join(f"\n- {context}" for context in contexts)
+    else:
+        context = report_data['context'] or 'No additional context provided'
+    detection = report_data.get("automated_detection")
+    return (
+        f"**Reviewing Report:**\n\n"
+        + (f"**Reported by:** {reporters} users\n" if reporters > 1 else "")
+        + f"**Organization:** {report_data['organization_name'] or 'Unknown'}\n"
+        f"**Category:** {report_data['category'] or 'Not Specified'}\n"
+        f"**Context:** {context}\n"
+        f"**Location:** {report_data['location'] or 'Location not specified'}\n"
+        f"**Suspect:** {report_data['suspect'] or 'Suspect information not provided'}\n"
+        f"**Urgency:** {urgent}\n"
+        f"**Group Size:** {report_data['size'] or 'Not specified'}\n"
+        + (f"**Also flagged by the classifier:** {detection['threat_level']} "
+           f"({detection['occurrences']} occurrence(s))\n" if detection else "")
+        + f"\n**Content:**\n{report_data['post_content'] or 'No content provided'}\n"
+    )
+
+
+def format_occurrences(report_data):
+    # Automated detections of the same content are merged into one item, see `ReportCoalescer`
+    occurrences = report_data.get("occurrences", 1)
+    if occurrences <= 1:
+        return ""
+    reply = f"**Occurrences:** {occurrences} (authors: {', '.join(map(str, report_data.get('authors') or []))})\n"
+    variants = report_data.get("variants")
+    if variants:
+        reply += "**Variants:**" + "".join(f"\n- {variant}" for variant in variants) + "\n"
+    return reply
+
+
 class State(Enum):
     REVIEW_START = auto()
     REVIEW_COMPLETE = auto()
@@ -17,6 +93,10 @@ class State(Enum):
     REPORT_LINK = auto()
 
 
+# States in which a report has been taken off its queue but the moderator hasn't decided on it yet
+UNDECIDED_STATES = frozenset([State.CHECK_URGENCY, State.DETERMINE_SUSPENSION_DURATION, State.REPORT_AUTHORITIES])
+
+
 class ModReview:
     START_KEYWORD = "review"
     START_AUTO_KEYWORD = "detected review"
@@ -24,213 +104,207 @@ class ModReview:
     CLAUDE_REVIEW_KEYWORD = "automate review"
     CLAUDE_AUTO_REVIEW_KEYWORD = "claude review"
     HELP_KEYWORD = "help"
+    CLASSIFIER_STATS_KEYWORD = "classifier stats"
+    QUEUE_STATS_KEYWORD = "queue stats"
+
+    # One instance per moderator with an open review, see `SessionStore`
+    __slots__ = ("state", "client", "report_data", "is_automated_review", "is_claude_review")
 
     def __init__(self, client):
         self.state = State.REVIEW_START
         self.client = client
-        self.message = None
         self.report_data = None
         self.is_automated_review = False
         self.is_claude_review = False
 
+    @observe_latency("mod_review_handle_message")
     async def handle_message(self, message):
         if message.content == self.CANCEL_KEYWORD:
             return ["Review process has been terminated.", self.state_to_review_complete()]
 
-        if message.content.startswith(self.START_KEYWORD):
-            self.is_automated_review = False
-            if not self.client.to_be_reviewed:
-                return ["No more reports to review.", self.state_to_review_complete()]
-
-            self.report_data = self.client.to_be_reviewed.pop(0)
-            post_content = self.report_data["post_content"]
-            organization_name = self.report_data["organization_name"]
-            category = self.report_data["category"]
-            context = self.report_data["context"]
-            location = self.report_data["location"]
-            suspect = self.report_data["suspect"]
-            urgent = "Yes" if self.report_data["urgent"] else "No"
-            size = self.report_data["size"]
-
-            formatted_message = (
-                f"**Reviewing Report:**\n\n"
-                f"**Organization:** {organization_name or 'Unknown'}\n"
-                f"**Category:** {category or 'Not Specified'}\n"
-                f"**Context:** {context or 'No additional context provided'}\n"
-                f"**Location:** {location or 'Location not specified'}\n"
-                f"**Suspect:** {suspect or 'Suspect information not provided'}\n"
-                f"**Urgency:** {urgent}\n"
-                f"**Group Size:** {size or 'Not specified'}\n\n"
-                f"**Content:**\n{post_content or 'No content provided'}\n\n"
-                f"Does this report represent an immediate threat? (yes/no)"
-            )
-            self.state = State.CHECK_URGENCY
-            return [formatted_message]
-        
-        if message.content.startswith(self.START_AUTO_KEYWORD):
-            self.is_automated_review = True
-
-            if not self.client.to_be_reviewed_automated:
-                return ["No automated reports to review.", self.state_to_review_complete()]
-            
-            self.report_data = self.client.to_be_reviewed_automated.pop(0)
-            post_content = self.report_data["post_content"]
-            threat_level = self.report_data.get("threat_level", "Not specified")
-            author = self.report_data["author"]
-            channel = self.report_data["channel"]
-
-            formatted_message = (
-                f"**Reviewing Report:**\n\n"
-                f"**Author:** {author}\n"
-                f"**Channel:** {channel}\n"
-                f"**Threat Level:** {threat_level}\n\n"
-                f"**Content:**\n{post_content}\n\n"
-                f"Does this report represent an immediate threat? (yes/no)"
-            )
-            self.state = State.CHECK_URGENCY
-            return [formatted_message]
-        
-        if message.content.startswith(self.CLAUDE_REVIEW_KEYWORD):
-             self.is_automated_review = False
-             self.is_claude_review = True
-
-             if not self.client.to_be_reviewed:
-                return ["No more reports to review.", self.state_to_review_complete()]
-             
-             self.report_data = self.client.to_be_reviewed.pop(0)
-             post_content = self.report_data["post_content"]
-             organization_name = self.report_data["organization_name"]
-             category = self.report_data["category"]
-             context = self.report_data["context"]
-             location = self.report_data["location"]
-             suspect = self.report_data["suspect"]
-             urgent = "Yes" if self.report_data["urgent"] else "No"
-             size = self.report_data["size"]
-
-             formatted_message = (
-                    f"**Reviewing Report:**\n\n"
-                    f"**Organization:** {organization_name or 'Unknown'}\n"
-                    f"**Category:** {category or 'Not Specified'}\n"
-                    f"**Context:** {context or 'No additional context provided'}\n"
-                    f"**Location:** {location or 'Location not specified'}\n"
-                    f"**Suspect:** {suspect or 'Suspect information not provided'}\n"
-                    f"**Urgency:** {urgent}\n"
-                    f"**Group Size:** {size or 'Not specified'}\n\n"
-                    f"**Content:**\n{post_content or 'No content provided'}\n"
-             )
-
-             prompt_prepend = "Review the report below and determine the necessary action based on the content's severity and implications. Choose the most appropriate response from the options provided. Answer 'Immediate threat', '1 day suspension', '7 days suspension', '30 days suspension', 'Indefinite suspension'. No explanation needed.\n\n"
-             
-             result = prompt_claude(moderator_context=constants.DEFAULT_MOD_CONTEXT,
-                input_message= formatted_message,
-                prompt_prepend=prompt_prepend,
-                client=self.client.claudeClient)
-             
-             resultText = result.content[0].text
-
-             if resultText == "Immediate threat":
-                return [f"Reviewing new report:\n{formatted_message}\nDecision: This has been flagged as an immediate threat. Report has been submitted to authorities. Thank you for your diligence.", self.state_to_review_complete()]
-             elif "suspension" in resultText:
-               days = re.findall(r'\d+|Indefinite', resultText)
-               if days[0] == "Indefinite":
-                    suspension_message = "User suspended indefinitely."
-               else:
-                    suspension_message = f"User suspended for {days[0]} days."
-
-               return [f"Reviewing new automated report:\n{formatted_message}\nDecision: No immediate threat detected. {suspension_message}", self.state_to_review_complete()]
-             
-        if message.content.startswith(self.CLAUDE_AUTO_REVIEW_KEYWORD):
-             self.is_automated_review = True
-             self.is_claude_review = True
-
-             if not self.client.to_be_reviewed_automated:
-                return ["No automated reports to review.", self.state_to_review_complete()]
-
-             self.report_data = self.client.to_be_reviewed_automated.pop(0)
-             post_content = self.report_data["post_content"]
-             author = self.report_data["author"]
-             channel = self.report_data["channel"]
-
-             formatted_message = (
-                f"**Reviewing Report:**\n\n"
-                f"**Author:** {author}\n"
-                f"**Channel:** {channel}\n"
-                f"**Content:**\n{post_content}\n"
-             )
-
-             prompt_prepend = "Review the report below and determine the necessary action based on the content's severity and implications. Choose the most appropriate response from the options provided. Answer 'Immediate threat', '1 day suspension', '7 days suspension', '30 days suspension', 'Indefinite suspension'. No explanation needed.\n\n"
-             
-             result = prompt_claude(moderator_context=constants.DEFAULT_MOD_CONTEXT,
-                input_message= formatted_message,
-                prompt_prepend=prompt_prepend,
-                client=self.client.claudeClient)
-            
-             resultText = result.content[0].text
-
-             if resultText == "Immediate threat":
-                return [f"Reviewing new automated report:\n{formatted_message}\nDecision: This has been flagged as an immediate threat. Report has been submitted to authorities. Thank you for your diligence.", self.state_to_review_complete()]
-             elif "suspension" in resultText:
-                days = re.findall(r'\d+|Indefinite', resultText)
-                if days[0] == "Indefinite":
-                    suspension_message = "User suspended indefinitely."
-                else:
-                    suspension_message = f"User suspended for {days[0]} days."
-
-                return [f"Reviewing new automated report:\n{formatted_message}\nDecision: No immediate threat detected. {suspension_message}", self.state_to_review_complete()]
+        # Start commands are accepted in any state
+        command = START_COMMAND_PATTERN.match(message.content)
+        if command:
+            return await START_COMMANDS[command.group(0)](self)
 
+        return await REVIEW_FLOW.dispatch(self, message)
 
+    async def start_review(self):
+        self.is_automated_review = False
+        self.is_claude_review = False
+        if not self.client.to_be_reviewed:
+            return ["No more reports to review.", self.state_to_review_complete()]
 
+        self.report_data = self.client.to_be_reviewed.pop()
+        formatted_message = format_user_report(self.report_data) + "\n" + URGENCY_QUESTION
+        self.state = State.CHECK_URGENCY
+        return [formatted_message]
 
-        if self.state == State.CHECK_URGENCY:
-            if message.content.lower() == "yes":
-                self.state = State.REPORT_AUTHORITIES
-                return ["This has been flagged as an immediate threat. A template for reporting to the FBI will be provided. Do you want to proceed with reporting to authorities? (yes/no)"]
-            else:
-                self.state = State.DETERMINE_SUSPENSION_DURATION
-                return ["No immediate threat detected. Please determine the appropriate suspension duration: (1) 1 day, (2) 7 days, (3) 30 days, (4) Indefinite, (5) Suspension not required."]
-
-        if self.state == State.DETERMINE_SUSPENSION_DURATION:
-            option = message.content
-            if option == "1":
-                return ["User suspended for 1 day.", self.state_to_final_decision()]
-            elif option == "2":
-                return ["User suspended for 7 days.", self.state_to_final_decision()]
-            elif option == "3":
-                return ["User suspended for 30 days.", self.state_to_final_decision()]
-            elif option == "4":
-                return ["User suspended indefinitely.", self.state_to_final_decision()]
-            elif option == "5":
-                return ["No suspension required.", self.state_to_final_decision()]
-            else:
-                return ["Invalid option. Please choose from (1) 1 day, (2) 7 days, (3) 30 days, (4) Indefinite"]
+    async def start_auto_review(self):
+        self.is_automated_review = True
+        self.is_claude_review = False
 
-        if self.state == State.REPORT_AUTHORITIES:
-            if message.content.lower() == "yes":
-                self.state = State.SUBMIT_REPORT
-                return ["Submitting report to authorities.", self.state_to_submit_report()]
-            else:
-                return ["No action to report to authorities.", self.state_to_review_complete()]
-
-        if self.state == State.SUBMIT_REPORT:
-            return ["Report has been submitted to authorities. Thank you for your diligence.", self.state_to_review_complete()]
-
-        if self.state == State.FINAL_DECISION:
-            reply = ["Final review decisions have been made. The review process is now complete."]
-            if self.is_automated_review and self.client.to_be_reviewed_automated and not self.is_claude_review:
-                reply.append("Do you want to review another automated report? (yes/no)")
-                self.state = State.REVIEW_START
-            elif not self.is_automated_review and self.client.to_be_reviewed and not self.is_claude_review:
-                reply.append("Do you want to review the next user report? (yes/no)")
-                self.state = State.REVIEW_START
-            elif self.is_automated_review and self.client.to_be_reviewed_automated and self.is_claude_review:
-                reply.append("Do you want to automatically review another automated report? (yes/no)")
-                self.state = State.REVIEW_START
-            elif not self.is_automated_review and self.client.to_be_reviewed and self.is_claude_review:
-                reply.append("Do you want to automatically review another user report? (yes/no)")
-                self.state = State.REVIEW_START
+        if not self.client.to_be_reviewed_automated:
+            return ["No automated reports to review.", self.state_to_review_complete()]
+        
+        self.report_data = self.client.to_be_reviewed_automated.pop()
+        matched_entities = self.report_data.get("matched_entities")
+
+        formatted_message = (
+            f"**Reviewing Report:**\n\n"
+            f"**Author:** {self.report_data['author']}\n"
+            f"**Channel:** {self.report_data['channel']}\n"
+            f"{format_occurrences(self.report_data)}"
+            f"**Threat Level:** {self.report_data.get('threat_level', 'Not specified')}\n"
+            f"**Matched Entities:** {', '.join(matched_entities) if matched_entities else 'None'}\n\n"
+            f"**Content:**\n{self.report_data['post_content']}\n\n"
+            f"{URGENCY_QUESTION}"
+        )
+        self.state = State.CHECK_URGENCY
+        return [formatted_message]
+
+    async def start_claude_review(self):
+        self.is_automated_review = False
+        self.is_claude_review = True
+
+        if not self.client.to_be_reviewed:
+            return ["No more reports to review.", self.state_to_review_complete()]
+         
+        self.report_data = self.client.to_be_reviewed.pop()
+        formatted_message = format_user_report(self.report_data)
+
+        resultText = await self.request_claude_decision(formatted_message, CLAUDE_DECISION_PREP)
+        if resultText is None:
+            return self.claude_unavailable(self.client.to_be_reviewed)
+
+        return self.apply_claude_decision(resultText, formatted_message, "Reviewing new report", self.client.to_be_reviewed)
+
+    async def start_claude_auto_review(self):
+        self.is_automated_review = True
+        self.is_claude_review = True
+
+        if not self.client.to_be_reviewed_automated:
+            return ["No automated reports to review.", self.state_to_review_complete()]
+
+        self.report_data = self.client.to_be_reviewed_automated.pop()
+        formatted_message = (
+            f"**Reviewing Report:**\n\n"
+            f"**Author:** {self.report_data['author']}\n"
+            f"**Channel:** {self.report_data['channel']}\n"
+            f"{format_occurrences(self.report_data)}"
+            f"**Content:**\n{self.report_data['post_content']}\n"
+        )
+
+        resultText = await self.request_claude_decision(formatted_message, CLAUDE_DECISION_PREP)
+        if resultText is None:
+            return self.claude_unavailable(self.client.to_be_reviewed_automated)
+
+        return self.apply_claude_decision(resultText, formatted_message, "Reviewing new automated report", self.client.to_be_reviewed_automated)
+
+    def check_urgency(self, urgent, message):
+        if urgent:
+            return ["This has been flagged as an immediate threat. A template for reporting to the FBI will be provided. Do you want to proceed with reporting to authorities? (yes/no)"]
+        return ["No immediate threat detected. Please determine the appropriate suspension duration: (1) 1 day, (2) 7 days, (3) 30 days, (4) Indefinite, (5) Suspension not required."]
+
+    def determine_suspension(self, decision, message):
+        if decision != SUSPENSION_OPTIONS["5"]:
+            self.confirm_takedown()
+        return [decision, self.state_to_final_decision()]
+
+    def invalid_suspension(self, content):
+        return ["Invalid option. Please choose from (1) 1 day, (2) 7 days, (3) 30 days, (4) Indefinite"]
+
+    def report_authorities(self, proceed, message):
+        if proceed:
+            self.confirm_takedown()
+            self.state = State.SUBMIT_REPORT
+            return ["Submitting report to authorities.", self.state_to_submit_report()]
+        return ["No action to report to authorities.", self.state_to_review_complete()]
+
+    def submit_report(self, value, message):
+        return ["Report has been submitted to authorities. Thank you for your diligence.", self.state_to_review_complete()]
+
+    def final_decision(self, value, message):
+        reply = [FINAL_DECISION_REPLY]
+        queue = self.client.to_be_reviewed_automated if self.is_automated_review else self.client.to_be_reviewed
+        if queue:
+            reply.append(NEXT_REPORT_PROMPTS[(self.is_automated_review, self.is_claude_review)])
+            self.state = State.REVIEW_START
+        else:
+            reply.append(self.state_to_review_complete())
+        return reply
+
+    def to_dict(self):
+        # Serializable snapshot of the session, see `QueueStore`
+        return {
+            "state": self.state.name,
+            "report_data": self.report_data,
+            "is_automated_review": self.is_automated_review,
+            "is_claude_review": self.is_claude_review,
+        }
+
+    @classmethod
+    def from_dict(cls, client, data):
+        review = cls(client)
+        review.state = State[data["state"]]
+        review.report_data = data["report_data"]
+        review.is_automated_review = data["is_automated_review"]
+        review.is_claude_review = data["is_claude_review"]
+        return review
+
+    async def request_claude_decision(self, formatted_message, prompt_prepend):
+        # Runs the blocking client in a thread behind the bot's circuit breaker; None if Claude is unavailable
+        try:
+            return await self.client.llm_breaker.call_async(asyncio.to_thread, cached_prompt_claude,
+                moderator_context=constants.DEFAULT_MOD_CONTEXT,
+                input_message=formatted_message,
+                prompt_prepend=prompt_prepend,
+                client=self.client.claudeClient,
+                cache=self.client.verdict_cache,
+                max_tokens=DECISION_MAX_TOKENS,
+                stop_sequences=VERDICT_STOP_SEQUENCES)
+        except CircuitOpenError:
+            return None
+        except Exception:
+            logger.exception("Claude review request failed")
+            return None
+
+    def claude_unavailable(self, queue):
+        queue.append(self.report_data)
+        manual_keyword = self.START_AUTO_KEYWORD if self.is_automated_review else self.START_KEYWORD
+        return [f"Claude is unavailable right now, so the report was returned to the queue. Use `{manual_keyword}` to review it manually.", self.state_to_review_complete()]
+
+    def apply_claude_decision(self, result_text, formatted_message, header, queue):
+        decision = result_text.strip().lower()
+        if "immediate threat" in decision:
+            return [f"{header}:\n{formatted_message}\nDecision: This has been flagged as an immediate threat. Report has been submitted to authorities. Thank you for your diligence.", self.state_to_review_complete()]
+        if "suspension" in decision:
+            days = SUSPENSION_PATTERN.findall(decision)
+            if not days or days[0] == "indefinite":
+                suspension_message = "User suspended indefinitely."
             else:
-                reply.append(self.state_to_review_complete())
-            return reply
+                suspension_message = f"User suspended for {days[0]} days."
+            return [f"{header}:\n{formatted_message}\nDecision: No immediate threat detected. {suspension_message}", self.state_to_review_complete()]
+
+        # Unrecognized answer: put the report back so a moderator can review it manually
+        queue.append(self.report_data)
+        return [f"Claude could not decide on this report (answer: `{result_text}`). It has been returned to the queue for manual review.", self.state_to_review_complete()]
+
+    def confirm_takedown(self):
+        # A moderator acted on a user report, so the organization it names is worth matching in every message
+        if not self.is_automated_review and not self.is_claude_review and self.report_data:
+            self.client.learn_organization(self.report_data.get("organization_name"))
+
+    def abandon(self):
+        """
+        Returns the report under review to its queue if no decision was made on it yet, e.g. when the
+        moderator walked away and the session expired.
+        """
+        if self.report_data is not None and self.state in UNDECIDED_STATES:
+            queue = self.client.to_be_reviewed_automated if self.is_automated_review else self.client.to_be_reviewed
+            queue.append(self.report_data)
+            self.report_data = None
+        self.state = State.REVIEW_COMPLETE
 
     def state_to_review_complete(self):
         self.state = State.REVIEW_COMPLETE
@@ -245,3 +319,22 @@ class ModReview:
 
     def review_complete(self):
         return self.state == State.REVIEW_COMPLETE
+
+
+START_COMMANDS = {
+    ModReview.START_KEYWORD: ModReview.start_review,
+    ModReview.START_AUTO_KEYWORD: ModReview.start_auto_review,
+    ModReview.CLAUDE_REVIEW_KEYWORD: ModReview.start_claude_review,
+    ModReview.CLAUDE_AUTO_REVIEW_KEYWORD: ModReview.start_claude_auto_review,
+}
+START_COMMAND_PATTERN = re.compile("|".join(re.escape(keyword) for keyword in START_COMMANDS))
+
+# state -> how the next message is validated, handled, and which state follows
+REVIEW_FLOW = FlowEngine({
+    State.CHECK_URGENCY: Step(ModReview.check_urgency, is_yes,
+                              next_state={True: State.REPORT_AUTHORITIES, False: State.DETERMINE_SUSPENSION_DURATION}),
+    State.DETERMINE_SUSPENSION_DURATION: Step(ModReview.determine_suspension, choice(SUSPENSION_OPTIONS), ModReview.invalid_suspension),
+    State.REPORT_AUTHORITIES: Step(ModReview.report_authorities, is_yes),
+    State.SUBMIT_REPORT: Step(ModReview.submit_report),
+    State.FINAL_DECISION: Step(ModReview.final_decision),
+}, default=lambda review: [])
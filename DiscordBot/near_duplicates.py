@@ -0,0 +1,232 @@
+import time
+from collections import OrderedDict
+from itertools import islice
+from typing import Optional, Tuple
+
+from llm_prompt.verdict_cache import normalize_text
+from llm_prompt.verdict import Verdict
+
+_HASH_MASK = (1 << 64) - 1
+
+
+class NearDuplicateEntry:
+    __slots__ = ("key", "signature", "band_keys", "verdict", "group", "created_at")
+
+    def __init__(self, key: int, signature: tuple, band_keys: tuple, verdict: Optional[Verdict], group: int, created_at: float):
+        self.key = key
+        self.signature = signature
+        self.band_keys = band_keys    # empty for all but the first message of a group, the only one bucketed
+        self.verdict = verdict
+        self.group = group            # message id of the first message of this group of variants
+        self.created_at = created_at
+
+
+class NearDuplicateMatch:
+    __slots__ = ("entry", "similarity")
+
+    def __init__(self, entry: NearDuplicateEntry, similarity: float):
+        self.entry = entry
+        self.similarity = similarity
+
+
+class NearDuplicateIndex:
+    """
+    Finds recent messages that are lightly edited variants of a new one, so a recruitment post reposted with a
+    few words changed reuses the first verdict instead of costing another LLM call, and its variants are
+    reviewed together.
+
+    Messages are summarized by a MinHash signature over character shingles of the normalized text. It's computed
+    with one-permutation hashing: every shingle is hashed once and only the minimum per bin is kept, with
+    empty bins borrowing from their neighbour, so a signature costs O(message length) instead of one pass per
+    hash function. The signature is split into `bands` bands; messages sharing any band land in the same
+    bucket and become candidates, and a candidate is a near-duplicate if the fraction of equal signature bins
+    (an estimate of the Jaccard similarity of the shingle sets) reaches `threshold`.
+
+    Floods of the same post must stay cheap, so only the first message of each group of variants is put in the
+    buckets (later variants are found through it and share its verdict), at most `max_candidates` of the newest
+    entries of a bucket are compared, and the first candidate at or above `threshold` is taken. A group stays
+    findable for `ttl` after its first message.
+
+    Signatures use Python's per-process string hash, so the index is in-memory only.
+    """
+
+    def __init__(self, num_bins: int = 64, bands: int = 16, shingle_size: int = 5, threshold: float = 0.8,
+                 max_entries: int = 20000, ttl: float = 24 * 60 * 60, max_candidates: int = 32):
+        """
+        Args:
+            num_bins (int): Length of the signature. Must be a multiple of `bands`.
+            bands (int): LSH bands. More bands (fewer rows each) find less similar candidates; with the defaults,
+                         pairs above ~0.5 similarity are likely to share a bucket.
+            shingle_size (int): Characters per shingle.
+            threshold (float): Minimum estimated similarity for a message to count as a near-duplicate.
+            max_entries (int): Maximum number of indexed messages; oldest are evicted.
+            ttl (float): Seconds a message stays in the index.
+            max_candidates (int): Newest entries of each matching bucket compared against a message.
+        """
+        if num_bins % bands:
+            raise ValueError(f"num_bins ({num_bins}) must be a multiple of bands ({bands})")
+        self.num_bins = num_bins
+        self.bands = bands
+        self.rows = num_bins // bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_candidates = max_candidates
+
+        self.entries = OrderedDict()                    # message id -> NearDuplicateEntry, oldest first
+        self.buckets = [{} for _ in range(bands)]       # per band: band hash -> {message id: None}, oldest first
+
+        # counters
+        self.lookups = 0
+        self.matches = 0
+        self.candidates_checked = 0
+
+    def signature(self, text: str) -> Optional[tuple]:
+        """
+        Returns:
+            tuple: `num_bins` ints, or None for a message without any text.
+        """
+        text = normalize_text(text)
+        if not text:
+            return None
+        size = self.shingle_size
+        shingles = {text[i:i + size] for i in range(max(1, len(text) - size + 1))}
+
+        num_bins = self.num_bins
+        bins = [None] * num_bins
+        for shingle in shingles:
+            h = hash(shingle) & _HASH_MASK
+            index, value = h % num_bins, h // num_bins
+            current = bins[index]
+            if current is None or value < current:
+                bins[index] = value
+
+        # Rotation densification: an empty bin takes the next non-empty bin's value, offset by the distance so
+        # that it doesn't spuriously match a bin that was filled on its own
+        if None in bins:
+            offset = (_HASH_MASK // num_bins) + 1
+            # Walk leftwards from a filled bin, tracking the nearest filled bin to the right
+            start = next(index for index, value in enumerate(bins) if value is not None)
+            next_value, distance = bins[start], 0
+            for step in range(1, num_bins):
+                index = (start - step) % num_bins
+                if bins[index] is None:
+                    distance += 1
+                    bins[index] = -(next_value + distance * offset)
+                else:
+                    next_value, distance = bins[index], 0
+        return tuple(bins)
+
+    def find(self, signature: tuple) -> Optional[NearDuplicateMatch]:
+        """
+        Returns an indexed group at or above `threshold`, or None.
+        """
+        self.lookups += 1
+        match = self._match(signature, self._band_keys(signature)) if signature is not None else None
+        if match is not None:
+            self.matches += 1
+        return match
+
+    def add(self, key: int, signature: tuple, verdict: Optional[Verdict] = None) -> Optional[int]:
+        """
+        Indexes a message, joining the group of a near-duplicate if there is one.
+
+        Args:
+            key (int): Message id. Also becomes the group id if the message starts a new group.
+            signature (tuple): From `signature()`.
+            verdict (Verdict): Verdict to hand out for later near-duplicates, if any. Kept on the group, so it is
+                               handed out for every variant.
+
+        Returns:
+            int: The group id, or None for a message without any text.
+        """
+        if signature is None:
+            return None
+        existing = self.entries.get(key)
+        if existing is not None:
+            self._set_verdict(existing, verdict)
+            return existing.group
+
+        band_keys = self._band_keys(signature)
+        match = self._match(signature, band_keys)
+        group = match.entry.group if match is not None else key
+        if match is not None:
+            # A variant of an indexed group: remembered for `add()` of the same message, but not bucketed
+            self._set_verdict(match.entry, verdict)
+            self.entries[key] = NearDuplicateEntry(key, signature, (), None, group, time.monotonic())
+        else:
+            self.entries[key] = NearDuplicateEntry(key, signature, band_keys, verdict, key, time.monotonic())
+            for band, band_key in enumerate(band_keys):
+                self.buckets[band].setdefault(band_key, {})[key] = None
+        while len(self.entries) > self.max_entries:
+            self._evict(next(iter(self.entries)))
+        return group
+
+    def similarity(self, signature_a: tuple, signature_b: tuple) -> float:
+        return sum(a == b for a, b in zip(signature_a, signature_b)) / self.num_bins
+
+    def match_rate(self) -> float:
+        return self.matches / self.lookups if self.lookups else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "lookups": self.lookups,
+            "matches": self.matches,
+            "match_rate": self.match_rate(),
+            "candidates_per_lookup": self.candidates_checked / self.lookups if self.lookups else 0.0,
+        }
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _match(self, signature: tuple, band_keys: Tuple[int, ...]) -> Optional[NearDuplicateMatch]:
+        self._expire()
+
+        checked = set()
+        for band, band_key in enumerate(band_keys):
+            bucket = self.buckets[band].get(band_key)
+            if not bucket:
+                continue
+            for key in islice(reversed(bucket), self.max_candidates):
+                if key in checked:
+                    continue
+                checked.add(key)
+                entry = self.entries[key]
+                self.candidates_checked += 1
+                similarity = self.similarity(signature, entry.signature)
+                if similarity >= self.threshold:
+                    return NearDuplicateMatch(entry, similarity)
+        return None
+
+    def _set_verdict(self, entry: NearDuplicateEntry, verdict: Optional[Verdict]):
+        if verdict is None:
+            return
+        if entry.band_keys:
+            entry.verdict = verdict
+        else:
+            group = self.entries.get(entry.group)
+            if group is not None:
+                group.verdict = verdict
+
+    def _band_keys(self, signature: tuple) -> Tuple[int, ...]:
+        rows = self.rows
+        return tuple(hash(signature[start:start + rows]) for start in range(0, self.num_bins, rows))
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        while self.entries:
+            oldest = next(iter(self.entries.values()))
+            if oldest.created_at >= cutoff:
+                break
+            self._evict(oldest.key)
+
+    def _evict(self, key: int):
+        entry = self.entries.pop(key)
+        for band, band_key in enumerate(entry.band_keys):
+            bucket = self.buckets[band].get(band_key)
+            if bucket is not None:
+                bucket.pop(key, None)
+                if not bucket:
+                    del self.buckets[band][band_key]
@@ -0,0 +1,150 @@
+import re
+from enum import Enum, auto
+from typing import List
+
+# Curated lexicon of terms that should always reach the LLM. Matched case-insensitively on word boundaries.
+SUSPICIOUS_TERMS = [
+    "attack", "bomb", "bombing", "explosive", "explosives", "detonate", "ied", "grenade", "rifle", "ammo", "weapon", "weapons",
+    "shoot", "shooting", "kill", "killing", "massacre", "carnage", "behead", "beheaded", "beheading", "execute", "execution",
+    "jihad", "jihadi", "caliphate", "martyr", "martyrdom", "mujahideen", "infidel", "infidels", "crusader", "crusaders",
+    "holy war", "isis", "isil", "daesh", "al qaeda", "al-qaeda", "taliban", "hamas", "hezbollah", "boko haram", "al-shabaab",
+    "recruit", "recruiting", "recruitment", "join us", "join our", "our brothers", "pledge allegiance", "bay'ah",
+    "manifesto", "propaganda", "extremist", "radicalize", "radicalized", "hostage", "hostages", "terror", "terrorist",
+    "terrorism", "militia", "training camp", "safe house", "funding", "livestream", "nuke", "nuclear",
+]
+
+# Messages made up only of these words are benign no matter what, e.g. "lol ok" or "thanks!"
+BENIGN_WORDS = [
+    "lol", "lmao", "lmfao", "rofl", "xd", "ok", "okay", "ty", "thx", "thanks", "thank", "you", "np", "yes", "yeah",
+    "yep", "no", "nope", "nah", "sure", "hi", "hey", "hello", "yo", "sup", "gm", "gn", "bye", "cya", "brb", "gg",
+    "nice", "cool", "same", "true", "wow", "omg", "idk", "ikr",
+]
+# Words matched by shape rather than spelled out: "k", "kkk", "haha", "hahaaa", "hehe", ...
+BENIGN_WORD_SHAPES = re.compile(r"k+|(?:ha)+a*|(?:he)+e*")
+# Longer messages are never chit-chat; also bounds the work done per message
+MAX_BENIGN_LENGTH = 200
+
+
+class PreFilterDecision(Enum):
+    BENIGN = auto()     # safe to skip the LLM
+    ESCALATE = auto()   # uncertain or suspicious, send to `prompt_claude`
+
+
+class PreFilter:
+    """
+    Cheap local stage in front of the LLM classifier. Messages that hit the suspicious lexicon are always
+    escalated; messages that are clearly benign (chit-chat, or scored below `benign_threshold` by the optional
+    linear model) are short-circuited without a model call. Everything else is escalated: a message being short
+    says nothing about it being harmless ("We strike the mall at noon").
+    """
+
+    def __init__(self, suspicious_terms: List[str] = SUSPICIOUS_TERMS, benign_words: List[str] = BENIGN_WORDS,
+                 benign_threshold: float = 0.1):
+        """
+        Args:
+            suspicious_terms (List[str]): Lexicon of terms that force escalation.
+            benign_words (List[str]): Words that make up chit-chat. A message consisting only of these (and
+                                      laughter, see `BENIGN_WORD_SHAPES`) is benign.
+            benign_threshold (float): With a trained model, messages scored below this probability of being
+                                      terrorist content are benign. Everything else is escalated.
+        """
+        # Single alternation so each message is scanned once instead of once per term
+        escaped_terms = sorted((re.escape(term) for term in suspicious_terms), key=len, reverse=True)
+        self.suspicious_regex = re.compile(r"\b(?:" + "|".join(escaped_terms) + r")\b", re.IGNORECASE)
+        self.benign_words = frozenset(word.lower() for word in benign_words)
+        self.benign_threshold = benign_threshold
+        self.model = None
+
+        # counters
+        self.assessed = 0
+        self.short_circuited = 0
+        self.escalated = 0
+        self.lexicon_hits = 0
+
+    def fit(self, messages: List[str], flags: List[bool]):
+        """
+        Trains the optional linear model (TF-IDF + logistic regression). Requires scikit-learn.
+
+        Args:
+            messages (List[str]): Message texts.
+            flags (List[bool]): Whether each message is terrorist recruitment content.
+        """
+        try:
+            from sklearn.feature_extraction.text import TfidfVectorizer
+            from sklearn.linear_model import LogisticRegression
+            from sklearn.pipeline import make_pipeline
+        except ImportError as e:
+            raise ImportError("scikit-learn is required to train the pre-filter model: pip install scikit-learn") from e
+
+        model = make_pipeline(
+            TfidfVectorizer(ngram_range=(1, 2), min_df=1, sublinear_tf=True),
+            LogisticRegression(class_weight="balanced", max_iter=1000),
+        )
+        model.fit(messages, [1 if flag else 0 for flag in flags])
+        self.model = model
+
+    def fit_file(self, file_path: str):
+        """
+        Trains the linear model from a labelled dataset in the `DataProcessor` format:
+        `<message> <yes/no> <category>` on each line.
+        """
+        messages, flags = [], []
+        with open(file_path, mode="r", encoding="utf-8") as f:
+            for line in f:
+                split_line = line.strip().split(" ")
+                if len(split_line) < 3:
+                    continue
+                messages.append(" ".join(split_line[: -2]))
+                flags.append(split_line[-2].lower() == "yes")
+        self.fit(messages, flags)
+
+    def assess(self, text: str) -> PreFilterDecision:
+        self.assessed += 1
+        decision = self._decide(text)
+        if decision == PreFilterDecision.BENIGN:
+            self.short_circuited += 1
+        else:
+            self.escalated += 1
+        return decision
+
+    def is_suspicious(self, text: str) -> bool:
+        """
+        Local stand-in for the LLM verdict while it is unavailable: a lexicon hit, or a model score of at least 0.5.
+        """
+        if self.suspicious_regex.search(text):
+            return True
+        if self.model is not None and text.strip():
+            return self.model.predict_proba([text])[0][1] >= 0.5
+        return False
+
+    def is_chit_chat(self, text: str) -> bool:
+        # Word by word rather than one regex over the whole message, so the cost stays linear in its length
+        if len(text) > MAX_BENIGN_LENGTH:
+            return False
+        words = re.findall(r"\w+", text.lower())
+        return bool(words) and all(word in self.benign_words or BENIGN_WORD_SHAPES.fullmatch(word) for word in words)
+
+    def escalation_rate(self) -> float:
+        return self.escalated / self.assessed if self.assessed else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "assessed": self.assessed,
+            "short_circuited": self.short_circuited,
+            "escalated": self.escalated,
+            "lexicon_hits": self.lexicon_hits,
+            "escalation_rate": self.escalation_rate(),
+        }
+
+    def _decide(self, text: str) -> PreFilterDecision:
+        if self.suspicious_regex.search(text):
+            self.lexicon_hits += 1
+            return PreFilterDecision.ESCALATE
+
+        if not text.strip() or self.is_chit_chat(text):
+            return PreFilterDecision.BENIGN
+
+        if self.model is not None:
+            probability = self.model.predict_proba([text])[0][1]
+            return PreFilterDecision.BENIGN if probability < self.benign_threshold else PreFilterDecision.ESCALATE
+        return PreFilterDecision.ESCALATE
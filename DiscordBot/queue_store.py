@@ -0,0 +1,216 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+
+logger = logging.getLogger('modbot.queue_store')
+
+
+class QueueStore:
+    """
+    Write-ahead log that makes the review queues, in-flight report/review sessions and moderator-confirmed
+    organization names survive restarts.
+
+    Every change is appended to an in-memory buffer on the event loop; a background task writes the buffer
+    to an append-only JSON lines file and fsyncs it every `flush_interval` seconds from a worker thread, so
+    no disk write ever happens on the event loop. A batch that fails to write is kept and retried on the next
+    flush. On startup the log is replayed into the live state and,
+    once the log holds mostly dead records, it is compacted into a snapshot of the live state.
+
+    Record types:
+        {"op": "push", "queue": name, "id": entry id, "t": enqueued at, "item": report dict}
+        {"op": "pop", "queue": name, "id": entry id}
+        {"op": "session", "kind": "report"/"review", "user": user id, "data": session dict or null if finished}
+        {"op": "entity", "name": name, "kind": entity kind}
+    """
+
+    def __init__(self, path: str, flush_interval: float = 0.5, compact_min_records: int = 1000, compact_ratio: float = 4.0):
+        """
+        Args:
+            path (str): Path of the log file.
+            flush_interval (float): Seconds between batched writes + fsync. Bounds how much is lost on a hard crash.
+            compact_min_records (int): Never compact logs shorter than this.
+            compact_ratio (float): Compact once the log holds this many records per live record.
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.compact_min_records = compact_min_records
+        self.compact_ratio = compact_ratio
+
+        self.buffer = []            # serialized records not yet written
+        self.log_records = 0        # records currently in the file (plus buffered)
+        self.queues = {}            # queue name -> {entry id: (enqueued at, item)}
+        self.sessions = {}          # (kind, user id) -> session dict
+        self.entities = {}          # entity name -> kind
+        self.flush_task = None
+
+    def load(self) -> dict:
+        """
+        Replays the log. Must be called before `start()`.
+
+        Returns:
+            dict: `{"queues": {name: [(entry id, enqueued at, item), ...]}, "sessions": {(kind, user id): data},
+                  "entities": {name: kind}}`, queue entries in their original enqueue order.
+        """
+        if os.path.isfile(self.path):
+            valid_end = 0
+            with open(self.path, mode="rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break   # torn write from a crash; everything before it is intact
+                    valid_end += len(line)
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning("Skipping corrupt record in %s", self.path)
+                        continue
+                    self._apply(record)
+                    self.log_records += 1
+
+            if valid_end < os.path.getsize(self.path):
+                # drop the partial record so new appends start on a fresh line
+                with open(self.path, mode="r+b") as f:
+                    f.truncate(valid_end)
+
+        if self._should_compact():
+            lines = self._snapshot_lines()
+            self._write_snapshot(lines)
+            self.log_records = len(lines)
+
+        queues = {name: [(entry_id, enqueued_at, item) for entry_id, (enqueued_at, item) in entries.items()]
+                  for name, entries in self.queues.items()}
+        return {"queues": queues, "sessions": dict(self.sessions), "entities": dict(self.entities)}
+
+    def start(self):
+        """
+        Starts the background flush task. Must be called from inside a running event loop (e.g. `setup_hook`).
+        """
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._flush_loop(), name="queue-store-flush")
+
+    async def close(self):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            await asyncio.gather(self.flush_task, return_exceptions=True)
+            self.flush_task = None
+        try:
+            self._write_batch(self._take_buffer())
+        except OSError:
+            logger.exception("Failed to persist the last records of review queue log %s", self.path)
+
+    def log_push(self, queue_name: str, entry):
+        self._record({"op": "push", "queue": queue_name, "id": entry.entry_id, "t": entry.enqueued_at, "item": entry.item})
+
+    def log_pop(self, queue_name: str, entry_id: int):
+        self._record({"op": "pop", "queue": queue_name, "id": entry_id})
+
+    def save_session(self, kind: str, user_id: int, data: dict):
+        self._record({"op": "session", "kind": kind, "user": user_id, "data": data})
+
+    def delete_session(self, kind: str, user_id: int):
+        if (kind, user_id) in self.sessions:
+            self._record({"op": "session", "kind": kind, "user": user_id, "data": None})
+
+    def log_entity(self, name: str, kind: str):
+        self._record({"op": "entity", "name": name, "kind": kind})
+
+    def _record(self, record: dict):
+        self._apply(record)
+        self.buffer.append(json.dumps(record, default=str))
+        self.log_records += 1
+
+    def _apply(self, record: dict):
+        op = record.get("op")
+        if op == "push":
+            self.queues.setdefault(record["queue"], {})[record["id"]] = (record["t"], record["item"])
+        elif op == "pop":
+            self.queues.get(record["queue"], {}).pop(record["id"], None)
+        elif op == "session":
+            key = (record["kind"], record["user"])
+            if record["data"] is None:
+                self.sessions.pop(key, None)
+            else:
+                self.sessions[key] = record["data"]
+        elif op == "entity":
+            self.entities[record["name"]] = record["kind"]
+
+    def _live_records(self) -> int:
+        return sum(len(entries) for entries in self.queues.values()) + len(self.sessions) + len(self.entities)
+
+    def _should_compact(self) -> bool:
+        return self.log_records >= self.compact_min_records and self.log_records > self.compact_ratio * self._live_records()
+
+    def _snapshot_lines(self) -> list:
+        lines = []
+        for name, entries in self.queues.items():
+            for entry_id, (enqueued_at, item) in entries.items():
+                lines.append(json.dumps({"op": "push", "queue": name, "id": entry_id, "t": enqueued_at, "item": item}, default=str))
+        for (kind, user_id), data in self.sessions.items():
+            lines.append(json.dumps({"op": "session", "kind": kind, "user": user_id, "data": data}, default=str))
+        for name, kind in self.entities.items():
+            lines.append(json.dumps({"op": "entity", "name": name, "kind": kind}))
+        return lines
+
+    def _take_buffer(self) -> list:
+        batch, self.buffer = self.buffer, []
+        return batch
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        """
+        Writes the buffered records, or compacts the log if it is due. On failure the records stay buffered.
+        """
+        loop = asyncio.get_running_loop()
+        if self._should_compact():
+            # The snapshot already contains everything buffered so far
+            batch = self._take_buffer()
+            lines = self._snapshot_lines()
+            log_records, self.log_records = self.log_records, len(lines)
+            try:
+                await loop.run_in_executor(None, self._write_snapshot, lines)
+            except OSError:
+                # The old log is still in place, so it still needs the buffered records (and any logged since)
+                logger.exception("Failed to compact review queue log %s, will retry", self.path)
+                self.buffer[:0] = batch
+                self.log_records = log_records + self.log_records - len(lines)
+        elif self.buffer:
+            batch = self._take_buffer()
+            try:
+                await loop.run_in_executor(None, self._write_batch, batch)
+            except OSError:
+                logger.exception("Failed to persist %d records to review queue log %s, will retry", len(batch), self.path)
+                self.buffer[:0] = batch
+
+    def _write_batch(self, lines: list):
+        if not lines:
+            return
+        data = memoryview(("\n".join(lines) + "\n").encode("utf-8"))
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            start = os.lseek(fd, 0, os.SEEK_END)
+            try:
+                while data:
+                    data = data[os.write(fd, data):]
+                os.fsync(fd)
+            except OSError:
+                # Cut off what was written of the batch, so the retry doesn't follow a torn record
+                with contextlib.suppress(OSError):
+                    os.ftruncate(fd, start)
+                raise
+        finally:
+            os.close(fd)
+
+    def _write_snapshot(self, lines: list):
+        # Write the compacted log next to the old one and atomically swap it in
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, mode="w", encoding="utf-8") as f:
+            if lines:
+                f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
@@ -2,6 +2,9 @@ from enum import Enum, auto
 import discord
 import re
 from constants import *
+from metrics import observe_latency
+from message_resolver import UnresolvedMessage
+from state_machine import FlowEngine, Step, INVALID, choice, normalized
 
 class State(Enum):
     REPORT_START = auto()
@@ -23,25 +26,126 @@ class State(Enum):
     AWAITING_LOOP = auto()
 
 
+# Prompts are built once at import time instead of on every message
+START_PROMPT = (
+    "Thank you for beginning your report! Please answer the following questions regarding the nature of the content you are reporting.\n\n"
+    "What is the nature of the content that you are attempting to report? Select your choice from the options below.\n\n"
+    "Online harrassment/cyberbullying (1)\n"
+    "Nude/explicit photos of unconsenting parties, including minors (2)\n"
+    "Online terrorist recruitment (3)\n"
+    "Other (4)\n"
+)
+
+ABUSE_TYPE_REPLIES = {
+    "terror": (
+        "Choice confirmed.\n\n"
+        "Do you know the group the uploader of this content may be associated with?\n"
+        "If so, please provide the name of the group in the form of ('known: group name', e.g. 'known: ISIS').\n\n"
+        "If not, specify whether the group is located in the U.S. ('USA'), Abroad/International ('Intl'), or if you're unsure, write 'unknown'."
+    ),
+    "general": (
+        "Choice confirmed.\n"
+        "Please provide additional context into the abuse you are reporting. Our moderation team will review your case and contact you for followup.\n"
+        "You may also provide a link to the Discord message content you are reporting so that our moderation team can directly review the post."
+    ),
+    "other": (
+        "We do not currently offer support for other categories of potential abuse.\n"
+        "However, we still encourage you to submit information regarding the offensive content.\n"
+        "Please provide any context to the abuse you are reporting. Our moderation team will contact you if future efforts are made into your case. "
+        "You may also provide a link to the Discord message content you are reporting so that our moderation team can directly review the post."
+    ),
+}
+
+GENERAL_CONTEXT_REPLY = (
+    "Thank you for submitting your information. Our moderation team will review your report and contact you if further action is required.\n\n"
+    "We appreciate your time and effort to help us moderate platform content!"
+)
+
+INVALID_GROUP_REPLY = (
+    "Invalid input. If you are familiar with the group, please type `known: [group name]`, e.g. `known: ISIS`.\n "
+    "If you do not know the group, but you know they are based in the United States, type 'USA'. If they are based internationally, type 'Intl'.\n"
+    "Otherwise, if you have no information about the organization, type 'Unknown'."
+)
+
+CATEGORY_MENU = (
+    "What kind of terrorist recruitment content are you reporting? Choose from one of the following:\n\n"
+    "Graphic content/Disturbing Imagery (1)\n"
+    "Logistical coordination (2)\n"
+    "Propaganda promoting the terrorist organization and/or its members (3)\n"
+    "Active threat of impending violence (4)\n"
+    "Other (5)\n"
+)
+
+CONTEXT_PROMPT = (
+    "Please provide any additional context/information about the post you are reporting.\n"
+    "Format your response with a link to the message you are reporting, followed by any information you would like the moderation team to consider while reviewing your report.\n"
+)
+
+NO_LINK_REPLY = "ERROR: Could not find linked content inside of your response. Please start with your link and try again.\n"
+
+UNRESOLVED_LINK_REPLIES = {
+    "guild": "As a bot, I cannot accept reports of messages from guilds that I'm not in. Please have the guild owner add me to the guild and try again.\n",
+    "channel": "It seems this channel was deleted or never existed. Please try again or say `cancel` to cancel.\n",
+    "message": "It seems this message was deleted or never existed. Please try again or say `cancel` to cancel.\n",
+}
+
+THREAT_LEVEL_PROMPT = "Do you believe the reported content poses an active/urgent threat to public safety? (Y/N)\n"
+
+GROUPLOC_PROMPT = (
+    "If you know where the target location and how many perpetrators are involved, please include these details.\n"
+    "Format your response in the form (location, group size). If you don't know the answer for one of these fields, write 'unknown'.\n"
+)
+
+LOOP_PROMPT = "Thank you for response on this post. Do you have any other posts from this user you would like to report? (Y / N)\n"
+
+ABUSE_TYPE_OPTIONS = {
+    "3": "terror", "(3)": "terror",   # user choosing to report terror case
+    "1": "general", "(1)": "general", "2": "general", "(2)": "general",   # user chose option 1 or 2
+    "4": "other", "(4)": "other",   # they chose "Other"
+}
+
+RESPONSE_TO_CATEGORY = {
+    "1": "imagery", "(1)": "imagery",
+    "2": "coordination", "(2)": "coordination",
+    "3": "propaganda", "(3)": "propaganda",
+    "4": "threat", "(4)": "threat",
+    "5": "other", "(5)": "other",
+}
+
+YES_NO = {"y": True, "yes": True, "n": False, "no": False}
+
+UNKNOWN_GROUP_OPTIONS = frozenset(["usa", "intl", "unknown"])
+
+MESSAGE_LINK_PATTERN = re.compile(r'/(\d+)/(\d+)/(\d+)')
+GROUPLOC_PATTERN = re.compile(r"\(\s*[^,]+\s*, \s*\d+\s*\)|\(\s*unknown\s*, \s*\d+\s*\)|\(\s*[^,]+\s*, \s*unknown\s*\)|\(\s*unknown\s*, \s*unknown\s*\)|\s*unknown\s*", re.IGNORECASE)
+
+
+def validate_group(content):
+    response = content.lower()
+    if response.startswith("known"):  # user knew the group
+        return response.split(":")[-1].strip()
+    if response in UNKNOWN_GROUP_OPTIONS:  # user didn't know the group
+        return response
+    return INVALID
+
+
+def validate_grouploc(content):
+    response = content.strip().lower()  # should be of form (location, size)
+    return response if GROUPLOC_PATTERN.match(response) else INVALID
+
+
 class Report:
     START_KEYWORD = "report"
     CANCEL_KEYWORD = "cancel"
     HELP_KEYWORD = "help"
 
+    # One instance per user with an open report, see `SessionStore`
+    __slots__ = ("state", "client", "output", "final_outputs")
+
     def __init__(self, client):
         self.state = State.REPORT_START
         self.client = client
-        self.message = None
-        self.output = {
-            "organization_name": None,
-            "category": None,
-            "context": None,
-            "location": None,
-            "suspect": None,
-            "urgent": None,
-            "size": None,
-            "post_content": None
-        }   # current output being built
+        self.output = self.generate_template_output()   # current output being built
 
         self.final_outputs = []  # stores all outputs from user
     
@@ -56,15 +160,17 @@ class Report:
             "suspect": None,
             "urgent": None,
             "size": None,
-            "post_content": None
+            "post_content": None,
+            "message_id": None,
+            "reporter_id": None
         }
         return output
 
+    @observe_latency("report_handle_message")
     async def handle_message(self, message):
         '''
-        This function makes up the meat of the user-side reporting flow. It defines how we transition between states and what 
-        prompts to offer at each of those states. You're welcome to change anything you want; this skeleton is just here to
-        get you started and give you a model for working with Discord. 
+        This function makes up the meat of the user-side reporting flow. Each state's handling is declared
+        in `REPORT_FLOW` below; this only handles the commands that are valid in every state.
         '''
 
         if message.content == self.CANCEL_KEYWORD:
@@ -74,264 +180,157 @@ class Report:
         if message.content == "DEBUG":
             print(self.get_all_outputs())
 
-        if self.state == State.REPORT_START:
-            reply = "Thank you for beginning your report! Please answer the following questions regarding the nature of the content you are reporting.\n\n"
-            reply += "What is the nature of the content that you are attempting to report? Select your choice from the options below.\n\n"
-            reply += "Online harrassment/cyberbullying (1)\n"
-            reply += "Nude/explicit photos of unconsenting parties, including minors (2)\n"
-            reply += "Online terrorist recruitment (3)\n"
-            reply += "Other (4)\n"
-
-            self.state = State.AWAITING_GENERAL_ABUSE_TYPE
-            return [reply], None
-        
-        if self.state == State.AWAITING_GENERAL_ABUSE_TYPE:
-            
-            NAVIGATE_TERROR_FLOW = set(["3", "(3)"])   # user choosing to report terror case
-            NAVIGATE_CYBER_EXPLICIT_FLOWS = set(["1", "(1)", "2", "(2)"])   # user chose option 1 or 2
-            NAVIGATE_OTHER_FLOW = set(["4", "(4)"])   # they chose "Other"
-
-            reply = ""
-            if message.content in NAVIGATE_TERROR_FLOW:  # user choosing to report terror case
-                reply += "Choice confirmed.\n\n"
-                reply += "Do you know the group the uploader of this content may be associated with?\n"
-                reply += "If so, please provide the name of the group in the form of ('known: group name', e.g. 'known: ISIS').\n\n"
-                reply += "If not, specify whether the group is located in the U.S. ('USA'), Abroad/International ('Intl'), or if you're unsure, write 'unknown'."
-                
-                # The response should be one of 'known: ___', 'USA', 'Intl', 'unknown'.
-                self.state = State.AWAITING_GROUP_IDENTIFICATION
-            elif message.content in NAVIGATE_CYBER_EXPLICIT_FLOWS:  #  user reporting cyber harrassment/explicit content
-                reply += "Choice confirmed.\n"
-                reply += "Please provide additional context into the abuse you are reporting. Our moderation team will review your case and contact you for followup.\n"
-                
-                reply += "You may also provide a link to the Discord message content you are reporting so that our moderation team can directly review the post."
-                self.state = State.AWAITING_GENERAL_ADDNTL_CONTEXT
-            elif message.content in NAVIGATE_OTHER_FLOW:  # User reporting "Other" category
-                reply += "We do not currently offer support for other categories of potential abuse.\n"
-                reply += "However, we still encourage you to submit information regarding the offensive content.\n"
-                reply += "Please provide any context to the abuse you are reporting. Our moderation team will contact you if future efforts are made into your case. "
-                reply += "You may also provide a link to the Discord message content you are reporting so that our moderation team can directly review the post."
-
-                self.state = State.AWAITING_SUBMISSION
-            else:    # invalid input
-                reply += f"Invalid input. Please choose one of the following options: `1`, `2`, `3`, `4`.\n"
-                reply += f"Your input: `{message.content}`"
-                # user remains in this part of the decision tree until a valid option is selected
-            
-            return [reply], None
-        
-        if self.state == State.AWAITING_GENERAL_ADDNTL_CONTEXT:
-            # We don't have to save this into the state of the Report output because we have no need
-            # to implementation any backend functionality for non-terrorism reports. We can just
-            # end this flow on the user end.
-            reply = "Thank you for submitting your information. Our moderation team will review your report and contact you if further action is required.\n\n"
-            reply += "We appreciate your time and effort to help us moderate platform content!"
+        return await REPORT_FLOW.dispatch(self, message)
+
+    def start(self, value, message):
+        return [START_PROMPT], None
+
+    def choose_abuse_type(self, flow, message):
+        return [ABUSE_TYPE_REPLIES[flow]], None
+
+    def invalid_abuse_type(self, content):
+        # user remains in this part of the decision tree until a valid option is selected
+        return [f"Invalid input. Please choose one of the following options: `1`, `2`, `3`, `4`.\nYour input: `{content}`"], None
+
+    def general_context(self, value, message):
+        # We don't have to save this into the state of the Report output because we have no need
+        # to implementation any backend functionality for non-terrorism reports. We can just
+        # end this flow on the user end.
+        return [GENERAL_CONTEXT_REPLY], None
+
+    def identify_group(self, group_name, message):
+        self.output["organization_name"] = group_name
+        return [CATEGORY_MENU], None
+
+    def invalid_group(self, content):
+        return [INVALID_GROUP_REPLY], None
+
+    def choose_category(self, category, message):
+        self.output["category"] = category
+        # Proceed to next state by asking question about post context
+        return [CONTEXT_PROMPT], None
+
+    def invalid_category(self, content):
+        return ["Invalid response. Try again.\n\n" + CATEGORY_MENU], None
+
+    async def add_context(self, content, message):
+        # raw context
+        self.output["context"] = content.strip().lower()
+
+        # Parse out the three IDs of every message link and fetch the linked messages concurrently
+        links = list(dict.fromkeys(tuple(map(int, m.groups())) for m in MESSAGE_LINK_PATTERN.finditer(content)))
+        if not links:
+            return [NO_LINK_REPLY], None
+
+        reply = ""
+        linked_messages = []
+        for result in await self.client.message_resolver.resolve_many(links):
+            if isinstance(result, UnresolvedMessage):
+                reply += UNRESOLVED_LINK_REPLIES[result.reason]
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                linked_messages.append(result)
+        if not linked_messages:
+            # Stay in this state so the user can send a working link
             return [reply], None
 
-        if self.state == State.AWAITING_GROUP_IDENTIFICATION:
-            reply = ""
-            response = message.content.lower()
-            unknown_options = set(["usa", "intl", "unknown"])
-            
-            if response.startswith("known"):  # user knew the group
-                response_components = response.split(":")
-                group_name = response_components[-1].strip()
-
-                self.output["organization_name"] = group_name
-            
-            elif response in unknown_options:   #  user didn't know the group
-                self.output["organization_name"] = response
-
-            else:   # invalid input
-                reply += f"Invalid input. If you are familiar with the group, please type `known: [group name]`, e.g. `known: ISIS`.\n "
-                reply += f"If you do not know the group, but you know they are based in the United States, type 'USA'. If they are based internationally, type 'Intl'.\n"
-                reply += f"Otherwise, if you have no information about the organization, type 'Unknown'."
-            
-            if self.output.get("organization_name") is not None:  # we can proceed knowing the input was valid
-                reply += f"What kind of terrorist recruitment content are you reporting? Choose from one of the following:\n\n"
-                reply += "Graphic content/Disturbing Imagery (1)\n"
-                reply += "Logistical coordination (2)\n"
-                reply += "Propaganda promoting the terrorist organization and/or its members (3)\n"
-                reply += "Active threat of impending violence (4)\n"
-                reply += "Other (5)\n"
-
-                self.state = State.AWAITING_POST_CATEGORY
+        self.output["post_content"] = "\n".join(linked.content for linked in linked_messages)
+        self.output["suspect"] = ", ".join(dict.fromkeys(linked.author.name for linked in linked_messages))
+        self.output["message_id"] = linked_messages[0].id   # reports of the same message are merged for review
+        self.state = State.AWAITING_THREAT_LEVEL
 
-            return [reply], None
+        reply += "Response received and confirmed!" + "\n\n\n"
+        reply += THREAT_LEVEL_PROMPT
+        return [reply], None
 
-        if self.state == State.AWAITING_POST_CATEGORY:
-            reply = ""
-            response = message.content.strip().lower()  # lowercase and remove whitespace
-            VALID_REPLIES = set([
-                "1", "(1)", "2", "(2)", "3", "(3)", "4", "(4)", "5", "(5)"
-            ])
-
-            if response not in VALID_REPLIES:
-                reply += "Invalid response. Try again.\n\n"
-                reply += f"What kind of terrorist recruitment content are you reporting? Choose from one of the following:\n\n"
-                reply += "Graphic content/Disturbing Imagery (1)\n"
-                reply += "Logistical coordination (2)\n"
-                reply += "Propaganda promoting the terrorist organization and/or its members (3)\n"
-                reply += "Active threat of impending violence (4)\n"
-                reply += "Other (5)\n"
-
-                return [reply], None
-            # User gave a valid response
-
-            response_to_category = {
-                "1": "imagery",
-                "(1)": "imagery",
-                "2": "coordination",
-                "(2)": "coordination",
-                "3": "propaganda",
-                "(3)": "propaganda",
-                "4": "threat",
-                "(4)": "threat",
-                "5": "other",
-                "(5)": "other"
-            }
-
-            self.output["category"] = response_to_category.get(response)
-            if self.output["category"] is None:
-                raise ValueError(f"Couldn't process response from the user into category type: {response}")
-            
-            # Proceed to next state by asking question about post context
-
-            reply += "Please provide any additional context/information about the post you are reporting.\n"
-            reply += "Format your response with a link to the message you are reporting, followed by any information you would like the moderation team to consider while reviewing your report.\n"
-            self.state = State.AWAITING_CONTEXT_MSG
-            return [reply], None
+    def set_threat_level(self, urgent, message):
+        self.output["urgent"] = urgent
+        return [GROUPLOC_PROMPT if urgent else LOOP_PROMPT], None
 
-        if self.state == State.AWAITING_CONTEXT_MSG:
-            reply = ""
-            context_response = message.content.strip().lower()
-            # raw context
-            self.output["context"] = context_response  
-
-            # try getting the link if it exists from the content
-            # Parse out the three ID strings from the message link
-            m = re.search('/(\d+)/(\d+)/(\d+)', message.content)
-            if not m:
-                reply += f"ERROR: Could not find linked content inside of your response. Please start with your link and try again.\n"
-            
-            guild = self.client.get_guild(int(m.group(1)))
-            if not guild:
-                reply += "As a bot, I cannot accept reports of messages from guilds that I'm not in. Please have the guild owner add me to the guild and try again.\n"
-            channel = guild.get_channel(int(m.group(2)))
-            if not channel:
-                reply += "It seems this channel was deleted or never existed. Please try again or say `cancel` to cancel.\n"
-            try:
-                message = await channel.fetch_message(int(m.group(3)))
-
-                self.output["post_content"] = message.content
-                self.output["suspect"] = message.author.name
-
-            except discord.errors.NotFound:
-                reply += "It seems this message was deleted or never existed. Please try again or say `cancel` to cancel.\n"
-            
-            reply += "Response received and confirmed!" + "\n\n\n"
-            reply += "Do you believe the reported content poses an active/urgent threat to public safety? (Y/N)\n"
-            
-            self.state = State.AWAITING_THREAT_LEVEL  # transition to next state, wait for user to respond
-            return [reply], None  
-
-        if self.state == State.AWAITING_THREAT_LEVEL:
-            response = message.content.strip().lower()
-            reply = ""
-
-            if response == "y" or response == "yes":  # urgent threat
-                self.output["urgent"] = True 
-                reply += "If you know where the target location and how many perpetrators are involved, please include these details.\n"
-                reply += "Format your response in the form (location, group size). If you don't know the answer for one of these fields, write 'unknown'.\n"
-
-                self.state = State.AWAITING_GROUPLOC
-                # TODO Then, go to the redo state
-                # We also need a submit state.
-            elif response == "n" or response == "no":  # not urgent
-                self.output["urgent"] = False
-                reply += "Thank you for response on this post. Do you have any other posts from this user you would like to report? (Y / N)\n"
-
-                self.state = State.AWAITING_LOOP
-            else:  # invalid response
-                reply += "Invalid response. Please try again using 'Y' or 'N' to answer the previous question.\n"
+    def invalid_threat_level(self, content):
+        return ["Invalid response. Please try again using 'Y' or 'N' to answer the previous question.\n"], None
 
-            return [reply], None
+    def set_group_location(self, response, message):
+        # Assume that input is valid form of (location, size)
+        split_input = response.split(",")
+        location, size = split_input[0][1:], split_input[1][1 : -1]
 
-        if self.state == State.AWAITING_GROUPLOC:
-            reply = ""
-            response = message.content.strip().lower()  # should be of form (location, size)
-            
-            # input validation here
-            response_pattern = r"\(\s*[^,]+\s*, \s*\d+\s*\)|\(\s*unknown\s*, \s*\d+\s*\)|\(\s*[^,]+\s*, \s*unknown\s*\)|\(\s*unknown\s*, \s*unknown\s*\)|\s*unknown\s*"
-            if not re.match(response_pattern, response, re.IGNORECASE):
-                reply += "Invalid response. Please try again using the format (location, size).\n"
-                return [reply], None
+        self.output["location"] = location
+        self.output["size"] = int(size)
+        return [LOOP_PROMPT], None
 
-            # Assume that input is valid form of (location, size)
-            split_input = response.split(",")
-            location, size = split_input[0][1:], split_input[1][1 : -1]
+    def invalid_group_location(self, content):
+        return ["Invalid response. Please try again using the format (location, size).\n"], None
 
-            self.output["location"] = location
-            self.output["size"] = int(size)
+    def loop(self, another, message):
+        # Reports of the same post are merged for review, and only distinct reporters are counted
+        self.output["reporter_id"] = message.author.id
+        self.final_outputs.append(self.output)
 
-            reply += "Thank you for response on this post. Do you have any other posts from this user you would like to report? (Y / N)\n"
+        # Reset template to base form for next submission
+        org_name = self.output.get("organization_name")
+        self.output = self.generate_template_output()
+        self.output["organization_name"] = org_name
 
-            self.state = State.AWAITING_LOOP
-            return [reply], None
-        
-        if self.state == State.AWAITING_LOOP:
-            reply = ""
-            response = message.content.strip().lower()  # expecting 'y' or 'n'
-            valid_responses = set(["y", "n", "yes", "no"])
-            if response not in valid_responses:
-                reply += "Invalid response. Please try again (Y/N)."
-                return [reply], None
-            if response == "y" or response == "yes":
-                
-                self.final_outputs.append(self.output)
-
-                # Reset template to base form for next submission
-                org_name = self.output.get("organization_name")
-                self.output = self.generate_template_output()
-                self.output["organization_name"] = org_name
-
-                # recycle loop for category
-                reply += f"What kind of terrorist recruitment content are you reporting? Choose from one of the following:\n\n"
-                reply += "Graphic content/Disturbing Imagery (1)\n"
-                reply += "Logistical coordination (2)\n"
-                reply += "Propaganda promoting the terrorist organization and/or its members (3)\n"
-                reply += "Active threat of impending violence (4)\n"
-                reply += "Other (5)\n"
-
-                self.state = State.AWAITING_POST_CATEGORY 
-            elif response == "n" or response == "no":
-                reply += "Thank you for submitting your report!"
-
-                self.final_outputs.append(self.output)
-                # Reset template to base form for next submission
-                org_name = self.output.get("organization_name")     
-                self.output = self.generate_template_output()
-                self.output["organization_name"] = org_name
-                
-                self.state = State.AWAITING_SUBMISSION
-
-                return [reply], self.final_outputs
+        if another:
+            # recycle loop for category
+            return [CATEGORY_MENU], None
+        return ["Thank you for submitting your report!"], self.final_outputs
 
-            return [reply], None
+    def invalid_loop(self, content):
+        return ["Invalid response. Please try again (Y/N)."], None
 
-        if self.state == State.AWAITING_SUBMISSION:
-            # End the form
-            self.state = State.REPORT_COMPLETE
-            return [], self.final_outputs
+    def submit(self, value, message):
+        # End the form; `loop` already handed the outputs off for review
+        return [], None
 
-        if self.state == State.MESSAGE_IDENTIFIED:
-            return ["<insert rest of reporting flow here>"], None
+    def message_identified(self, value, message):
+        return ["<insert rest of reporting flow here>"], None
 
-        return [], None
+    def to_dict(self):
+        # Serializable snapshot of the session, see `QueueStore`
+        return {
+            "state": self.state.name,
+            "output": self.output,
+            "final_outputs": self.final_outputs,
+        }
+
+    @classmethod
+    def from_dict(cls, client, data):
+        report = cls(client)
+        report.state = State[data["state"]]
+        report.output = data["output"]
+        report.final_outputs = data["final_outputs"]
+        return report
 
     def get_all_outputs(self):
         return self.final_outputs
 
     def report_complete(self):
         return self.state == State.REPORT_COMPLETE
-    
\ No newline at end of file
+    
+
+
+# state -> how the next message is validated, handled, and which state follows
+REPORT_FLOW = FlowEngine({
+    State.REPORT_START: Step(Report.start, next_state=State.AWAITING_GENERAL_ABUSE_TYPE),
+    State.AWAITING_GENERAL_ABUSE_TYPE: Step(Report.choose_abuse_type, choice(ABUSE_TYPE_OPTIONS), Report.invalid_abuse_type,
+                                            next_state={"terror": State.AWAITING_GROUP_IDENTIFICATION,
+                                                        "general": State.AWAITING_GENERAL_ADDNTL_CONTEXT,
+                                                        "other": State.AWAITING_SUBMISSION}),
+    State.AWAITING_GENERAL_ADDNTL_CONTEXT: Step(Report.general_context),
+    State.AWAITING_GROUP_IDENTIFICATION: Step(Report.identify_group, validate_group, Report.invalid_group,
+                                              next_state=State.AWAITING_POST_CATEGORY),
+    State.AWAITING_POST_CATEGORY: Step(Report.choose_category, choice(RESPONSE_TO_CATEGORY, normalized), Report.invalid_category,
+                                       next_state=State.AWAITING_CONTEXT_MSG),
+    State.AWAITING_CONTEXT_MSG: Step(Report.add_context),   # moves on once a linked message was found
+    State.AWAITING_THREAT_LEVEL: Step(Report.set_threat_level, choice(YES_NO, normalized), Report.invalid_threat_level,
+                                      next_state={True: State.AWAITING_GROUPLOC, False: State.AWAITING_LOOP}),
+    State.AWAITING_GROUPLOC: Step(Report.set_group_location, validate_grouploc, Report.invalid_group_location,
+                                  next_state=State.AWAITING_LOOP),
+    State.AWAITING_LOOP: Step(Report.loop, choice(YES_NO, normalized), Report.invalid_loop,
+                              next_state={True: State.AWAITING_POST_CATEGORY, False: State.AWAITING_SUBMISSION}),
+    State.AWAITING_SUBMISSION: Step(Report.submit, next_state=State.REPORT_COMPLETE),
+    State.MESSAGE_IDENTIFIED: Step(Report.message_identified),
+}, default=lambda report: ([], None))
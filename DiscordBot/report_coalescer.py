@@ -0,0 +1,159 @@
+import hashlib
+from typing import List
+
+from llm_prompt.verdict_cache import normalize_text
+from review_queue import ReviewEntry, ReviewQueue, CATEGORY_PRIORITY, UNKNOWN_CATEGORY_PRIORITY
+
+# Distinct texts kept on an automated report that lightly edited variants were merged into
+MAX_VARIANTS = 10
+
+# Fields of an automated report kept on the user report it is merged into
+DETECTION_FIELDS = ("author", "threat_level", "category", "confidence", "matched_entities", "classified_by")
+
+
+def content_digest(text: str) -> str:
+    return hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def report_keys(report_data: dict) -> List[tuple]:
+    """
+    Keys a queued report can be found by: the reported message(s), the normalized content of the post and, for
+    automated reports, its group of near-duplicate variants. Used as the `key_fn` of both review queues.
+    """
+    keys = [("message", message_id) for message_id in report_data.get("message_ids") or [report_data.get("message_id")]
+            if message_id is not None]
+    if report_data.get("post_content"):
+        keys.append(("content", content_digest(report_data["post_content"])))
+    if report_data.get("variant_group") is not None:
+        keys.append(("variant", report_data["variant_group"]))
+    return keys
+
+
+def _more_severe(category_a, category_b):
+    if category_a is None:
+        return category_b
+    if category_b is None:
+        return category_a
+    return min(category_a, category_b, key=lambda category: CATEGORY_PRIORITY.get(category, UNKNOWN_CATEGORY_PRIORITY))
+
+
+def _extend_unique(values: list, new_values) -> list:
+    for value in new_values:
+        if value and value not in values:
+            values.append(value)
+    return values
+
+
+class ReportCoalescer:
+    """
+    Merges reports of the same message, or of identical content, into the review item already waiting for
+    it, so moderators review a viral post once instead of once per report.
+
+    - User reports of the same post are combined into one item with the number of distinct reporters and every
+      reporter's context.
+    - Repeated automated detections of the same content, or of near-duplicate variants of it, are combined into
+      one item listing each occurrence and variant.
+    - When users report a message the classifier has also flagged, the automated item is folded into the
+      user report (as its `automated_detection`), since the user report carries more context.
+    """
+
+    def __init__(self, user_queue: ReviewQueue, automated_queue: ReviewQueue):
+        """
+        Args:
+            user_queue (ReviewQueue): Queue of reports filed through `Report`. Must use `report_keys` as `key_fn`.
+            automated_queue (ReviewQueue): Queue of classifier detections. Must use `report_keys` as `key_fn`.
+        """
+        self.user_queue = user_queue
+        self.automated_queue = automated_queue
+
+        # counters
+        self.merged_user = 0        # user reports merged into a pending user report
+        self.merged_automated = 0   # detections merged into a pending automated report
+        self.joined = 0             # detections and user reports of the same message combined
+
+    def add_user_report(self, report_data: dict) -> ReviewEntry:
+        report_data.setdefault("reporter_ids", _extend_unique([], [report_data.get("reporter_id")]))
+        report_data["reporters"] = max(1, len(report_data["reporter_ids"]))
+        report_data.setdefault("contexts", _extend_unique([], [report_data.get("context")]))
+        keys = report_keys(report_data)
+
+        entry = self.user_queue.find(keys)
+        if entry is not None:
+            self._merge_user_reports(entry.item, report_data)
+            self.merged_user += 1
+            return self.user_queue.update(entry)
+
+        detected = self.automated_queue.find(keys)
+        if detected is not None and self.automated_queue.remove(detected):
+            self._attach_detection(report_data, detected.item)
+            self.joined += 1
+        return self.user_queue.append(report_data)
+
+    def add_automated_report(self, report_data: dict) -> ReviewEntry:
+        """
+        Returns:
+            ReviewEntry: The entry the detection ended up in. Its item is not `report_data` if it was merged.
+        """
+        report_data.setdefault("occurrences", 1)
+        report_data.setdefault("authors", [report_data.get("author")])
+        report_data.setdefault("message_ids", [report_data.get("message_id")])
+        keys = report_keys(report_data)
+
+        entry = self.user_queue.find(keys)
+        if entry is not None:
+            self._attach_detection(entry.item, report_data)
+            self.joined += 1
+            return self.user_queue.update(entry)
+
+        entry = self.automated_queue.find(keys)
+        if entry is not None:
+            self._merge_automated_reports(entry.item, report_data)
+            self.merged_automated += 1
+            return self.automated_queue.update(entry)
+        return self.automated_queue.append(report_data)
+
+    def stats(self) -> dict:
+        return {
+            "merged_user": self.merged_user,
+            "merged_automated": self.merged_automated,
+            "joined": self.joined,
+        }
+
+    @staticmethod
+    def _merge_user_reports(existing: dict, new: dict):
+        # The same user reporting a post twice is still one reporter
+        existing["reporter_ids"] = _extend_unique(existing.get("reporter_ids") or [], new["reporter_ids"])
+        existing["reporters"] = max(existing.get("reporters", 1), len(existing["reporter_ids"]))
+        existing["contexts"] = _extend_unique(existing.get("contexts") or [existing.get("context")], new["contexts"])
+        existing["urgent"] = bool(existing.get("urgent") or new.get("urgent"))
+        existing["category"] = _more_severe(existing.get("category"), new.get("category"))
+        for field in ("organization_name", "location", "size", "suspect", "message_id"):
+            if existing.get(field) in (None, "unknown"):
+                existing[field] = new.get(field)
+        if new.get("automated_detection"):
+            ReportCoalescer._attach_detection(existing, new["automated_detection"])
+
+    @staticmethod
+    def _merge_automated_reports(existing: dict, new: dict):
+        existing["occurrences"] = existing.get("occurrences", 1) + new["occurrences"]
+        existing["authors"] = _extend_unique(existing.get("authors") or [existing.get("author")], new["authors"])
+        existing["message_ids"] = _extend_unique(existing.get("message_ids") or [existing.get("message_id")], new["message_ids"])
+        existing["matched_entities"] = _extend_unique(list(existing.get("matched_entities") or []), new.get("matched_entities") or [])
+        variants = existing.get("variants") or []
+        if len(variants) < MAX_VARIANTS and content_digest(new.get("post_content") or "") != content_digest(existing.get("post_content") or ""):
+            existing["variants"] = _extend_unique(variants, [new.get("post_content")])
+        if (new.get("confidence") or 0) > (existing.get("confidence") or 0):
+            for field in ("threat_level", "category", "confidence", "classified_by"):
+                existing[field] = new.get(field)
+
+    @staticmethod
+    def _attach_detection(user_report: dict, detection: dict):
+        previous = user_report.get("automated_detection")
+        attached = {field: detection.get(field) for field in DETECTION_FIELDS}
+        attached["occurrences"] = detection.get("occurrences", 1) + (previous["occurrences"] if previous else 0)
+        if previous and (previous.get("confidence") or 0) > (attached.get("confidence") or 0):
+            previous["occurrences"] = attached["occurrences"]
+            attached = previous
+        user_report["automated_detection"] = attached
+        if user_report.get("message_id") is None:
+            user_report["message_id"] = detection.get("message_id")
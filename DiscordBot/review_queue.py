@@ -0,0 +1,253 @@
+import heapq
+import time
+from collections import deque
+
+# Lower rank is reviewed first. Covers both user report categories (`Report`) and classifier categories.
+CATEGORY_PRIORITY = {
+    "threat": 0,
+    "coordination": 1,
+    "logistical": 1,
+    "imagery": 2,
+    "graphic": 2,
+    "propaganda": 3,
+    "other": 4,
+}
+UNKNOWN_CATEGORY_PRIORITY = 5
+
+
+def review_priority(report_data: dict) -> tuple:
+    """
+    Computes the priority key of a report; smaller keys are reviewed first.
+
+    Urgent reports and active threats come first, then reports are ordered by category severity and
+    finally by detection confidence (rounded so that near-equal confidences share a FIFO bucket).
+    """
+    category = report_data.get("category")
+    urgent = bool(report_data.get("urgent")) or category == "threat"
+    confidence = report_data.get("confidence")
+    confidence_rank = -round(confidence * 10) if confidence is not None else 0
+
+    return (
+        0 if urgent else 1,
+        CATEGORY_PRIORITY.get(category, UNKNOWN_CATEGORY_PRIORITY),
+        confidence_rank,
+    )
+
+
+class ReviewEntry:
+    __slots__ = ("entry_id", "item", "priority", "enqueued_at", "keys", "removed")
+
+    def __init__(self, entry_id: int, item: dict, priority: tuple, enqueued_at: float, keys: tuple = ()):
+        self.entry_id = entry_id
+        self.item = item
+        self.priority = priority
+        self.enqueued_at = enqueued_at
+        self.keys = keys        # lookup keys from the queue's `key_fn`
+        self.removed = False    # removed entries stay in their bucket until they reach its head
+
+
+class ReviewQueue:
+    """
+    Priority queue of reports awaiting moderator review.
+
+    Reports are grouped into FIFO buckets by priority key. A heap holds only the distinct keys, so finding the
+    most urgent bucket is O(log k) for k distinct priorities and appending/popping within a bucket is O(1).
+    Supports the list operations `ModReview` relies on (`append`, `pop`, truthiness and `len`).
+
+    With a `key_fn`, pending entries can also be looked up by key (e.g. the reported message id) in O(1), then
+    updated in place or removed, so duplicate reports can be merged into the entry already waiting for review.
+    """
+
+    def __init__(self, name: str, priority_fn=review_priority, store=None, key_fn=None):
+        """
+        Args:
+            name (str): Name of the queue, shown in stats. Also identifies the queue in the `store` log.
+            priority_fn (function): Maps a report dict to a sortable priority key; smaller keys are reviewed first.
+            store (QueueStore): Optional write-ahead log every push and pop is recorded to.
+            key_fn (function): Optional; maps a report dict to the keys `find()` can look it up by.
+        """
+        self.name = name
+        self.priority_fn = priority_fn
+        self.store = store
+        self.key_fn = key_fn
+        self.buckets = {}   # priority key -> deque of ReviewEntry
+        self.heap = []      # priority keys that currently have a non-empty bucket
+        self.entries = {}   # entry id -> pending ReviewEntry
+        self.by_key = {}    # key from `key_fn` -> pending ReviewEntry
+        self.next_id = 1
+        self.size = 0
+
+        # wait-time stats of reviewed entries
+        self.popped = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def append(self, item: dict) -> ReviewEntry:
+        entry = self._new_entry(self.next_id, item, time.time())
+        self.next_id += 1
+        self._push_entry(entry)
+        if self.store is not None:
+            self.store.log_push(self.name, entry)
+        return entry
+
+    def restore(self, entry_id: int, item: dict, enqueued_at: float):
+        """
+        Re-inserts an entry replayed from the `store` log, keeping its original id and age.
+        """
+        self._push_entry(self._new_entry(entry_id, item, enqueued_at))
+        self.next_id = max(self.next_id, entry_id + 1)
+
+    def pop(self, index: int = 0) -> dict:
+        """
+        Removes and returns the highest-priority report, oldest first within a priority.
+        `index` is accepted for compatibility with `list.pop(0)`; only the head can be popped.
+        """
+        if index != 0:
+            raise IndexError("ReviewQueue only supports popping the head of the queue")
+        entry = self._pop_entry()
+        if self.store is not None:
+            self.store.log_pop(self.name, entry.entry_id)
+        wait = time.time() - entry.enqueued_at
+        self.popped += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        return entry.item
+
+    def peek(self) -> dict:
+        if not self.size:
+            raise IndexError(f"peek from empty review queue {self.name}")
+        self._prune_head()
+        return self.buckets[self.heap[0]][0].item
+
+    def find(self, keys) -> ReviewEntry:
+        """
+        Returns the pending entry indexed under any of `keys`, or None.
+        """
+        for key in keys:
+            entry = self.by_key.get(key)
+            if entry is not None:
+                return entry
+        return None
+
+    def update(self, entry: ReviewEntry) -> ReviewEntry:
+        """
+        Re-indexes and re-prioritizes a pending entry after its item was changed in place. The entry keeps its id
+        and age, so it stays ahead of reports enqueued after it within its priority.
+
+        Returns:
+            ReviewEntry: The entry now holding the item.
+        """
+        updated = self._new_entry(entry.entry_id, entry.item, entry.enqueued_at)
+        if updated.priority == entry.priority:
+            # Same bucket, same position; only the lookup keys may have changed
+            self._unindex(entry)
+            entry.keys = updated.keys
+            self._index(entry)
+            updated = entry
+        else:
+            self._discard(entry)
+            self._push_entry(updated)
+        if self.store is not None:
+            self.store.log_push(self.name, updated)
+        return updated
+
+    def remove(self, entry: ReviewEntry) -> bool:
+        """
+        Removes a pending entry without it counting as reviewed.
+
+        Returns:
+            bool: False if the entry was no longer pending.
+        """
+        if self.entries.get(entry.entry_id) is not entry:
+            return False
+        self._discard(entry)
+        if self.store is not None:
+            self.store.log_pop(self.name, entry.entry_id)
+        return True
+
+    def __len__(self):
+        return self.size
+
+    def __bool__(self):
+        return self.size > 0
+
+    def __iter__(self):
+        # In review order; intended for inspection, not for the hot path
+        for priority in sorted(self.buckets):
+            for entry in self.buckets[priority]:
+                if not entry.removed:
+                    yield entry.item
+
+    def oldest_wait(self) -> float:
+        if not self.size:
+            return 0.0
+        now = time.time()
+        return max(now - next((entry.enqueued_at for entry in bucket if not entry.removed), now)
+                   for bucket in self.buckets.values())
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "depth": self.size,
+            "depth_by_priority": {priority: depth for priority, depth in
+                                  ((priority, sum(not entry.removed for entry in bucket)) for priority, bucket in sorted(self.buckets.items()))
+                                  if depth},
+            "oldest_wait": self.oldest_wait(),
+            "reviewed": self.popped,
+            "mean_wait": self.total_wait / self.popped if self.popped else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+    def _new_entry(self, entry_id: int, item: dict, enqueued_at: float) -> ReviewEntry:
+        keys = tuple(self.key_fn(item)) if self.key_fn is not None else ()
+        return ReviewEntry(entry_id, item, self.priority_fn(item), enqueued_at, keys)
+
+    def _push_entry(self, entry: ReviewEntry):
+        bucket = self.buckets.get(entry.priority)
+        if bucket is None:
+            bucket = self.buckets[entry.priority] = deque()
+            heapq.heappush(self.heap, entry.priority)
+        bucket.append(entry)
+        self._index(entry)
+        self.size += 1
+
+    def _pop_entry(self) -> ReviewEntry:
+        if not self.size:
+            raise IndexError(f"pop from empty review queue {self.name}")
+        self._prune_head()
+        priority = self.heap[0]
+        bucket = self.buckets[priority]
+        entry = bucket.popleft()
+        if not bucket:
+            heapq.heappop(self.heap)
+            del self.buckets[priority]
+        self._discard(entry)
+        return entry
+
+    def _prune_head(self):
+        # Drops removed entries sitting at the head of the most urgent buckets
+        while self.heap:
+            bucket = self.buckets[self.heap[0]]
+            while bucket and bucket[0].removed:
+                bucket.popleft()
+            if bucket:
+                return
+            del self.buckets[heapq.heappop(self.heap)]
+
+    def _index(self, entry: ReviewEntry):
+        self.entries[entry.entry_id] = entry
+        for key in entry.keys:
+            self.by_key[key] = entry
+
+    def _unindex(self, entry: ReviewEntry):
+        del self.entries[entry.entry_id]
+        for key in entry.keys:
+            if self.by_key.get(key) is entry:
+                del self.by_key[key]
+
+    def _discard(self, entry: ReviewEntry):
+        # `_prune_head` drops the entry from its bucket once it reaches the head
+        self._unindex(entry)
+        entry.removed = True
+        self.size -= 1
+
@@ -0,0 +1,183 @@
+import logging
+import math
+import sys
+import time
+from collections import OrderedDict
+from enum import Enum
+from typing import Callable
+
+logger = logging.getLogger('modbot.sessions')
+
+_PRIMITIVES = (str, bytes, int, float, bool, type(None))
+
+
+def approximate_size(obj, seen: set = None) -> int:
+    """
+    Approximate memory footprint of a session in bytes: the object itself plus the containers and primitives it
+    references. Other objects (the client, enum members, ...) are shared between sessions and not counted.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen or isinstance(obj, Enum):
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, _PRIMITIVES):
+        return sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(approximate_size(key, seen) + approximate_size(value, seen)
+                                        for key, value in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(approximate_size(value, seen) for value in obj)
+
+    slots = getattr(type(obj), "__slots__", None)
+    if slots is None:
+        return 0
+    return sys.getsizeof(obj) + sum(approximate_size(getattr(obj, name), seen)
+                                    for name in slots if name != "client" and hasattr(obj, name))
+
+
+class SessionRecord:
+    __slots__ = ("session", "deadline")
+
+    def __init__(self, session, deadline: int):
+        self.session = session
+        self.deadline = deadline   # wheel tick at which the session expires
+
+
+class SessionStore:
+    """
+    Open report/review sessions by user id, for flows that users may abandon half-way.
+
+    Sessions idle for longer than `idle_timeout` are evicted by a timer wheel: one bucket per `tick` seconds, so
+    touching a session and sweeping expired ones are O(1) per session, however many are open. On top of that,
+    at most `max_sessions` are kept; the least recently used session is evicted to make room for a new one.
+    Supports the dict operations the bot relies on (`in`, `[]`, `pop`, `len`).
+    """
+
+    def __init__(self, kind: str, idle_timeout: float = 30 * 60, max_sessions: int = 10000, tick: float = 30.0,
+                 store=None, on_evict: Callable = None):
+        """
+        Args:
+            kind (str): "report" or "review". Identifies the sessions in the `store` log and in metrics.
+            idle_timeout (float): Seconds without a message after which a session is evicted.
+            max_sessions (int): Maximum number of open sessions.
+            tick (float): Resolution of the timer wheel in seconds; sessions expire up to one tick late.
+            store (QueueStore): Optional write-ahead log; sessions saved with `save()` are deleted from it when
+                                they are popped or evicted.
+            on_evict (Callable): Called as `on_evict(user_id, session, reason)` when a session is evicted,
+                                 with reason "idle" or "capacity".
+        """
+        self.kind = kind
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.tick = tick
+        self.store = store
+        self.on_evict = on_evict
+
+        self.timeout_ticks = math.ceil(idle_timeout / tick) + 1   # +1 so no session expires before `idle_timeout`
+        self.sessions = OrderedDict()                             # user id -> SessionRecord, least recently used first
+        self.wheel = [set() for _ in range(self.timeout_ticks + 1)]
+        self.current_tick = self._tick_at(time.monotonic())
+
+        self.evicted = {"idle": 0, "capacity": 0}
+
+    def __contains__(self, user_id) -> bool:
+        return user_id in self.sessions
+
+    def __getitem__(self, user_id):
+        record = self.sessions[user_id]
+        self._touch(user_id, record)
+        return record.session
+
+    def __setitem__(self, user_id, session):
+        record = self.sessions.get(user_id)
+        if record is not None:
+            record.session = session
+            self._touch(user_id, record)
+            return
+
+        record = SessionRecord(session, self.current_tick)
+        self.sessions[user_id] = record
+        self.wheel[record.deadline % len(self.wheel)].add(user_id)
+        self._touch(user_id, record)
+        while len(self.sessions) > self.max_sessions:
+            self._evict(next(iter(self.sessions)), "capacity")
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def pop(self, user_id, default=None):
+        """
+        Removes a finished session, without calling `on_evict`.
+        """
+        record = self.sessions.pop(user_id, None)
+        if record is None:
+            return default
+        self.wheel[record.deadline % len(self.wheel)].discard(user_id)
+        if self.store is not None:
+            self.store.delete_session(self.kind, user_id)
+        return record.session
+
+    __delitem__ = pop
+
+    def save(self, user_id):
+        """
+        Journals the session's current state to the `store` log.
+        """
+        if self.store is not None:
+            self.store.save_session(self.kind, user_id, self.sessions[user_id].session.to_dict())
+
+    def expire(self, now: float = None) -> int:
+        """
+        Advances the timer wheel to `now` and evicts the sessions that have been idle for too long.
+        Call every `tick` seconds.
+
+        Returns:
+            int: Number of sessions evicted.
+        """
+        target = self._tick_at(time.monotonic() if now is None else now)
+        # After a long pause every bucket is due; visiting each once is enough
+        self.current_tick = max(self.current_tick, target - len(self.wheel))
+        evicted = 0
+        while self.current_tick < target:
+            self.current_tick += 1
+            bucket = self.wheel[self.current_tick % len(self.wheel)]
+            for user_id in [user_id for user_id in bucket if self.sessions[user_id].deadline <= self.current_tick]:
+                self._evict(user_id, "idle")
+                evicted += 1
+        return evicted
+
+    def memory_bytes(self) -> int:
+        # Walks every session; meant for scrape-time metrics, not the hot path
+        return sum(approximate_size(record) for record in self.sessions.values())
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "open": len(self.sessions),
+            "memory_bytes": self.memory_bytes(),
+            "evicted_idle": self.evicted["idle"],
+            "evicted_capacity": self.evicted["capacity"],
+        }
+
+    def _touch(self, user_id, record: SessionRecord):
+        self.sessions.move_to_end(user_id)
+        deadline = self._tick_at(time.monotonic()) + self.timeout_ticks
+        if deadline != record.deadline:
+            self.wheel[record.deadline % len(self.wheel)].discard(user_id)
+            self.wheel[deadline % len(self.wheel)].add(user_id)
+            record.deadline = deadline
+
+    def _evict(self, user_id, reason: str):
+        session = self.pop(user_id)
+        self.evicted[reason] += 1
+        logger.info("Evicted %s session of user %s (%s)", self.kind, user_id, reason)
+        if self.on_evict is not None:
+            try:
+                self.on_evict(user_id, session, reason)
+            except Exception:
+                logger.exception("Eviction callback failed for %s session of user %s", self.kind, user_id)
+
+    def _tick_at(self, now: float) -> int:
+        return int(now // self.tick)
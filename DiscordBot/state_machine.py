@@ -0,0 +1,81 @@
+import inspect
+from typing import Any, Callable, Mapping
+
+INVALID = object()   # returned by a validator to reject the input
+
+
+class Step:
+    """
+    One row of a transition table: how a session in a given state handles the next message.
+
+    The validator turns the message content into a value (or `INVALID`), the action produces the handler's
+    result from that value, and the session then moves to `next_state`, which may depend on the value.
+    """
+    __slots__ = ("action", "validator", "on_invalid", "next_state")
+
+    def __init__(self, action: Callable, validator: Callable = None, on_invalid: Callable = None, next_state=None):
+        """
+        Args:
+            action (Callable): Called as `action(session, value, message)`; may be a coroutine function.
+            validator (Callable): Maps the message content to a value, or `INVALID`. Without one, the value is the content.
+            on_invalid (Callable): Called as `on_invalid(session, content)` when the validator rejects the input.
+                                   The session stays in its state.
+            next_state: State to move to after the action, a mapping from validated value to state, or None to
+                        leave the state as the action set it.
+        """
+        self.action = action
+        self.validator = validator
+        self.on_invalid = on_invalid
+        self.next_state = next_state
+
+
+def choice(options: Mapping[str, Any], normalize: Callable[[str], str] = None) -> Callable:
+    """
+    Validator accepting the keys of `options` (after `normalize`) and returning the mapped value.
+    """
+    lookup = options.get
+    if normalize is None:
+        return lambda content: lookup(content, INVALID)
+    return lambda content: lookup(normalize(content), INVALID)
+
+
+def normalized(content: str) -> str:
+    return content.strip().lower()
+
+
+class FlowEngine:
+    """
+    Dispatches a message to the `Step` registered for the session's current state: a single dict lookup,
+    whatever the number of states. The tables are built once per flow and shared by all sessions.
+    """
+
+    def __init__(self, steps: Mapping[Any, Step], default: Callable):
+        """
+        Args:
+            steps (Mapping[Any, Step]): Step per state. The session object must expose a `state` attribute.
+            default (Callable): Called as `default(session)` for states without a step.
+        """
+        self.steps = dict(steps)
+        self.default = default
+
+    async def dispatch(self, session, message):
+        step = self.steps.get(session.state)
+        if step is None:
+            return self.default(session)
+
+        value = message.content
+        if step.validator is not None:
+            value = step.validator(value)
+            if value is INVALID:
+                return step.on_invalid(session, message.content)
+
+        result = step.action(session, value, message)
+        if inspect.isawaitable(result):
+            result = await result
+
+        next_state = step.next_state
+        if isinstance(next_state, dict):
+            next_state = next_state.get(value)
+        if next_state is not None:
+            session.state = next_state
+        return result
@@ -0,0 +1,82 @@
+import pytest
+
+import admission_control
+from admission_control import AdmissionController, AdmissionDecision, BackpressurePolicy
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(admission_control.time, "monotonic", clock)
+    return clock
+
+
+def test_repeat_within_window_is_duplicate(clock):
+    admission = AdmissionController(dedup_window=60.0)
+    assert admission.admit(1, 2, "Join us") == AdmissionDecision.ADMIT
+    clock.now += 10
+    assert admission.admit(1, 2, "join   US") == AdmissionDecision.DUPLICATE
+    assert admission.stats()["duplicates"] == 1
+
+
+def test_dedup_window_does_not_slide_on_repeats(clock):
+    admission = AdmissionController(user_rate_per_minute=600, user_burst=100, dedup_window=60.0)
+    assert admission.admit(1, 2, "spam") == AdmissionDecision.ADMIT
+    clock.now += 30
+    assert admission.admit(1, 2, "spam") == AdmissionDecision.DUPLICATE
+    clock.now += 30
+    # 60s after the first sighting, even though the last repeat was only 30s ago
+    assert admission.admit(1, 2, "spam") == AdmissionDecision.ADMIT
+    clock.now += 30
+    assert admission.admit(1, 2, "spam") == AdmissionDecision.DUPLICATE
+
+
+def test_same_text_from_other_author_is_not_duplicate(clock):
+    admission = AdmissionController()
+    assert admission.admit(1, 2, "hello") == AdmissionDecision.ADMIT
+    assert admission.admit(1, 3, "hello") == AdmissionDecision.ADMIT
+
+
+@pytest.mark.parametrize("policy, decision", [
+    (BackpressurePolicy.LOCAL_ONLY, AdmissionDecision.LOCAL_ONLY),
+    (BackpressurePolicy.DEFER, AdmissionDecision.DEFER),
+])
+def test_user_over_limit_follows_policy(clock, policy, decision):
+    admission = AdmissionController(user_rate_per_minute=1, user_burst=2, policy=policy)
+    assert admission.admit(1, 2, "a") == AdmissionDecision.ADMIT
+    assert admission.admit(1, 2, "b") == AdmissionDecision.ADMIT
+    assert admission.admit(1, 2, "c") == decision
+    assert admission.stats()["user_limited"] == 1
+
+
+def test_limited_user_does_not_drain_guild_budget(clock):
+    admission = AdmissionController(user_rate_per_minute=1, user_burst=1, guild_rate_per_minute=1, guild_burst=2)
+    assert admission.admit(1, 2, "a") == AdmissionDecision.ADMIT
+    assert admission.admit(1, 2, "b") == AdmissionDecision.LOCAL_ONLY
+    assert admission.admit(1, 3, "c") == AdmissionDecision.ADMIT
+
+
+def test_buckets_refill_over_time(clock):
+    admission = AdmissionController(user_rate_per_minute=60, user_burst=1)
+    assert admission.admit(1, 2, "a") == AdmissionDecision.ADMIT
+    assert admission.admit(1, 2, "b") == AdmissionDecision.LOCAL_ONLY
+    clock.now += 1
+    assert admission.admit(1, 2, "c") == AdmissionDecision.ADMIT
+
+
+def test_sample_policy_skips_unsampled_messages(clock, monkeypatch):
+    monkeypatch.setattr(admission_control.random, "random", lambda: 0.5)
+    admission = AdmissionController(user_rate_per_minute=1, user_burst=1, policy=BackpressurePolicy.SAMPLE,
+                                    sample_rate=0.1)
+    assert admission.admit(1, 2, "a") == AdmissionDecision.ADMIT
+    assert admission.admit(1, 2, "b") == AdmissionDecision.SKIP
+    assert admission.stats()["skipped"] == 1
@@ -0,0 +1,56 @@
+import pytest
+
+from entity_matcher import EntityMatcher, is_valid_organization_name
+from queue_store import QueueStore
+
+
+@pytest.mark.parametrize("name", ["is", "the group", "our team", "1234", "ab c", "  "])
+def test_rejects_short_or_common_names(name):
+    assert not is_valid_organization_name(name)
+
+
+@pytest.mark.parametrize("name", ["ISIS", "al-nusra front", "Sons of the Caliphate", "Atomwaffen"])
+def test_accepts_specific_names(name):
+    assert is_valid_organization_name(name)
+
+
+def test_matches_on_word_boundaries_only():
+    matcher = EntityMatcher(phrases=[])
+    matcher.add("atomwaffen")
+    assert [match["entity"] for match in matcher.scan("Join Atomwaffen today")] == ["atomwaffen"]
+    assert matcher.scan("notatomwaffenx") == []
+
+
+def test_default_phrases_are_matched():
+    matches = EntityMatcher().scan("brothers, answer the call and join the fight")
+    assert [match["entity"] for match in matches] == ["answer the call", "join the fight"]
+    assert {match["kind"] for match in matches} == {"phrase"}
+
+
+def test_patterns_added_after_a_scan_are_found():
+    matcher = EntityMatcher(phrases=["holy war"])
+    matcher.scan("warm up")
+    assert matcher.add("war party")
+    assert not matcher.add("War  Party")
+    assert [match["entity"] for match in matcher.scan("a holy war party")] == ["holy war", "war party"]
+
+
+def test_confirmed_names_survive_a_restart(tmp_path):
+    path = str(tmp_path / "queue.wal")
+    store = QueueStore(path)
+    store.load()
+    store.log_entity("atomwaffen", "organization")
+    store._write_batch(store._take_buffer())
+
+    assert QueueStore(path).load()["entities"] == {"atomwaffen": "organization"}
+
+
+@pytest.mark.parametrize("text", ["join  our   cause", "JOIN\tour\ncause", "  join our \r\n cause now"])
+def test_whitespace_runs_do_not_evade_matching(text):
+    assert "join our cause" in [match["entity"] for match in EntityMatcher().scan(text)]
+
+
+def test_match_start_is_an_offset_in_the_original_text():
+    text = "lol   ok,\n\n join  our   cause"
+    (match,) = EntityMatcher().scan(text)
+    assert text[match["start"]:].startswith("join")
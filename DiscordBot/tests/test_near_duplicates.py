@@ -0,0 +1,116 @@
+import time
+
+import pytest
+
+import near_duplicates
+from llm_prompt.verdict import Verdict
+from near_duplicates import NearDuplicateIndex
+
+POST = ("Brothers, the caliphate needs fighters. Message me to learn how you can travel and join our ranks this summer. "
+        "We cover the tickets, the housing and the training, and your family will be looked after while you serve.")
+VARIANT = POST.replace("this summer", "this summer!!")
+UNRELATED = "Does anyone have the notes from Tuesday's lecture on distributed systems? I missed the second half."
+
+
+@pytest.fixture
+def index():
+    return NearDuplicateIndex()
+
+
+def test_empty_message_has_no_signature(index):
+    assert index.signature("   ") is None
+    assert index.add(1, None) is None
+    assert index.find(None) is None
+
+
+def test_signature_ignores_case_and_spacing(index):
+    assert index.signature(POST) == index.signature("  " + POST.upper().replace(" ", "  "))
+
+
+def test_light_edit_is_found_with_its_verdict(index):
+    verdict = Verdict(True, "propaganda", 0.9)
+    index.add(1, index.signature(POST), verdict)
+    match = index.find(index.signature(VARIANT))
+    assert match is not None
+    assert match.entry.key == 1
+    assert match.entry.verdict is verdict
+    assert match.similarity >= index.threshold
+    assert index.stats()["matches"] == 1
+
+
+def test_unrelated_message_is_not_matched(index):
+    index.add(1, index.signature(POST))
+    assert index.find(index.signature(UNRELATED)) is None
+
+
+def test_variants_join_the_group_of_the_first_message(index):
+    assert index.add(1, index.signature(POST)) == 1
+    assert index.add(2, index.signature(VARIANT)) == 1
+    assert index.add(3, index.signature(UNRELATED)) == 3
+
+
+def test_entry_without_verdict_does_not_hand_one_out(index):
+    # e.g. a message the pre-filter or the local fallback classified
+    index.add(1, index.signature(POST), None)
+    assert index.find(index.signature(VARIANT)).entry.verdict is None
+
+    verdict = Verdict(False, "invalid")
+    index.add(1, index.signature(POST), verdict)
+    assert index.find(index.signature(VARIANT)).entry.verdict is verdict
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(near_duplicates.time, "monotonic", lambda: now[0])
+    index = NearDuplicateIndex(ttl=60.0)
+    index.add(1, index.signature(POST))
+    now[0] += 61
+    assert index.find(index.signature(VARIANT)) is None
+    assert len(index) == 0
+    assert not any(index.buckets)
+
+
+def test_oldest_entries_are_evicted_beyond_capacity():
+    index = NearDuplicateIndex(max_entries=2)
+    for key, text in enumerate((POST, UNRELATED, "A completely different third message about the weekend football")):
+        index.add(key, index.signature(text))
+    assert len(index) == 2
+    assert 0 not in index.entries
+    assert index.find(index.signature(VARIANT)) is None
+
+
+def test_bands_must_divide_bins():
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(num_bins=64, bands=10)
+
+
+def test_flood_of_variants_stays_cheap(index):
+    start = time.perf_counter()
+    for key in range(5000):
+        assert index.add(key, index.signature(POST if key % 2 else VARIANT)) == 0
+    assert time.perf_counter() - start < 2.0
+    # Only the first message of the group is bucketed, so a lookup compares against it alone
+    checked = index.candidates_checked
+    assert index.find(index.signature(VARIANT)).entry.key == 0
+    assert index.candidates_checked - checked == 1
+
+
+def test_verdict_of_a_variant_is_kept_on_its_group(index):
+    index.add(1, index.signature(POST))
+    verdict = Verdict(True, "propaganda", 0.9)
+    index.add(2, index.signature(VARIANT), verdict)
+    assert index.find(index.signature(POST)).entry.verdict is verdict
+
+
+def test_candidates_per_bucket_are_capped():
+    def candidates_checked(max_candidates):
+        # Distinct groups (threshold 1.0) that share most of their buckets
+        index = NearDuplicateIndex(max_candidates=max_candidates, threshold=1.0)
+        for key in range(50):
+            index.add(key, index.signature(f"{key} " + POST))
+        checked = index.candidates_checked
+        index.find(index.signature("x " + POST))
+        return index.candidates_checked - checked
+
+    assert candidates_checked(1) < candidates_checked(1000)
+    assert candidates_checked(1) <= NearDuplicateIndex().bands
@@ -0,0 +1,54 @@
+import time
+
+import pytest
+
+from prefilter import PreFilter, PreFilterDecision
+
+
+@pytest.fixture
+def prefilter():
+    return PreFilter()
+
+
+@pytest.mark.parametrize("text", [
+    "We strike the mall at noon",
+    "Blow them all up tomorrow",
+    "Death to America. Allahu akbar.",
+])
+def test_short_threats_reach_the_llm(prefilter, text):
+    assert prefilter.assess(text) == PreFilterDecision.ESCALATE
+
+
+@pytest.mark.parametrize("text", ["lol ok", "thanks!", "  ", "haha gg"])
+def test_chit_chat_is_short_circuited(prefilter, text):
+    assert prefilter.assess(text) == PreFilterDecision.BENIGN
+
+
+def test_lexicon_hit_escalates_and_is_counted(prefilter):
+    assert prefilter.assess("ok join us brothers") == PreFilterDecision.ESCALATE
+    assert prefilter.stats()["lexicon_hits"] == 1
+
+
+def test_stats_count_decisions(prefilter):
+    prefilter.assess("hi")
+    prefilter.assess("meet me by the station")
+    stats = prefilter.stats()
+    assert (stats["assessed"], stats["short_circuited"], stats["escalated"]) == (2, 1, 1)
+    assert stats["escalation_rate"] == 0.5
+
+
+def test_is_suspicious_uses_lexicon(prefilter):
+    assert prefilter.is_suspicious("they are recruiting for the caliphate")
+    assert not prefilter.is_suspicious("see you at practice")
+
+
+@pytest.mark.parametrize("text", ["k" * 30 + "z", "lol " * 21 + "what do you think", "ha" * 5000 + "!", "k" * 100000])
+def test_pathological_input_is_assessed_quickly(prefilter, text):
+    start = time.perf_counter()
+    prefilter.assess(text)
+    assert time.perf_counter() - start < 0.1
+
+
+@pytest.mark.parametrize("text", ["kkk", "hahaaa", "hehe", "thank you!!", "ok ok ok"])
+def test_laughter_and_repeats_are_chit_chat(prefilter, text):
+    assert prefilter.is_chit_chat(text)
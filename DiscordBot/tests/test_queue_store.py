@@ -0,0 +1,130 @@
+import asyncio
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import queue_store
+from queue_store import QueueStore
+from review_queue import ReviewQueue
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "queues.jsonl")
+
+
+def reopen(path: str) -> dict:
+    return QueueStore(path).load()
+
+
+def test_replay_restores_queues_sessions_and_entities(path):
+    store = QueueStore(path)
+    store.load()
+    queue = ReviewQueue("User reports", store=store)
+    first = queue.append({"message_id": 1, "category": "threat"})
+    queue.append({"message_id": 2, "category": "other"})
+    queue.pop()
+    store.save_session("report", 7, {"state": "AWAITING_LOOP"})
+    store.save_session("review", 8, {"state": "REVIEW_START"})
+    store.delete_session("review", 8)
+    store.log_entity("atomwaffen", "organization")
+    asyncio.run(store.close())
+
+    saved = reopen(path)
+    assert [item for _, _, item in saved["queues"]["User reports"]] == [{"message_id": 2, "category": "other"}]
+    assert first.entry_id not in [entry_id for entry_id, _, _ in saved["queues"]["User reports"]]
+    assert saved["sessions"] == {("report", 7): {"state": "AWAITING_LOOP"}}
+    assert saved["entities"] == {"atomwaffen": "organization"}
+
+
+def test_load_compacts_a_log_of_mostly_dead_records(path):
+    store = QueueStore(path, compact_min_records=10)
+    store.load()
+    for entry_id in range(20):
+        store.log_push("q", SimpleNamespace(entry_id=entry_id, enqueued_at=0.0, item={"n": entry_id}))
+        if entry_id != 19:
+            store.log_pop("q", entry_id)
+    asyncio.run(store.close())
+
+    reopened = QueueStore(path, compact_min_records=10)
+    saved = reopened.load()
+    assert [item for _, _, item in saved["queues"]["q"]] == [{"n": 19}]
+    with open(path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 1
+    assert reopened.log_records == 1
+
+
+def test_flush_compacts_once_due(path):
+    async def run():
+        store = QueueStore(path, compact_min_records=4, compact_ratio=2.0)
+        store.load()
+        store.log_entity("atomwaffen", "organization")
+        for _ in range(5):
+            store.save_session("report", 1, {"state": "x"})
+        await store.flush()
+        store.log_entity("the base", "organization")
+        await store.close()
+
+    asyncio.run(run())
+    with open(path, encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    assert len(lines) == 3
+    assert reopen(path)["entities"] == {"atomwaffen": "organization", "the base": "organization"}
+
+
+def test_torn_final_record_is_dropped_and_appends_continue(path):
+    store = QueueStore(path)
+    store.load()
+    store.log_entity("atomwaffen", "organization")
+    asyncio.run(store.close())
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"op": "entity", "name": "the ba')   # crash in the middle of a write
+
+    store = QueueStore(path)
+    assert store.load()["entities"] == {"atomwaffen": "organization"}
+    store.log_entity("the base", "organization")
+    asyncio.run(store.close())
+    assert reopen(path)["entities"] == {"atomwaffen": "organization", "the base": "organization"}
+
+
+def test_failed_write_keeps_the_batch_for_the_next_flush(path, monkeypatch):
+    store = QueueStore(path)
+    store.load()
+    store.log_entity("atomwaffen", "organization")
+
+    real_fsync = os.fsync
+    def failing_fsync(fd):
+        raise OSError("disk full")
+    monkeypatch.setattr(queue_store.os, "fsync", failing_fsync)
+    asyncio.run(store.flush())
+    # The partially written batch was cut off again and is still buffered
+    assert os.path.getsize(path) == 0
+    assert len(store.buffer) == 1
+
+    monkeypatch.setattr(queue_store.os, "fsync", real_fsync)
+    store.log_entity("the base", "organization")
+    asyncio.run(store.flush())
+    assert not store.buffer
+    assert reopen(path)["entities"] == {"atomwaffen": "organization", "the base": "organization"}
+
+
+def test_failed_compaction_keeps_the_old_log_and_the_buffer(path, monkeypatch):
+    store = QueueStore(path, compact_min_records=2, compact_ratio=1.5)
+    store.load()
+    store.save_session("report", 1, {"state": "a"})
+    store.save_session("report", 1, {"state": "b"})
+    store.save_session("report", 1, {"state": "c"})
+
+    def failing_snapshot(lines):
+        raise OSError("read-only file system")
+    monkeypatch.setattr(store, "_write_snapshot", failing_snapshot)
+    asyncio.run(store.flush())
+    assert len(store.buffer) == 3
+    assert store.log_records == 3
+
+    monkeypatch.undo()
+    asyncio.run(store.flush())
+    assert not store.buffer
+    assert reopen(path)["sessions"] == {("report", 1): {"state": "c"}}
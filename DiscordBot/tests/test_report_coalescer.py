@@ -0,0 +1,102 @@
+import pytest
+
+from report_coalescer import ReportCoalescer, report_keys
+from review_queue import ReviewQueue
+
+
+@pytest.fixture
+def queues():
+    return ReviewQueue("User reports", key_fn=report_keys), ReviewQueue("Automated reports", key_fn=report_keys)
+
+
+@pytest.fixture
+def coalescer(queues):
+    return ReportCoalescer(*queues)
+
+
+def user_report(reporter_id, message_id=10, context="they are recruiting", category="propaganda",
+                post_content="Join the cause"):
+    return dict(reporter_id=reporter_id, message_id=message_id, context=context, category=category,
+                post_content=post_content, urgent=False)
+
+
+def detection(message_id=10, post_content="Join the cause", confidence=0.9, author="suspect"):
+    return dict(message_id=message_id, post_content=post_content, confidence=confidence, author=author,
+                category="propaganda", threat_level="high", classified_by="Claude")
+
+
+def test_repeated_reports_by_one_user_count_once(coalescer, queues):
+    user_queue, _ = queues
+    coalescer.add_user_report(user_report(1))
+    coalescer.add_user_report(user_report(1, context="still recruiting"))
+    assert len(user_queue) == 1
+    item = user_queue.peek()
+    assert item["reporters"] == 1
+    assert item["contexts"] == ["they are recruiting", "still recruiting"]
+
+
+def test_distinct_reporters_are_counted(coalescer, queues):
+    user_queue, _ = queues
+    for reporter_id in (1, 2, 1, 3, 2):
+        coalescer.add_user_report(user_report(reporter_id))
+    assert len(user_queue) == 1
+    assert user_queue.peek()["reporters"] == 3
+    assert coalescer.stats()["merged_user"] == 4
+
+
+def test_reports_of_different_posts_are_kept_apart(coalescer, queues):
+    user_queue, _ = queues
+    coalescer.add_user_report(user_report(1, message_id=10))
+    coalescer.add_user_report(user_report(2, message_id=11, post_content="Something else"))
+    assert len(user_queue) == 2
+
+
+def test_merge_keeps_most_severe_category(coalescer, queues):
+    user_queue, _ = queues
+    coalescer.add_user_report(user_report(1, category="propaganda"))
+    coalescer.add_user_report(user_report(2, category="threat"))
+    assert user_queue.peek()["category"] == "threat"
+
+
+def test_detections_of_the_same_content_are_merged(coalescer, queues):
+    _, automated_queue = queues
+    coalescer.add_automated_report(detection(message_id=10, author="a"))
+    coalescer.add_automated_report(detection(message_id=11, author="b", confidence=0.95))
+    assert len(automated_queue) == 1
+    item = automated_queue.peek()
+    assert item["occurrences"] == 2
+    assert item["authors"] == ["a", "b"]
+    assert item["message_ids"] == [10, 11]
+    assert item["confidence"] == 0.95
+
+
+def test_user_report_absorbs_pending_detection(coalescer, queues):
+    user_queue, automated_queue = queues
+    coalescer.add_automated_report(detection())
+    coalescer.add_user_report(user_report(1))
+    assert len(automated_queue) == 0
+    assert user_queue.peek()["automated_detection"]["occurrences"] == 1
+    coalescer.add_automated_report(detection(message_id=12))
+    assert len(automated_queue) == 0
+    assert user_queue.peek()["automated_detection"]["occurrences"] == 2
+
+
+def test_review_queue_find_update_remove():
+    queue = ReviewQueue("User reports", key_fn=report_keys)
+    low = queue.append({"message_id": 1, "category": "other"})
+    high = queue.append({"message_id": 2, "category": "propaganda"})
+    assert queue.find([("message", 1)]) is low
+    assert queue.peek()["message_id"] == 2
+
+    # Re-prioritized in place, keeping its id
+    low.item["urgent"] = True
+    updated = queue.update(low)
+    assert updated.entry_id == low.entry_id
+    assert queue.find([("message", 1)]) is updated
+    assert queue.peek()["message_id"] == 1
+
+    assert queue.remove(updated)
+    assert not queue.remove(updated)
+    assert queue.find([("message", 1)]) is None
+    assert len(queue) == 1
+    assert queue.pop() is high.item
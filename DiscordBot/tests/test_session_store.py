@@ -0,0 +1,119 @@
+import pytest
+
+import session_store
+from queue_store import QueueStore
+from session_store import SessionStore, approximate_size
+
+
+class FakeSession:
+    __slots__ = ("state", "client", "output")
+
+    def __init__(self, state="start"):
+        self.state = state
+        self.client = object()
+        self.output = {"context": "some context", "message_ids": [1, 2, 3]}
+
+    def to_dict(self):
+        return {"state": self.state, "output": self.output}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(session_store.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_idle_sessions_expire(clock):
+    evicted = []
+    sessions = SessionStore("report", idle_timeout=60, tick=10, on_evict=lambda *args: evicted.append(args))
+    sessions[1] = FakeSession()
+    sessions[2] = FakeSession()
+
+    clock[0] += 40
+    sessions[2]   # touching a session pushes its deadline back
+    assert sessions.expire() == 0
+
+    clock[0] += 40
+    assert sessions.expire() == 1
+    assert 1 not in sessions and 2 in sessions
+    assert evicted[0][0] == 1 and evicted[0][2] == "idle"
+
+    clock[0] += 80
+    assert sessions.expire() == 1
+    assert len(sessions) == 0
+    assert sessions.stats()["evicted_idle"] == 2
+
+
+def test_no_session_expires_before_idle_timeout(clock):
+    sessions = SessionStore("report", idle_timeout=60, tick=10)
+    clock[0] += 9.9   # just before a tick boundary
+    sessions[1] = FakeSession()
+    clock[0] += 59
+    assert sessions.expire() == 0
+    assert 1 in sessions
+
+
+def test_expire_after_long_pause(clock):
+    sessions = SessionStore("report", idle_timeout=60, tick=10)
+    sessions[1] = FakeSession()
+    clock[0] += 100000
+    assert sessions.expire() == 1
+
+
+def test_least_recently_used_session_is_evicted_at_capacity(clock):
+    evicted = []
+    sessions = SessionStore("review", max_sessions=2, on_evict=lambda user_id, session, reason: evicted.append((user_id, reason)))
+    sessions[1] = FakeSession()
+    sessions[2] = FakeSession()
+    sessions[1]
+    sessions[3] = FakeSession()
+    assert evicted == [(2, "capacity")]
+    assert len(sessions) == 2 and 1 in sessions and 3 in sessions
+
+
+def test_pop_does_not_call_on_evict(clock):
+    evicted = []
+    sessions = SessionStore("report", on_evict=lambda *args: evicted.append(args))
+    session = FakeSession()
+    sessions[1] = session
+    assert sessions.pop(1) is session
+    assert sessions.pop(1, "gone") == "gone"
+    assert evicted == []
+
+
+def test_failing_eviction_callback_is_contained(clock):
+    def on_evict(user_id, session, reason):
+        raise RuntimeError("boom")
+
+    sessions = SessionStore("report", max_sessions=1, on_evict=on_evict)
+    sessions[1] = FakeSession()
+    sessions[2] = FakeSession()
+    assert 2 in sessions and 1 not in sessions
+
+
+def test_saved_sessions_are_journaled_and_deleted(clock, tmp_path):
+    path = str(tmp_path / "queues.jsonl")
+    store = QueueStore(path)
+    store.load()
+    sessions = SessionStore("report", store=store)
+    sessions[1] = FakeSession("awaiting context")
+    sessions[2] = FakeSession("awaiting loop")
+    sessions.save(1)
+    sessions.save(2)
+    sessions.pop(2)
+    store._write_batch(store._take_buffer())
+
+    saved = QueueStore(path).load()["sessions"]
+    assert saved == {("report", 1): {"state": "awaiting context", "output": FakeSession().output}}
+
+
+def test_approximate_size_skips_client_and_shared_objects():
+    session = FakeSession()
+    size = approximate_size(session)
+    assert size > 0
+    session.client = list(range(10000))   # shared, never counted
+    assert approximate_size(session) == size
+
+    session.output["context"] = "x" * 10000
+    assert approximate_size(session) >= size + 9000
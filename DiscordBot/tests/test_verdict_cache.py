@@ -0,0 +1,73 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from llm_prompt.verdict_cache import VerdictCache, normalize_text
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "verdicts.db")
+
+
+def test_normalized_reposts_share_an_entry():
+    cache = VerdictCache()
+    cache.put("Join  US", "fp", "yes propaganda")
+    assert cache.get("join us", "fp") == "yes propaganda"
+    assert cache.get("join us", "other fingerprint") is None
+    assert normalize_text("  A\tb\nC ") == "a b c"
+
+
+def test_without_start_writes_through(db_path):
+    cache = VerdictCache(db_path=db_path)
+    cache.put("hello", "fp", "no invalid")
+    assert not cache.pending
+    assert VerdictCache(db_path=db_path).get("hello", "fp") == "no invalid"
+
+
+def test_started_cache_batches_writes_off_the_event_loop(db_path):
+    async def run():
+        cache = VerdictCache(db_path=db_path, flush_interval=0.01)
+        cache.start()
+        cache.put("hello", "fp", "no invalid")
+        cache.put("bye", "fp", "no invalid")
+        # Nothing is written by `put()` itself
+        assert len(cache.pending) == 2
+        assert VerdictCache(db_path=db_path).get("hello", "fp") is None
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if not cache.pending:
+                break
+        assert VerdictCache(db_path=db_path).get("bye", "fp") == "no invalid"
+        cache.close()
+
+    asyncio.run(run())
+
+
+def test_close_writes_buffered_verdicts(db_path):
+    async def run():
+        cache = VerdictCache(db_path=db_path, flush_interval=60)
+        cache.start()
+        cache.put("hello", "fp", "yes threat")
+        cache.close()
+
+    asyncio.run(run())
+    assert VerdictCache(db_path=db_path).get("hello", "fp") == "yes threat"
+
+
+def test_failed_flush_keeps_verdicts_for_the_next_one(db_path):
+    cache = VerdictCache(db_path=db_path)
+    cache.flush_task = object()   # as if started, so `put()` only buffers
+    cache.put("hello", "fp", "yes threat")
+    cache.db.execute("DROP TABLE verdicts")
+    with pytest.raises(sqlite3.Error):
+        cache.flush()
+    assert list(cache.pending.values())[0][0] == "yes threat"
+
+    cache.db.execute("CREATE TABLE verdicts (key TEXT PRIMARY KEY, verdict TEXT NOT NULL, created_at REAL NOT NULL)")
+    cache.flush()
+    assert not cache.pending
+    cache.flush_task = None
+    cache.close()
+    assert VerdictCache(db_path=db_path).get("hello", "fp") == "yes threat"
@@ -0,0 +1,151 @@
+'''
+Bulk evaluation through the Message Batches API.
+
+Offline datasets don't need interactive latency, so instead of one `messages.create` call per example the
+whole dataset is submitted as asynchronous batch jobs, polled until they end, and the results are fed into
+`ModelInference.compute_results()`. Batched requests are billed at a discount and don't count against the
+interactive rate limits.
+'''
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(ROOT_DIR)   # append the root to path
+sys.path.append(os.path.join(ROOT_DIR, "DiscordBot"))   # the shared `llm_prompt` modules live next to the bot
+
+from typing import Iterable, List, Mapping, Tuple
+from llm_prompt.prompt_claude import build_request_params, DEFAULT_MODEL, DEFAULT_TEMPERATURE
+from llm_prompt.verdict import VERDICT_MAX_TOKENS, VERDICT_STOP_SEQUENCES
+from llm_prompt.dataset_evaluation.process_dataset import Category, Example
+from llm_prompt.dataset_evaluation.evaluate_model import ModelInference
+from llm_prompt.dataset_evaluation.fake_client import FakeAnthropicClient
+
+MAX_REQUESTS_PER_BATCH = 100000   # API limit per batch job
+
+
+class BatchEvaluator:
+
+    def __init__(self, inference: ModelInference, poll_interval: float = 60.0, timeout: float = 24 * 60 * 60,
+                 max_requests_per_batch: int = MAX_REQUESTS_PER_BATCH):
+        """
+        Args:
+            inference (ModelInference): Provides the client, prompts, response parsing and `compute_results()`.
+            poll_interval (float): Seconds between status checks of a submitted batch.
+            timeout (float): Seconds to wait for a batch before giving up. Batches expire server-side after 24h.
+            max_requests_per_batch (int): Larger datasets are split into several batch jobs.
+        """
+        self.inference = inference
+        self.client = inference.client
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.max_requests_per_batch = max_requests_per_batch
+        self.unparsable = 0   # succeeded requests whose completion could not be parsed into a verdict
+
+    def build_requests(self, examples: List[Example], offset: int = 0) -> List[Mapping]:
+        return [
+            {
+                "custom_id": f"example-{offset + i}",
+                "params": build_request_params(self.inference.moderator_context, example.message,
+                                               self.inference.classification_prep, DEFAULT_MODEL, DEFAULT_TEMPERATURE,
+                                               max_tokens=VERDICT_MAX_TOKENS, stop_sequences=VERDICT_STOP_SEQUENCES),
+            }
+            for i, example in enumerate(examples)
+        ]
+
+    def submit(self, examples: Iterable[Example], true_labels: List[Tuple[bool, Category]]) -> List[str]:
+        """
+        Submits the examples as one or more batch jobs, streaming them so at most one batch of messages
+        is held in memory.
+
+        Args:
+            examples (Iterable[Example]): Examples to evaluate, e.g. from `DataProcessor.iter_file()`.
+            true_labels (List[Tuple[bool, Category]]): Filled with the (flagged, category) label of each example, in order.
+
+        Returns:
+            List[str]: Ids of the submitted batches.
+        """
+        batch_ids = []
+        chunk = []
+        offset = 0
+        for example in examples:
+            true_labels.append((example.flagged, example.category))
+            chunk.append(example)
+            if len(chunk) == self.max_requests_per_batch:
+                batch_ids.append(self.client.messages.batches.create(requests=self.build_requests(chunk, offset=offset)).id)
+                offset += len(chunk)
+                chunk = []
+        if chunk:
+            batch_ids.append(self.client.messages.batches.create(requests=self.build_requests(chunk, offset=offset)).id)
+        return batch_ids
+
+    def wait(self, batch_id: str):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            batch = self.client.messages.batches.retrieve(batch_id)
+            if batch.processing_status == "ended":
+                return batch
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Batch {batch_id} did not finish within {self.timeout} seconds.")
+            time.sleep(self.poll_interval)
+
+    def collect(self, batch_id: str) -> Mapping[int, Tuple[bool, Category]]:
+        """
+        Returns:
+            Mapping[int, Tuple[bool, Category]]: Prediction per example index. Errored, canceled and expired
+                                                 requests, and completions that can't be parsed (counted in
+                                                 `unparsable`), are missing from the mapping.
+        """
+        predictions = {}
+        for response in self.client.messages.batches.results(batch_id):
+            if response.result.type != "succeeded":
+                continue
+            index = int(response.custom_id.rsplit("-", 1)[-1])
+            # One malformed completion must not throw away the rest of a batch that has already been paid for
+            try:
+                predictions[index] = self.inference.parse_response(response.result.message.content[0].text)
+            except (ValueError, IndexError):
+                self.unparsable += 1
+        return predictions
+
+    def evaluate_file(self, data_path: str):
+        """
+        Evaluates a whole dataset through the Message Batches API.
+
+        Examples whose request did not succeed, or whose completion could not be parsed, are left out of the
+        scores and reported on stdout.
+        """
+        true_labels = []
+        predictions = {}
+        self.unparsable = 0
+        for batch_id in self.submit(self.inference.processor.iter_file(data_path), true_labels):
+            self.wait(batch_id)
+            predictions.update(self.collect(batch_id))
+
+        failed = len(true_labels) - len(predictions) - self.unparsable
+        if failed:
+            print(f"{failed} of {len(true_labels)} requests did not succeed and are excluded from the results.")
+        if self.unparsable:
+            print(f"{self.unparsable} of {len(true_labels)} responses could not be parsed and are excluded from the results.")
+
+        scored = sorted(predictions)
+        return self.inference.compute_results(
+            true_labels=[true_labels[i][0] for i in scored],
+            pred_labels=[predictions[i][0] for i in scored],
+            true_categories=[true_labels[i][1] for i in scored],
+            pred_categories=[predictions[i][1] for i in scored],
+        )
+
+
+def main():
+
+    # Runs fully offline against the fake client; pass `start_client()` instead to use the real API
+    inference = ModelInference(FakeAnthropicClient())
+    evaluator = BatchEvaluator(inference, poll_interval=0.1)
+
+    sample_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data", "sample.txt")
+    print(evaluator.evaluate_file(sample_path))
+
+
+if __name__ == "__main__":
+    main()
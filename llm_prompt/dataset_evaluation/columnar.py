@@ -0,0 +1,196 @@
+'''
+Compact, memory-mappable columnar format for labelled moderation examples.
+
+The space-separated text format read by `DataProcessor` has to be split and parsed line by line, and a message
+that happens to end in e.g. "yes threat" is ambiguous. This format stores each column separately:
+
+    header      magic b"MODX", uint32 version, uint64 number of examples (n)
+    offsets     (n + 1) x uint64, byte offsets of each message inside the message blob
+    flags       ceil(n / 8) bytes, bit i set if example i is flagged
+    categories  n x uint8, index into `CATEGORY_CODES` (255 if unknown)
+    messages    UTF-8 message blob
+
+All integers are little-endian. Loading a dataset only maps the file; messages are decoded on access.
+'''
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+
+from array import array
+from typing import Iterable, Iterator
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(ROOT_DIR)   # append the root to path
+sys.path.append(os.path.join(ROOT_DIR, "DiscordBot"))   # the shared `llm_prompt` modules live next to the bot
+
+from llm_prompt.dataset_evaluation.process_dataset import Category, DataProcessor, Example
+
+COLUMNAR_SUFFIX = ".modx"
+MAGIC = b"MODX"
+VERSION = 1
+HEADER = struct.Struct("<4sIQ")
+UNKNOWN_CATEGORY = 255
+
+CATEGORY_CODES = list(Category)   # append-only: codes are stored on disk
+CATEGORY_TO_CODE = {category: code for code, category in enumerate(CATEGORY_CODES)}
+
+if sys.byteorder != "little":
+    raise ImportError("The columnar dataset format is only supported on little-endian machines.")
+
+
+class ExampleView:
+    """
+    Read-only view of one row of a `ColumnarDataset`, with the same attributes as `Example`.
+    """
+    __slots__ = ("dataset", "index")
+
+    def __init__(self, dataset: "ColumnarDataset", index: int):
+        self.dataset = dataset
+        self.index = index
+
+    @property
+    def message(self) -> str:
+        return self.dataset.message(self.index)
+
+    @property
+    def flagged(self) -> bool:
+        return self.dataset.flagged(self.index)
+
+    @property
+    def category(self) -> Category:
+        return self.dataset.category(self.index)
+
+    def __len__(self):
+        return len(self.message)
+
+
+class ColumnarDataset:
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, mode="rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a columnar dataset.")
+        if version != VERSION:
+            raise ValueError(f"Unsupported columnar dataset version {version} in {path}.")
+
+        self.count = count
+        view = memoryview(self.map)
+        offsets_start = HEADER.size
+        flags_start = offsets_start + 8 * (count + 1)
+        categories_start = flags_start + (count + 7) // 8
+        messages_start = categories_start + count
+
+        self.offsets = view[offsets_start: flags_start].cast("Q")
+        self.flags = view[flags_start: categories_start]
+        self.categories = view[categories_start: messages_start]
+        self.messages = view[messages_start:]
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index: int) -> ExampleView:
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(f"Example index {index} out of range.")
+        return ExampleView(self, index)
+
+    def __iter__(self) -> Iterator[ExampleView]:
+        return self.iter_examples()
+
+    def iter_examples(self, shard_index: int = 0, num_shards: int = 1) -> Iterator[ExampleView]:
+        for index in range(shard_index, self.count, num_shards):
+            yield ExampleView(self, index)
+
+    def message(self, index: int) -> str:
+        return str(self.messages[self.offsets[index]: self.offsets[index + 1]], "utf-8")
+
+    def flagged(self, index: int) -> bool:
+        return bool(self.flags[index >> 3] & (1 << (index & 7)))
+
+    def category(self, index: int) -> Category:
+        code = self.categories[index]
+        return CATEGORY_CODES[code] if code != UNKNOWN_CATEGORY else None
+
+    def close(self):
+        # Views must be released before the map can be closed
+        for view in (self.offsets, self.flags, self.categories, self.messages):
+            view.release()
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_columnar(examples: Iterable[Example], out_path: str):
+    """
+    Writes examples to `out_path` in the columnar format. Messages are streamed to a temporary file,
+    so only the fixed-size columns (~10 bytes per example) are kept in memory.
+    """
+    offsets = array("Q", [0])
+    flags = bytearray()
+    categories = bytearray()
+
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+    with tempfile.TemporaryFile(dir=out_dir) as blob:
+        count = 0
+        for example in examples:
+            encoded = example.message.encode("utf-8")
+            blob.write(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+
+            if count % 8 == 0:
+                flags.append(0)
+            if example.flagged:
+                flags[-1] |= 1 << (count % 8)
+            categories.append(CATEGORY_TO_CODE.get(example.category, UNKNOWN_CATEGORY))
+            count += 1
+
+        with open(out_path, mode="wb") as out:
+            out.write(HEADER.pack(MAGIC, VERSION, count))
+            offsets.tofile(out)
+            out.write(flags)
+            out.write(categories)
+            blob.seek(0)
+            shutil.copyfileobj(blob, out)
+
+
+def convert_text_to_columnar(text_path: str, out_path: str = None, processor: DataProcessor = None) -> str:
+    """
+    Converts a dataset in the `DataProcessor` text format (optionally gzip/zstd compressed) to the columnar format.
+
+    Returns:
+        str: Path of the written columnar file. Defaults to `text_path` with its extensions replaced by `.modx`.
+    """
+    if out_path is None:
+        directory, name = os.path.split(text_path)
+        out_path = os.path.join(directory, name.split(".")[0] + COLUMNAR_SUFFIX)
+    processor = processor or DataProcessor()
+    write_columnar(processor.iter_file(text_path), out_path)
+    return out_path
+
+
+def main():
+
+    if len(sys.argv) not in (2, 3):
+        print(f"Usage: python {os.path.basename(__file__)} <dataset.txt> [<dataset.modx>]")
+        sys.exit(1)
+
+    out_path = convert_text_to_columnar(*sys.argv[1:])
+    with ColumnarDataset(out_path) as dataset:
+        print(f"Wrote {len(dataset)} examples to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,13 +7,23 @@ import os
 import sys 
 import anthropic 
 
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))   # append the root to path
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(ROOT_DIR)   # append the root to path
+sys.path.append(os.path.join(ROOT_DIR, "DiscordBot"))   # the shared `llm_prompt` modules live next to the bot
 
 from enum import Enum
 from typing import List, Tuple, Mapping
-from src.claude_trials import prompt_claude, start_client
-from src.constants import * 
-from src.dataset_eval.process_dataset import Category, DataProcessor, Example
+from llm_prompt.prompt_claude import cached_prompt_claude, start_client, DEFAULT_MODEL, DEFAULT_TEMPERATURE
+from llm_prompt.verdict_cache import VerdictCache, prompt_fingerprint
+from llm_prompt.verdict import parse_verdict, VERDICT_MAX_TOKENS, VERDICT_STOP_SEQUENCES
+from llm_prompt.model_cascade import ModelCascade, ModelTier, FAST_MODEL
+from llm_prompt.constants import * 
+from llm_prompt.dataset_evaluation.process_dataset import Category, DataProcessor, Example
+from llm_prompt.dataset_evaluation.rate_limit import TokenBucket, retry_with_backoff
+from llm_prompt.dataset_evaluation.journal import ResultJournal
 from sklearn.metrics import f1_score, confusion_matrix
 
 ABUSE_TYPE_TO_CATEGORY = {
@@ -27,14 +37,21 @@ ABUSE_TYPE_TO_CATEGORY = {
 
 class ModelInference:
 
-    def __init__(self, client: anthropic.Anthropic):
-        self.client = client
+    def __init__(self, client: anthropic.Anthropic = None, cache: VerdictCache = None):
+        """
+        Args:
+            client (Anthropic): The client object to access Claude through. Defaults to the shared, connection-pooled
+                                client from `start_client()`.
+            cache (VerdictCache): Optional verdict cache shared across runs, so repeated messages are only inferred once.
+        """
+        self.client = client if client is not None else start_client()
+        self.cache = cache
         self.processor = DataProcessor()
         self.moderator_context = DEFAULT_MOD_CONTEXT  # can be changed via `custom_args` in `infer_from_text()`
         self.classification_prep = DEFAULT_CLASSIFICATION_PREP  # ^
 
 
-    def infer_from_text(self, message: str, custom_args: Mapping = {}) -> Tuple[bool, Category]:
+    def infer_from_text(self, message: str, custom_args: Mapping = {}, client: anthropic.Anthropic = None) -> Tuple[bool, Category]:
         """
         Prompts claude to infer on the message. By default, this function asks Claude 
         to determine whether the message is related to terrorist recruitment activity
@@ -44,30 +61,33 @@ class ModelInference:
             message (str): Message to be reviewed by LLM
             custom_args (Mapping): Dictionary of args that can be used to prompt Claude with custom prompting context, etc.
 
-                see `src.claude_trials.prompt_claude()` for which args can be provided as custom args.
+                see `llm_prompt.prompt_claude.prompt_claude()` for which args can be provided as custom args.
+            client (Anthropic): Overrides `self.client` for this call, e.g. with different retry settings.
         """
         # TODO add custom prompting for Claude
 
         # For now, we use the default prompt
-        result = prompt_claude(
+        response_str = cached_prompt_claude(
             moderator_context=self.moderator_context,
             input_message=message,
             prompt_prepend=self.classification_prep,
-            client=self.client
+            client=client if client is not None else self.client,
+            cache=self.cache,
+            max_tokens=VERDICT_MAX_TOKENS,
+            stop_sequences=VERDICT_STOP_SEQUENCES
         )
 
-        response_str = result.content[0].text
-
-        # Convert result into an example object
-        response_split = response_str.split(" ")
-        pred, category = response_split[0], response_split[1]
-
-        pred_bool = True if pred == "yes" else False
-        category = ABUSE_TYPE_TO_CATEGORY.get(category, None)
+        return self.parse_response(response_str)
 
-        assert category is not None, f"Expected to find category type, but instead got {category}."
+    def parse_response(self, response_str: str) -> Tuple[bool, Category]:
+        """
+        Converts a `<yes/no> <category>` model response into a prediction.
+        """
+        verdict = parse_verdict(response_str)
+        if verdict is None:
+            raise ValueError(f"Expected a `<yes/no> <category>` response, but instead got {response_str!r}.")
 
-        return pred_bool, category
+        return verdict.flagged, ABUSE_TYPE_TO_CATEGORY[verdict.category]
     
     def compute_results(self, true_labels: List[bool], pred_labels: List[bool], true_categories: List[Example], pred_categories: List[Example]):
         """
@@ -92,10 +112,48 @@ class ModelInference:
 
 
 
-    def evaluate_file(self, data_path: str, custom_args: Mapping = {}) -> float:
+    def open_journal(self, journal_path: str) -> ResultJournal:
+        """
+        Opens the prediction journal for the current prompt/model configuration. Returns None if no path is given.
+        """
+        if journal_path is None:
+            return None
+        fingerprint = prompt_fingerprint(self.moderator_context, self.classification_prep, DEFAULT_MODEL, DEFAULT_TEMPERATURE)
+        return ResultJournal(journal_path, fingerprint)
+
+    def results_from_journal(self, journal_path: str):
+        """
+        Recomputes `compute_results()` from a prediction journal alone, without calling the model.
+        """
+        return self.compute_results(**self.open_journal(journal_path).labels())
+
+    def infer_journaled(self, index: int, example: Example, journal: ResultJournal, infer_fn) -> Tuple[bool, Category]:
+        """
+        Returns the journaled prediction for `example`, the `index`-th row of the dataset, if there is one,
+        otherwise calls `infer_fn()` and journals its result.
+        """
+        if journal is not None:
+            journaled = journal.get(index, example)
+            if journaled is not None:
+                return journaled
+
+        pred, category = infer_fn()
+        if journal is not None:
+            journal.record(index, example, pred, category)
+        return pred, category
 
-        # Load file data
-        file_examples = self.processor.process_file(data_path)
+    def evaluate_file(self, data_path: str, custom_args: Mapping = {}, journal_path: str = None) -> float:
+        """
+        Args:
+            data_path (str): Path to the dataset, see `DataProcessor.process_file()`.
+            custom_args (Mapping): See `infer_from_text()`.
+            journal_path (str): Optional JSONL journal. Examples already in the journal are not inferred on again,
+                                so a crashed run can be resumed. See `journal.py`.
+        """
+
+        # Stream file data, so inference starts right away and memory doesn't grow with the dataset
+        file_examples = self.processor.iter_file(data_path)
+        journal = self.open_journal(journal_path)
         
         true_labels, label_preds = [], []
         true_categories, category_preds = [], []
@@ -104,9 +162,11 @@ class ModelInference:
             message = example.message
             true_label = example.flagged
             true_category = example.category
-            pred, category = self.infer_from_text(
-                                                  message, 
-                                                  custom_args=custom_args
+            pred, category = self.infer_journaled(
+                                                  i,
+                                                  example,
+                                                  journal,
+                                                  lambda: self.infer_from_text(message, custom_args=custom_args)
                                                   )
             
             # Compute general stats
@@ -124,13 +184,138 @@ class ModelInference:
 
         return labels_f1, categories_f1, labels_cm, categories_cm
 
-    
+    def evaluate_file_concurrent(self, data_path: str, max_concurrency: int = 8, requests_per_minute: float = 50,
+                                 tokens_per_minute: float = 40000, max_retries: int = 5, custom_args: Mapping = {},
+                                 journal_path: str = None):
+        """
+        Same as `evaluate_file()`, but infers on up to `max_concurrency` examples at a time while staying
+        under the API rate limits. Predictions are collected in dataset order, so the F1 scores and
+        confusion matrices match a serial run.
+
+        Args:
+            data_path (str): Path to the dataset, see `DataProcessor.process_file()`.
+            max_concurrency (int): Maximum number of requests in flight.
+            requests_per_minute (float): Client-side cap on requests per minute.
+            tokens_per_minute (float): Client-side cap on (estimated) input tokens per minute.
+            max_retries (int): Retries per example on 429/5xx/connection errors, with exponential backoff.
+            custom_args (Mapping): See `infer_from_text()`.
+            journal_path (str): Optional JSONL journal to resume from and record into, see `evaluate_file()`.
+        """
+        file_examples = self.processor.iter_file(data_path)
+        journal = self.open_journal(journal_path)
+
+        # `retry_with_backoff()` is the only retry layer here, so every attempt takes a token from the buckets;
+        # SDK retries underneath it would bypass the rate limits and multiply the attempts per example
+        client = self.client.with_options(max_retries=0)
+        request_bucket = TokenBucket(requests_per_minute)
+        token_bucket = TokenBucket(tokens_per_minute)
+        prompt_chars = len(self.moderator_context) + len(self.classification_prep)
+
+        def infer(index: int, example: Example) -> Tuple[bool, Category]:
+            def attempt():
+                request_bucket.acquire()
+                token_bucket.acquire((prompt_chars + len(example.message)) / 4)   # ~4 characters per token
+                return self.infer_from_text(example.message, custom_args=custom_args, client=client)
+            return self.infer_journaled(index, example, journal, lambda: retry_with_backoff(attempt, max_retries=max_retries))
+
+        true_labels, label_preds = [], []
+        true_categories, category_preds = [], []
+
+        def collect(example: Example, future):
+            pred, category = future.result()
+            label_preds.append(pred)
+            category_preds.append(category)
+            true_labels.append(example.flagged)
+            true_categories.append(example.category)
+
+        # Only keep a bounded window of examples in flight and collect them in submission order,
+        # so the dataset is streamed rather than loaded up front
+        in_flight = deque()
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            for index, example in enumerate(file_examples):
+                in_flight.append((example, executor.submit(infer, index, example)))
+                if len(in_flight) >= 2 * max_concurrency:
+                    collect(*in_flight.popleft())
+            while in_flight:
+                collect(*in_flight.popleft())
+
+        return self.compute_results(
+            true_labels=true_labels,
+            pred_labels=label_preds,
+            true_categories=true_categories,
+            pred_categories=category_preds,
+        )
+
+    def evaluate_cascades(self, data_path: str, cascades: Mapping[str, ModelCascade] = None) -> Mapping[str, Mapping]:
+        """
+        Evaluates each model cascade configuration on the same dataset, so accuracy can be weighed against cost.
+
+        Args:
+            data_path (str): Path to the dataset, see `DataProcessor.process_file()`.
+            cascades (Mapping[str, ModelCascade]): Configurations to compare, by name. Defaults to `default_cascade_configs()`.
+
+        Returns:
+            Mapping[str, Mapping]: Per configuration: labels/categories F1, label accuracy, total cost in USD,
+                                   escalation rate, unparseable verdicts and per-tier stats (calls, latency, tokens, cost).
+        """
+        cascades = cascades if cascades is not None else default_cascade_configs()
+
+        results = {}
+        for name, cascade in cascades.items():
+            cascade.reset()
+            true_labels, label_preds = [], []
+            true_categories, category_preds = [], []
+            unparseable = 0
+            for example in self.processor.iter_file(data_path):
+                verdict = cascade.classify(self.moderator_context, example.message, self.classification_prep, self.client)
+                if verdict is None:
+                    unparseable += 1
+                    pred, category = False, Category.INVALID
+                else:
+                    pred, category = verdict.flagged, ABUSE_TYPE_TO_CATEGORY[verdict.category]
+
+                label_preds.append(pred)
+                category_preds.append(category)
+                true_labels.append(example.flagged)
+                true_categories.append(example.category)
+
+            labels_f1, categories_f1, _, _ = self.compute_results(
+                true_labels=true_labels,
+                pred_labels=label_preds,
+                true_categories=true_categories,
+                pred_categories=category_preds,
+            )
+            correct = sum(true == pred for true, pred in zip(true_labels, label_preds))
+            stats = cascade.stats()
+            results[name] = {
+                "labels_f1": labels_f1,
+                "categories_f1": categories_f1,
+                "accuracy": correct / len(true_labels) if true_labels else 0.0,
+                "cost": stats["cost"],
+                "escalation_rate": stats["escalation_rate"],
+                "unparseable": unparseable,
+                "tiers": stats["tiers"],
+            }
+        return results
+
+
+def default_cascade_configs() -> Mapping[str, ModelCascade]:
+    """
+    The single-model baselines next to the fast-then-large cascade at a few escalation thresholds.
+    """
+    configs = {
+        "fast only": ModelCascade([ModelTier(FAST_MODEL)]),
+        "large only": ModelCascade([ModelTier(DEFAULT_MODEL)]),
+    }
+    for threshold in (0.6, 0.8, 0.95):
+        configs[f"fast > large @ {threshold}"] = ModelCascade([ModelTier(FAST_MODEL), ModelTier(DEFAULT_MODEL)],
+                                                              escalation_threshold=threshold)
+    return configs
 
 
 def main():
 
-    client = start_client()
-    inference = ModelInference(client)
+    inference = ModelInference()
 
     sample_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data", "sample.txt")
     inference.evaluate_file(sample_path)
@@ -0,0 +1,110 @@
+'''
+Offline stand-in for `anthropic.Anthropic`, so evaluation code (including the Message Batches mode in
+`batch_mode.py`) can be exercised without network access or API credits.
+
+Only the parts of the client used by this project are implemented: `messages.create` and
+`messages.batches.create/retrieve/results`. Responses come from a `responder` function mapping the
+prompt text to a `<yes/no> <category>` answer; the default one is a small keyword heuristic.
+'''
+import itertools
+
+from types import SimpleNamespace
+from typing import Callable, List, Mapping
+
+THREAT_KEYWORDS = {
+    "threat": ["bomb", "attack", "shoot", "carnage", "kill"],
+    "graphic": ["behead", "beheaded", "execution", "blood"],
+    "logistical": ["funding", "organize", "meet at", "travel to", "trip to"],
+    "propaganda": ["holy war", "caliphate", "martyr", "infidel"],
+}
+
+
+def keyword_responder(prompt_text: str) -> str:
+    # Only look at the message itself, not the few-shot examples in the prompt
+    message = prompt_text.rsplit("\n", 1)[-1].lower() if "\n" in prompt_text else prompt_text.lower()
+    for category, keywords in THREAT_KEYWORDS.items():
+        if any(keyword in message for keyword in keywords):
+            return f"yes {category}"
+    return "no invalid"
+
+
+def _prompt_text(params: Mapping) -> str:
+    return "".join(block["text"] for block in params["messages"][-1]["content"] if block.get("type") == "text")
+
+
+def _message(params: Mapping, text: str):
+    return SimpleNamespace(
+        type="message",
+        role="assistant",
+        model=params.get("model"),
+        content=[SimpleNamespace(type="text", text=text)],
+        stop_reason="end_turn",
+        usage=SimpleNamespace(input_tokens=len(_prompt_text(params)) // 4, output_tokens=len(text.split())),
+    )
+
+
+class FakeBatches:
+
+    def __init__(self, responder: Callable[[str], str], polls_until_done: int):
+        self.responder = responder
+        self.polls_until_done = polls_until_done
+        self.batches = {}   # batch id -> {"requests", "polls"}
+        self.ids = itertools.count(1)
+
+    def create(self, requests: List[Mapping]):
+        batch_id = f"msgbatch_fake_{next(self.ids)}"
+        self.batches[batch_id] = {"requests": list(requests), "polls": 0}
+        return self.retrieve(batch_id, count_poll=False)
+
+    def retrieve(self, batch_id: str, count_poll: bool = True):
+        batch = self.batches[batch_id]
+        if count_poll:
+            batch["polls"] += 1
+        ended = batch["polls"] >= self.polls_until_done
+        num_requests = len(batch["requests"])
+        return SimpleNamespace(
+            id=batch_id,
+            type="message_batch",
+            processing_status="ended" if ended else "in_progress",
+            request_counts=SimpleNamespace(
+                processing=0 if ended else num_requests,
+                succeeded=num_requests if ended else 0,
+                errored=0,
+                canceled=0,
+                expired=0,
+            ),
+        )
+
+    def results(self, batch_id: str):
+        for request in self.batches[batch_id]["requests"]:
+            params = request["params"]
+            text = self.responder(_prompt_text(params))
+            yield SimpleNamespace(
+                custom_id=request["custom_id"],
+                result=SimpleNamespace(type="succeeded", message=_message(params, text)),
+            )
+
+
+class FakeMessages:
+
+    def __init__(self, responder: Callable[[str], str], polls_until_done: int):
+        self.responder = responder
+        self.batches = FakeBatches(responder, polls_until_done)
+
+    def create(self, **params):
+        return _message(params, self.responder(_prompt_text(params)))
+
+
+class FakeAnthropicClient:
+
+    def __init__(self, responder: Callable[[str], str] = keyword_responder, polls_until_done: int = 2):
+        """
+        Args:
+            responder (Callable[[str], str]): Maps the user prompt text to the model's answer.
+            polls_until_done (int): Number of `batches.retrieve` calls before a batch reports it has ended.
+        """
+        self.messages = FakeMessages(responder, polls_until_done)
+
+    def with_options(self, **options):
+        # Mirrors `Anthropic.with_options()`; retries and timeouts mean nothing offline
+        return self
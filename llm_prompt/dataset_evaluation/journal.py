@@ -0,0 +1,109 @@
+'''
+On-disk journal of evaluation predictions.
+
+Every prediction is appended to a JSONL file as soon as it is made, keyed by the example's row in the dataset,
+a hash of its content and the fingerprint of the prompt/model that produced it. Re-running an evaluation with the same journal only infers
+on examples that are missing, and results can be recomputed from the journal without calling the model.
+'''
+import hashlib
+import json
+import os
+import sys
+import threading
+
+from typing import List, Mapping, Tuple
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(ROOT_DIR)   # append the root to path
+sys.path.append(os.path.join(ROOT_DIR, "DiscordBot"))   # the shared `llm_prompt` modules live next to the bot
+
+from llm_prompt.dataset_evaluation.process_dataset import Category, Example
+
+
+def example_key(index: int, example: Example) -> str:
+    """
+    Keys an example by its row index as well as its content, so rows that repeat a message are scored and counted
+    separately, and a journal isn't reused for a dataset whose rows have since changed.
+    """
+    category = example.category.name if example.category is not None else ""
+    payload = f"{index}\x00{example.message}\x00{example.flagged}\x00{category}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultJournal:
+
+    def __init__(self, path: str, fingerprint: str):
+        """
+        Args:
+            path (str): Path of the JSONL journal. Created on first write.
+            fingerprint (str): Prompt/model fingerprint (see `prompt_fingerprint()`). Records written under a
+                               different fingerprint are ignored, so changing the prompt re-scores everything.
+        """
+        self.path = path
+        self.fingerprint = fingerprint
+        self.lock = threading.Lock()   # `evaluate_file_concurrent()` records from worker threads
+        self.records = {}   # example key -> record
+        self._load()
+
+    def get(self, index: int, example: Example) -> Tuple[bool, Category]:
+        """
+        Args:
+            index (int): Row of `example` in the dataset.
+
+        Returns:
+            Tuple[bool, Category]: The journaled prediction for this example, or None if it hasn't been scored yet.
+        """
+        record = self.records.get(example_key(index, example))
+        if record is None:
+            return None
+        return record["pred_label"], self._to_category(record["pred_category"])
+
+    def record(self, index: int, example: Example, pred_label: bool, pred_category: Category):
+        record = {
+            "key": example_key(index, example),
+            "fingerprint": self.fingerprint,
+            "index": index,
+            "message": example.message,
+            "true_label": example.flagged,
+            "true_category": example.category.name if example.category is not None else None,
+            "pred_label": pred_label,
+            "pred_category": pred_category.name if pred_category is not None else None,
+        }
+        line = json.dumps(record) + "\n"
+        with self.lock:
+            with open(self.path, mode="a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+            self.records[record["key"]] = record
+
+    def labels(self) -> Mapping[str, List]:
+        """
+        Returns the true and predicted labels/categories of every journaled example, in the format
+        expected by `ModelInference.compute_results()`, in dataset order.
+        """
+        records = sorted(self.records.values(), key=lambda record: record.get("index", 0))
+        return {
+            "true_labels": [record["true_label"] for record in records],
+            "pred_labels": [record["pred_label"] for record in records],
+            "true_categories": [self._to_category(record["true_category"]) for record in records],
+            "pred_categories": [self._to_category(record["pred_category"]) for record in records],
+        }
+
+    def __len__(self):
+        return len(self.records)
+
+    @staticmethod
+    def _to_category(name: str) -> Category:
+        return Category[name] if name is not None else None
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, mode="r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue   # partially written line from a crash
+                if record.get("fingerprint") == self.fingerprint:
+                    self.records[record["key"]] = record
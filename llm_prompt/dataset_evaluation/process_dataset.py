@@ -11,16 +11,20 @@ Dataset structure is expected to be:
 
 We want to extract these fields from each line and put them into custom data objects
 '''
+import gzip
+import io
 import os 
 import sys 
 import anthropic 
 
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))   # append the root to path
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(ROOT_DIR)   # append the root to path
+sys.path.append(os.path.join(ROOT_DIR, "DiscordBot"))   # the shared `llm_prompt` modules live next to the bot
 
 from enum import Enum
-from typing import List, Tuple, Mapping
-from src.claude_trials import prompt_claude, start_client
-from src.constants import * 
+from typing import Iterator, List, Tuple, Mapping
+from llm_prompt.prompt_claude import prompt_claude, start_client
+from llm_prompt.constants import * 
 
 class Category(Enum):
 
@@ -33,6 +37,7 @@ class Category(Enum):
 
 
 class Example:
+    __slots__ = ("message", "flagged", "category")
 
     def __init__(self, message: str, flagged: bool, category: Category):
         """
@@ -63,35 +68,78 @@ class DataProcessor:
             "invalid": Category.INVALID
         }   # model outputs to category typing conversion
 
-         
+
     def process_file(self, file_path: str) -> List[Example]:
         """
         Goes through input file and creates an `Example` instance for each line in the input.
-        """ 
-        
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"Expected to find file {file_path} but did not.")
-        
-        final_examples = []
-        with open(file_path, mode="r+", encoding="utf-8") as f:
-            for line in f.readlines():
-                line = line.strip()
-                split_line = line.split(" ")
 
-                flagged, category = split_line[-2], split_line[-1]
-                message = " ".join(split_line[: -2])
+        Loads the whole dataset into memory; prefer `iter_file()` for large datasets.
+        """ 
+        return list(self.iter_file(file_path))
 
-                flagged = True if flagged.lower() == "yes" else False
-                filtered_category = self.tag_to_category.get(category, None)
+    def iter_file(self, file_path: str, shard_index: int = 0, num_shards: int = 1, chunk_size: int = 1 << 20) -> Iterator[Example]:
+        """
+        Lazily yields an `Example` for each line in the input, so memory stays constant regardless of dataset size.
 
-                assert category is not None, f"Category did not match any of the possible types: {category}"
+        Files ending in `.gz` are decompressed with gzip and files ending in `.zst` with zstandard (optional dependency).
+        Files ending in `.modx` are read as columnar datasets, see `columnar.py`.
 
-                example = Example(message=message,
-                                  flagged=flagged,
-                                  category=filtered_category)
-                
-                final_examples.append(example)
-        return final_examples    
+        Args:
+            file_path (str): Path to the dataset.
+            shard_index (int): Index of the shard to yield, in [0, num_shards).
+            num_shards (int): Number of shards the dataset is split into. Line `i` belongs to shard `i % num_shards`,
+                              so several processes can evaluate disjoint parts of the same file.
+            chunk_size (int): Number of bytes read from disk at a time.
+        """
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"Expected to find file {file_path} but did not.")
+        if not 0 <= shard_index < num_shards:
+            raise ValueError(f"Expected shard index in [0, {num_shards}), got {shard_index}.")
+
+        if file_path.endswith(".modx"):
+            # Columnar datasets are memory-mapped; rows are decoded lazily by the yielded views.
+            # The map stays open for as long as any view references it.
+            from llm_prompt.dataset_evaluation.columnar import ColumnarDataset
+            yield from ColumnarDataset(file_path).iter_examples(shard_index, num_shards)
+            return
+
+        with self._open_text(file_path, chunk_size) as f:
+            for line_number, line in enumerate(f):
+                if line_number % num_shards != shard_index:
+                    continue
+                line = line.strip()
+                if not line:
+                    continue
+                yield self.parse_line(line)
+
+    def parse_line(self, line: str) -> Example:
+        split_line = line.split(" ")
+
+        flagged, category = split_line[-2], split_line[-1]
+        message = " ".join(split_line[: -2])
+
+        flagged = True if flagged.lower() == "yes" else False
+        filtered_category = self.tag_to_category.get(category, None)
+
+        assert category is not None, f"Category did not match any of the possible types: {category}"
+
+        return Example(message=message,
+                       flagged=flagged,
+                       category=filtered_category)
+
+    @staticmethod
+    def _open_text(file_path: str, chunk_size: int):
+        if file_path.endswith(".gz"):
+            return io.TextIOWrapper(io.BufferedReader(gzip.open(file_path, mode="rb"), buffer_size=chunk_size), encoding="utf-8")
+        if file_path.endswith(".zst"):
+            try:
+                import zstandard
+            except ImportError as e:
+                raise ImportError("Reading .zst datasets requires the zstandard package: pip install zstandard") from e
+            raw = open(file_path, mode="rb")
+            reader = zstandard.ZstdDecompressor().stream_reader(raw, read_size=chunk_size, closefd=True)
+            return io.TextIOWrapper(io.BufferedReader(reader, buffer_size=chunk_size), encoding="utf-8")
+        return open(file_path, mode="r", encoding="utf-8", buffering=chunk_size)
 
 
 def main():
@@ -0,0 +1,71 @@
+'''
+Client-side rate limiting and retries for bulk evaluation against the Claude API.
+'''
+import random
+import threading
+import time
+
+import anthropic
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Holds up to `capacity` tokens and refills at `rate_per_minute`.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        """
+        Args:
+            rate_per_minute (float): Sustained number of tokens (requests, LLM tokens, ...) allowed per minute.
+            capacity (float): Maximum burst size. Defaults to one minute worth of tokens.
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0):
+        """
+        Blocks until `amount` tokens are available and takes them. Requests larger than the bucket
+        are clamped to its capacity so they can't block forever.
+        """
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (anthropic.APIConnectionError, anthropic.APITimeoutError)):
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+
+def retry_with_backoff(fn, max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0):
+    """
+    Calls `fn()` and retries on rate limits (429), overload (529) and server/connection errors with
+    exponential backoff and full jitter. Non-retryable errors and the last failure are re-raised.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            delay = min(max_delay, base_delay * (2 ** attempt))
+            time.sleep(random.uniform(0, delay))